@@ -4,6 +4,8 @@ from app.db.database import SessionLocal
 
 
 def get_db() -> Generator:
+    # the session only checks out a connection on its first query, requests
+    # that never reach the DB don't touch the pool
     db = SessionLocal()
     try:
         yield db
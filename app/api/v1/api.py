@@ -1,9 +1,10 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import files, user
+from app.api.v1.endpoints import files, uploads, user
 
 api_router = APIRouter()
 api_router.include_router(files.router, prefix="/files", tags=["files"])
+api_router.include_router(uploads.router, prefix="/uploads", tags=["uploads"])
 api_router.include_router(user.router, prefix="/users", tags=["users"])
 
 
@@ -12,6 +13,10 @@ tags_metadata = [
         "name": "files",
         "description": "Upload and list files.",
     },
+    {
+        "name": "uploads",
+        "description": "Resumable chunked uploads.",
+    },
     {
         "name": "users",
         "description": "Operations with users",
@@ -0,0 +1,38 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import FileResponse
+
+from app import schemas
+from app.api.deps import get_db
+from app.services.file import FileService
+from app.utils.responses import file_download_response
+from app.utils.service_result import handle_result
+
+router = APIRouter()
+
+
+@router.get("/{path:path}", response_class=FileResponse, include_in_schema=False)
+async def get_signed_blob(
+    path: str,
+    expires: int = Query(...),
+    signature: str = Query(...),
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: get_db = Depends(),
+):
+    """
+    Serves the signed urls a download is redirected to with the signed-url
+    offload and the local storage, once their signature is checked.
+    Supports single byte ranges and conditional requests through ETag.
+    """
+    result = await FileService(db).get_signed_download(
+        path,
+        expires,
+        signature,
+        schemas.FileDownloadConditions(
+            range=range, if_range=if_range, if_none_match=if_none_match
+        ),
+    )
+    return file_download_response(handle_result(result), offload=False)
@@ -1,39 +1,172 @@
 import uuid
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    UploadFile,
+    File,
+    Header,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import FileResponse, StreamingResponse
 
 from app import schemas
 from app.api.deps import get_db
 from app.services.file import FileService
+from app.utils.responses import file_download_response
 from app.utils.service_result import handle_result
 
 router = APIRouter()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARCHIVE_MEDIA_TYPES = {"zip": "application/zip", "tar": "application/x-tar"}
 
-@router.post("/", response_model=schemas.FileCreated, status_code=201)
-async def upload_file(file: UploadFile = File(...), db: get_db = Depends()):
+
+@router.post("/", response_model=schemas.FileUploaded, status_code=201)
+async def upload_file(
+    file: UploadFile = File(...),
+    overwrite: bool = Query(False),
+    x_checksum_sha256: Optional[str] = Header(None),
+    db: get_db = Depends(),
+):
     """
     Uploads a file to the system.
+    Returns as soon as the content is stored, the post-upload hooks run in
+    the background meanwhile the file `status` is processing.
+    When the name is taken the existing file is returned as is, unless
+    `overwrite` is set: its content is replaced and its uri kept.
+    The file is rejected if it doesn't match `X-Checksum-Sha256` (hex or
+    base64), `Content-MD5` and `Digest` would be the ones of the whole
+    multipart body.
     """
-    result = await FileService(db).upload_file(file)
+    result = await FileService(db).upload_file(
+        file, overwrite, schemas.FileChecksums(checksum_sha256=x_checksum_sha256)
+    )
     return handle_result(result)
 
 
-@router.get("/", response_model=List[schemas.FileCreated])
-async def get_all_files(db: get_db = Depends()):
+@router.post("/batch", response_model=List[schemas.FileUploadOutcome])
+async def upload_files(files: List[UploadFile] = File(...), db: get_db = Depends()):
     """
-    Returns all files on the user space
+    Uploads several files in a single multipart request, one `files` part per
+    file. The outcome of every file is reported in the same order, a failed
+    file doesn't fail the others.
     """
-    result = await FileService(db).get_files()
+    result = await FileService(db).upload_files(files)
     return handle_result(result)
 
 
-@router.get("/{file_uuid}", response_class=FileResponse)
-async def get_file(file_uuid: uuid.UUID, db: get_db = Depends()):
+@router.post("/stream", response_model=schemas.FileUploaded, status_code=201)
+async def upload_file_stream(
+    request: Request,
+    name: str = Query(...),
+    overwrite: bool = Query(False),
+    content_length: Optional[int] = Header(None),
+    content_md5: Optional[str] = Header(None),
+    digest: Optional[str] = Header(None),
+    x_checksum_sha256: Optional[str] = Header(None),
+    db: get_db = Depends(),
+):
     """
-    Returns file for the given uuid identifier
+    Uploads the raw request body (application/octet-stream) as a file named
+    `name`. The body is written straight to disk as it arrives, skipping the
+    temporary copy done for multipart uploads. `overwrite` as in the
+    multipart upload.
+    The body is rejected if it doesn't match `Content-MD5`, `Digest`
+    (`md5` and `sha-256`) or `X-Checksum-Sha256`, checked in the same pass
+    that writes it.
     """
-    result = await FileService(db).get_file_uri(schemas.FileQuery(uri=file_uuid))
+    result = await FileService(db).upload_stream(
+        name,
+        request.stream(),
+        content_length,
+        overwrite,
+        schemas.FileChecksums(
+            content_md5=content_md5,
+            digest=digest,
+            checksum_sha256=x_checksum_sha256,
+        ),
+    )
     return handle_result(result)
+
+
+@router.get("/", response_model=List[schemas.FileCreated])
+async def get_all_files(
+    response: Response,
+    list_query: schemas.FileListQuery = Depends(),
+    accept: Optional[str] = Header(None),
+    db: get_db = Depends(),
+):
+    """
+    Returns the files on the user space, oldest first, `limit` at a time.
+    When there are more files the `X-Next-Cursor` response header holds the
+    `cursor` to send for the next page.
+
+    With `Accept: application/x-ndjson` every matching file is streamed
+    instead, one JSON object per line, and `limit` is ignored.
+    """
+    if NDJSON_MEDIA_TYPE in (accept or ""):
+        result = await FileService(db).stream_files(list_query)
+        return StreamingResponse(handle_result(result), media_type=NDJSON_MEDIA_TYPE)
+
+    result = await FileService(db).get_files(list_query)
+    page = handle_result(result)
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return page.files
+
+
+@router.post("/archive", response_class=StreamingResponse)
+async def get_archive(archive_query: schemas.FileArchiveQuery, db: get_db = Depends()):
+    """
+    Downloads many files as a single zip or tar archive, streamed while it's
+    built. Either the given `uris` or every file matching `filters`.
+    """
+    result = await FileService(db).get_archive(archive_query)
+    file_name = f"files.{archive_query.format}"
+    return StreamingResponse(
+        handle_result(result),
+        media_type=ARCHIVE_MEDIA_TYPES[archive_query.format],
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
+
+
+@router.get("/{file_uuid}", response_class=FileResponse)
+async def get_file(
+    file_uuid: uuid.UUID,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    db: get_db = Depends(),
+):
+    """
+    Returns file for the given uuid identifier.
+    Supports single byte ranges and conditional requests through ETag.
+    Files stored compressed are sent as they are with `Content-Encoding` when
+    the client accepts the encoding.
+    """
+    result = await FileService(db).get_file_uri(
+        schemas.FileQuery(uri=file_uuid),
+        schemas.FileDownloadConditions(
+            range=range,
+            if_range=if_range,
+            if_none_match=if_none_match,
+            accept_encoding=accept_encoding,
+        ),
+    )
+    return file_download_response(handle_result(result))
+
+
+@router.delete("/{file_uuid}", status_code=204, response_class=Response)
+async def delete_file(file_uuid: uuid.UUID, db: get_db = Depends()):
+    """
+    Deletes the file for the given uuid identifier. Its quota is given back
+    straight away, its content is removed from the storage in the background.
+    """
+    result = await FileService(db).delete_file(schemas.FileQuery(uri=file_uuid))
+    handle_result(result)
+    return Response(status_code=204)
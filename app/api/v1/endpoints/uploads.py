@@ -0,0 +1,67 @@
+import uuid
+
+from fastapi import APIRouter, Depends, Header, Request
+
+from app import schemas
+from app.api.deps import get_db
+from app.services.upload_session import UploadSessionService
+from app.utils.app_exceptions import AppException
+from app.utils.ranges import parse_content_range
+from app.utils.service_result import handle_result, ServiceResult
+
+router = APIRouter()
+
+
+@router.post("", response_model=schemas.UploadSession, status_code=201)
+async def create_upload_session(
+    session_create: schemas.UploadSessionCreate, db: get_db = Depends()
+):
+    """
+    Starts a resumable upload, chunks are sent afterwards with PUT
+    """
+    result = await UploadSessionService(db).create_session(session_create)
+    return handle_result(result)
+
+
+@router.get("/{session_id}", response_model=schemas.UploadSession)
+async def get_upload_session(session_id: uuid.UUID, db: get_db = Depends()):
+    """
+    Returns the byte ranges still missing for the upload
+    """
+    result = await UploadSessionService(db).get_session(session_id)
+    return handle_result(result)
+
+
+@router.put("/{session_id}", response_model=schemas.UploadSession)
+async def upload_chunk(
+    session_id: uuid.UUID,
+    request: Request,
+    content_range: str = Header(...),
+    db: get_db = Depends(),
+):
+    """
+    Uploads the raw bytes given on the `Content-Range: bytes start-end/size`
+    header. Chunks can be sent in any order and in parallel.
+    """
+    byte_range = parse_content_range(content_range)
+    if not byte_range:
+        return handle_result(
+            ServiceResult(AppException.InvalidByteRange(content_range))
+        )
+
+    start, end, total = byte_range
+    result = await UploadSessionService(db).write_chunk(
+        session_id, start, end, total, request.stream()
+    )
+    return handle_result(result)
+
+
+@router.post(
+    "/{session_id}/complete", response_model=schemas.FileUploaded, status_code=201
+)
+async def complete_upload_session(session_id: uuid.UUID, db: get_db = Depends()):
+    """
+    Validates size and checksum of the upload and creates the file
+    """
+    result = await UploadSessionService(db).complete_session(session_id)
+    return handle_result(result)
@@ -10,6 +10,8 @@ router = APIRouter()
 
 
 @router.post("", response_model=schemas.User)
-async def create_user(user: UserCreate, db: get_db = Depends()):
+def create_user(user: UserCreate, db: get_db = Depends()):
+    # plain def, FastAPI runs it on the threadpool so the DB work doesn't
+    # block the event loop
     result = UserService(db).create_user(user)
     return handle_result(result)
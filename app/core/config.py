@@ -34,6 +34,108 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
 
+    # connection pool per worker process. Connections older than RECYCLE are
+    # replaced on checkout, keep it below the idle timeouts of the server and
+    # anything in between. PRE_PING tests every connection on checkout
+    # instead, at the cost of a round trip
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30  # seconds waiting for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds
+    DB_POOL_PRE_PING: bool = False
+
+    # files of a batch upload written to the storage at the same time
+    BATCH_UPLOAD_CONCURRENCY: int = 4
+
+    # streaming buffers used to write uploads to disk, the actual size is
+    # picked between these bounds from the size of the upload
+    UPLOAD_MIN_BUFFER_SIZE: int = 1024 * 1024  # 1 MB
+    UPLOAD_MAX_BUFFER_SIZE: int = 8 * 1024 * 1024  # 8 MB
+
+    # download rate limiter backend: token_bucket and sliding_window keep the
+    # counters in process memory, postgres shares them between workers
+    DOWNLOAD_RATE_LIMITER: str = "token_bucket"
+
+    # blob storage: local (sharded directories) or s3 (any S3 compatible)
+    STORAGE_BACKEND: str = "local"
+    STORAGE_LOCAL_ROOT: str = "uploads/blobs/"
+    STORAGE_SHARD_DEPTH: int = 2
+    # what reaches the local disk before an upload is committed: none leaves
+    # it to the OS (a crash may lose blobs whose rows are committed), data
+    # fsyncs every blob before it's renamed to its key (no truncated blob is
+    # ever found under one) and full also fsyncs the directories after the
+    # rename, so the blob survives a crash once its row is committed.
+    # Uploads are staged in uploads/tmp/, keep it on the same filesystem as
+    # STORAGE_LOCAL_ROOT or the rename becomes a copy
+    STORAGE_DURABILITY: str = "data"
+    S3_BUCKET: Optional[str] = None
+    S3_ENDPOINT_URL: Optional[str] = None  # e.g. a MinIO server
+    S3_ACCESS_KEY_ID: Optional[str] = None
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    S3_REGION: Optional[str] = None
+    S3_PART_SIZE: int = 8 * 1024 * 1024  # 8 MB
+    # compression of the new blobs: none, gzip or zstd. Files that are already
+    # compressed or don't shrink below MIN_RATIO of their size are kept as is
+    STORAGE_COMPRESSION: str = "none"
+    STORAGE_COMPRESSION_MIN_RATIO: float = 0.9
+    STORAGE_COMPRESSION_WORKERS: int = 2
+
+    # download offload: none (served by the app), x-accel-redirect (nginx),
+    # x-sendfile (apache, lighttpd) or signed-url (redirect to a short lived
+    # signed url, S3 presigned url with the s3 storage)
+    DOWNLOAD_OFFLOAD: str = "none"
+    DOWNLOAD_ACCEL_PREFIX: str = "/protected/"  # internal location of the blobs
+    # where the app serves the signed urls of the local storage, checking
+    # their signature (nginx secure_link can't, it only knows MD5)
+    DOWNLOAD_SIGNED_URL_BASE: str = "/blobs/"
+    DOWNLOAD_SIGNING_KEY: Optional[str] = None
+    DOWNLOAD_SIGNED_URL_TTL: int = 60  # seconds
+
+    # file metadata cache in front of the DB lookups, an in-process LRU or,
+    # when METADATA_CACHE_REDIS_URL is set, a tier shared by the workers.
+    # The in-process one assumes a single worker: the others keep serving
+    # their copy of a changed or deleted file for up to METADATA_CACHE_TTL, set
+    # the shared tier (or METADATA_CACHE_TTL=0) with more than one worker.
+    METADATA_CACHE_SIZE: int = 10000  # entries
+    METADATA_CACHE_TTL: int = 30  # seconds
+    METADATA_CACHE_REDIS_URL: Optional[str] = None
+
+    # post-upload hooks run by the job workers (app.worker) once the upload
+    # is committed, by name, see app.services.file.POST_UPLOAD_HOOKS. Files are
+    # "processing" until all of them succeed
+    POST_UPLOAD_HOOKS: List[str] = []
+    # job queue: worker processes (jobs run at the same time), attempts
+    # before a job is marked as failed, delay of the first retry (doubled
+    # on every attempt) and time after which a running job is considered
+    # abandoned by a dead worker and run again
+    JOB_WORKER_PROCESSES: int = 2
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_DELAY: int = 10  # seconds
+    JOB_TIMEOUT: int = 600  # seconds
+    JOB_POLL_INTERVAL: float = 1  # seconds
+    # unreferenced blobs (deleted or overwritten files) are removed from the
+    # storage by a job this long after, downloads in flight can finish
+    BLOB_RECLAIM_DELAY: int = 60  # seconds
+
+    # storage reconciliation (python -m app.reconcile): objects without a row
+    # are only orphans once older than the grace period, so uploads in
+    # flight are left alone. Quarantined objects are moved to QUARANTINE_ROOT
+    RECONCILE_GRACE_PERIOD: int = 24 * 60 * 60  # seconds
+    RECONCILE_QUARANTINE_ROOT: str = "uploads/quarantine/"
+    RECONCILE_BATCH_SIZE: int = 1000  # rows read from the DB at a time
+
+    # blob scrubber (python -m app.scrub): re-reads the stored blobs and
+    # checks them against their digest, least recently verified first, once
+    # every INTERVAL at most and reading RATE bytes per second at most so it
+    # doesn't compete with the downloads
+    SCRUB_RATE: int = 10 * 1024 * 1024  # bytes per second
+    SCRUB_INTERVAL: int = 30 * 24 * 60 * 60  # seconds
+    SCRUB_BATCH_SIZE: int = 100  # blobs read from the DB at a time
+
+    # fraction of the client errors (4xx) logged by handle_result, server
+    # errors are always logged
+    ERROR_LOG_SAMPLE_RATE: float = 1.0
+
     class Config:
         case_sensitive = True
         env_file = ".env"
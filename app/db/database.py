@@ -3,8 +3,18 @@ from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 from app.db.base_class import Base
+from app.utils.metrics import TimedQueuePool, register_db_metrics
 
-engine = create_engine(settings.DATABASE_URI, pool_pre_ping=True)
+engine = create_engine(
+    settings.DATABASE_URI,
+    poolclass=TimedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+register_db_metrics(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -8,9 +8,11 @@ from app.utils.request_exceptions import (
 )
 
 from app.api.v1.api import api_router, tags_metadata
+from app.api.v1.endpoints import blobs
 from app.core.config import settings
 from app.utils.app_exceptions import AppExceptionCase
 from app.utils.app_exceptions import app_exception_handler
+from app.utils.metrics import MetricsMiddleware, metrics_response
 
 
 def get_application():
@@ -20,6 +22,7 @@ def get_application():
     ## Files
     
     You can **upload files**.
+    You can **resume uploads** sending chunks.
     You can **list files**.
     You can **download files**.
     
@@ -47,6 +50,7 @@ def get_application():
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    _app.add_middleware(MetricsMiddleware)
 
     return _app
 
@@ -70,3 +74,13 @@ async def custom_app_exception_handler(request, e):
 
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
+# signed urls of the local storage, see DOWNLOAD_OFFLOAD
+if settings.DOWNLOAD_SIGNED_URL_BASE.startswith("/"):
+    app.include_router(
+        blobs.router, prefix=settings.DOWNLOAD_SIGNED_URL_BASE.rstrip("/")
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
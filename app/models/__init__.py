@@ -3,5 +3,8 @@
 # relationships properly for more details:
 # https://github.com/tiangolo/full-stack-fastapi-postgresql/issues/28
 
+from .blob import Blob
 from .file import File
+from .job import Job
+from .upload_session import UploadSession, UploadChunk
 from .user import User
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, Integer, DateTime, BigInteger, Index, func
+from sqlalchemy.orm import relationship
+
+from app.db.base_class import Base
+
+
+class Blob(Base):
+    """
+    Content-addressed piece of data stored on disk, shared by every File
+    with the same content.
+    """
+
+    digest = Column(String(64), primary_key=True)  # sha256 hex digest
+    size = Column(BigInteger, nullable=False)
+    # how it's stored, see app.utils.compression
+    encoding = Column(String(16))
+    stored_size = Column(BigInteger)
+    ref_count = Column(Integer, nullable=False, default=0)
+
+    created_on = Column(DateTime(timezone=True), server_default=func.now())
+    # last time the scrubber read it back, see app.services.scrub
+    verified_on = Column(DateTime(timezone=True))
+
+    files = relationship("File", back_populates="blob")
+
+
+# scrubbing order, never verified first
+Index("ix_blob_verified_on", Blob.verified_on.asc().nullsfirst())
@@ -8,6 +8,7 @@ from sqlalchemy import (
     func,
     ForeignKey,
     UniqueConstraint,
+    Index,
     BigInteger,
 )
 from sqlalchemy.dialects.postgresql import UUID
@@ -16,12 +17,30 @@ from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 
 
+class FileStatus(object):
+    PROCESSING = "processing"  # post-upload hooks pending, content is there
+    READY = "ready"
+    FAILED = "failed"  # a post-upload hook failed for good
+
+
 class File(Base):
     uri = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     size = Column(BigInteger)
+    # copied from the blob, size and encoding of the stored content
+    stored_size = Column(BigInteger)
+    content_encoding = Column(String(16))
+    # hex, verified on upload when the client sent one, the sha256 is the
+    # blob digest
+    content_md5 = Column(String(32))
+    status = Column(String(16), nullable=False, server_default=FileStatus.READY)
 
-    uploaded_on = Column(
+    blob_digest = Column(String(64), ForeignKey("blob.digest"))
+    blob = relationship("Blob", back_populates="files")
+
+    # the listing's keyset pagination key, never changes once the file is there
+    uploaded_on = Column(DateTime(timezone=True), server_default=func.now())
+    updated_on = Column(
         DateTime(timezone=True),
         server_default=func.now(),
         onupdate=func.current_timestamp(),
@@ -30,4 +49,14 @@ class File(Base):
     user_id = Column(Integer, ForeignKey("user.id"))
     user = relationship("User", back_populates="files")
 
-    __table_args__ = (UniqueConstraint("name", "user_id", name="name_user_id"),)
+    __table_args__ = (
+        UniqueConstraint("name", "user_id", name="name_user_id"),
+        # keyset pagination of the listing, covers the listed columns too
+        Index(
+            "ix_file_user_id_uploaded_on_uri",
+            "user_id",
+            "uploaded_on",
+            "uri",
+            postgresql_include=["name", "size"],
+        ),
+    )
@@ -0,0 +1,49 @@
+from sqlalchemy import (
+    Column,
+    String,
+    Integer,
+    DateTime,
+    func,
+    BigInteger,
+    Index,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.base_class import Base
+
+
+class JobStatus(object):
+    PENDING = "pending"
+    RUNNING = "running"  # claimed by a worker until run_after
+    FAILED = "failed"  # out of attempts, kept for inspection
+
+
+class Job(Base):
+    """
+    Background work queued in the same transaction as what produced it, run
+    by app.worker once committed, see app.services.jobs.
+    Finished jobs are deleted.
+    """
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String(64), nullable=False)
+    payload = Column(JSONB, nullable=False, default=dict)
+    status = Column(String(16), nullable=False, default=JobStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String)
+    # when a pending job is due, or when a running one is deemed abandoned
+    run_after = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    created_on = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # the queue itself, failed jobs don't need to be found fast
+        Index(
+            "ix_job_due",
+            "run_after",
+            postgresql_where=text("status IN ('pending', 'running')"),
+        ),
+    )
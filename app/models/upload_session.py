@@ -0,0 +1,53 @@
+import uuid
+
+from sqlalchemy import (
+    Column,
+    String,
+    Integer,
+    DateTime,
+    func,
+    ForeignKey,
+    BigInteger,
+)
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+
+from app.db.base_class import Base
+
+
+class UploadSession(Base):
+    """
+    Resumable upload in progress. Bytes are staged on disk until the client
+    completes the session.
+    """
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    checksum = Column(String(64))  # sha256 hex digest sent by the client
+
+    created_on = Column(DateTime(timezone=True), server_default=func.now())
+
+    user_id = Column(Integer, ForeignKey("user.id"))
+
+    chunks = relationship(
+        "UploadChunk", back_populates="session", cascade="all, delete-orphan"
+    )
+
+
+class UploadChunk(Base):
+    """
+    Byte range already written for an UploadSession. One row per PUT so
+    parallel chunks never contend on the same row.
+    """
+
+    id = Column(Integer, primary_key=True)
+    offset = Column(BigInteger, nullable=False)
+    length = Column(BigInteger, nullable=False)
+
+    session_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("uploadsession.id", ondelete="CASCADE"),
+        index=True,
+    )
+    session = relationship("UploadSession", back_populates="chunks")
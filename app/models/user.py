@@ -10,6 +10,11 @@ class User(Base):
     email = Column(EmailType, nullable=False)
 
     files_uploaded = Column(Integer, default=0)
+    bytes_uploaded = Column(BigInteger, default=0, server_default="0")
+    # quota held by uploads in progress, see UserService.reserve_upload
+    files_reserved = Column(Integer, default=0, server_default="0")
+    bytes_reserved = Column(BigInteger, default=0, server_default="0")
+
     last_download_time = Column(DateTime(), server_default=func.now())
     bytes_read_on_last_minute = Column(BigInteger, default=0)
 
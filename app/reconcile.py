@@ -0,0 +1,64 @@
+"""
+Storage reconciliation, lists (and with --apply removes) the stored objects
+no row points at and reports the rows whose object is missing:
+
+    python -m app.reconcile                  # dry run, report only
+    python -m app.reconcile --apply          # delete the orphans
+    python -m app.reconcile --apply --quarantine
+"""
+import argparse
+from collections import Counter
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.services.reconcile import ReconcileCRUD
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--apply", action="store_true", help="act on the orphans, not a dry run"
+    )
+    parser.add_argument(
+        "--quarantine",
+        action="store_true",
+        help=f"move the orphans to {settings.RECONCILE_QUARANTINE_ROOT} "
+        "instead of deleting them",
+    )
+    parser.add_argument(
+        "--grace-period",
+        type=int,
+        default=settings.RECONCILE_GRACE_PERIOD,
+        help="seconds before an object without a row is an orphan",
+    )
+    args = parser.parse_args()
+
+    totals = Counter()
+    db = SessionLocal()
+    try:
+        reconciler = ReconcileCRUD(
+            db,
+            quarantine=args.quarantine,
+            dry_run=not args.apply,
+            grace_period=args.grace_period,
+        )
+        for finding in reconciler.reconcile():
+            # area, problem, key, size, action and whether it was done
+            print(
+                "\t".join(
+                    str(value if value is not None else "-") for value in finding
+                )
+            )
+            totals[finding.area, finding.problem, finding.action] += 1
+            totals["bytes", finding.action] += finding.size or 0
+    finally:
+        db.close()
+
+    for key, count in sorted(totals.items()):
+        print(f"# {' '.join(key)}: {count}")
+
+
+if __name__ == "__main__":
+    main()
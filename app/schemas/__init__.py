@@ -1,2 +1,16 @@
-from .file import File, FileCreated, FileQuery
-from .user import User, UserCreate, UserIncreaseFileCount, UpdateUserDownloadStats
+from .file import (
+    File,
+    FileArchiveQuery,
+    FileChecksums,
+    FileCreated,
+    FileDownload,
+    FileDownloadConditions,
+    FileListQuery,
+    FileMetadata,
+    FilePage,
+    FileQuery,
+    FileUploaded,
+    FileUploadOutcome,
+)
+from .upload_session import ByteRange, UploadSession, UploadSessionCreate
+from .user import User, UserCreate, UserQuotaReservation, UpdateUserDownloadStats
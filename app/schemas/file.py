@@ -1,7 +1,8 @@
 import uuid
 from datetime import datetime
+from typing import Any, List, Literal, Optional
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, conint, validator
 
 from app.core.config import settings
 
@@ -16,6 +17,26 @@ class File(BaseModel):
         orm_mode = True
 
 
+class FileMetadata(BaseModel):
+    """
+    Snapshot of a File row, what is kept in the metadata cache
+    """
+
+    uri: uuid.UUID
+    name: str
+    size: Optional[int] = None
+    stored_size: Optional[int] = None
+    content_encoding: Optional[str] = None
+    content_md5: Optional[str] = None
+    status: Optional[str] = None
+    blob_digest: Optional[str] = None
+    uploaded_on: Optional[datetime] = None
+    user_id: int
+
+    class Config:
+        orm_mode = True
+
+
 class FileCreated(BaseModel):
     name: str
     uri: uuid.UUID
@@ -28,5 +49,104 @@ class FileCreated(BaseModel):
         orm_mode = True
 
 
+class FileUploaded(FileCreated):
+    # processing until the post-upload hooks are done, then ready (or failed)
+    status: Optional[str] = None
+
+
+class FileUploadOutcome(BaseModel):
+    """
+    Result of one of the files of a batch upload
+    """
+
+    name: str
+    created: bool = False
+    uri: Optional[str] = None  # download path, as in FileCreated
+    status: Optional[str] = None  # as in FileUploaded
+    error: Optional[str] = None  # app_exception of the failure
+    context: Optional[dict] = None
+
+
+class FileChecksums(BaseModel):
+    """
+    Checksum headers sent along with an upload, see
+    app.utils.checksums.parse_checksums
+    """
+
+    content_md5: Optional[str] = None
+    digest: Optional[str] = None
+    checksum_sha256: Optional[str] = None
+
+
 class FileQuery(BaseModel):
     uri: uuid.UUID
+
+
+class FileDownloadConditions(BaseModel):
+    """
+    Range and conditional request headers of a download
+    """
+
+    range: Optional[str] = None
+    if_range: Optional[str] = None
+    if_none_match: Optional[str] = None
+    accept_encoding: Optional[str] = None
+
+
+class FileDownload(BaseModel):
+    """
+    What has to be served for an authorized download
+    """
+
+    key: str  # storage key
+    legacy: bool = False  # stored before the blob store, see get_legacy_storage
+    size: int
+    etag: Optional[str] = None
+    start: int = 0
+    end: Optional[int] = None  # inclusive, None means up to the end
+    partial: bool = False
+    not_modified: bool = False
+    encoding: Optional[str] = None  # compression of the stored content
+    stored_size: Optional[int] = None
+    passthrough: bool = False  # sent compressed, with Content-Encoding
+
+    @property
+    def length(self) -> int:
+        if self.not_modified:
+            return 0
+        if self.passthrough:
+            return self.stored_size
+        end = self.size - 1 if self.end is None else self.end
+        return end - self.start + 1
+
+
+class FileListQuery(BaseModel):
+    """
+    Page and filters of the file listing
+    """
+
+    cursor: Optional[str] = None
+    limit: conint(ge=1, le=1000) = 100
+    name_prefix: Optional[str] = None
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
+
+class FilePage(BaseModel):
+    # rows as returned by FileCRUD, serialized through FileCreated by the
+    # endpoint response model
+    files: List[Any]
+    next_cursor: Optional[str] = None
+
+
+class FileArchiveQuery(BaseModel):
+    """
+    Files to download as a single archive: the given uris or, without uris,
+    every file matching the listing filters (cursor and limit are ignored)
+    """
+
+    uris: Optional[List[uuid.UUID]] = None
+    filters: FileListQuery = FileListQuery()
+    format: Literal["zip", "tar"] = "zip"
@@ -0,0 +1,24 @@
+import uuid
+from typing import List, Optional
+
+from pydantic import BaseModel, conint, constr
+
+
+class ByteRange(BaseModel):
+    offset: int
+    length: int
+
+
+class UploadSessionCreate(BaseModel):
+    name: str
+    size: conint(gt=0)
+    # sha256 hex digest of the whole file, verified on completion
+    checksum: Optional[constr(regex=r"^[0-9a-fA-F]{64}$")] = None
+
+
+class UploadSession(BaseModel):
+    id: uuid.UUID
+    name: str
+    size: int
+    received_bytes: int
+    missing: List[ByteRange]
@@ -16,9 +16,10 @@ class UserCreate(BaseModel):
     email: EmailStr = None
 
 
-class UserIncreaseFileCount(BaseModel):
+class UserQuotaReservation(BaseModel):
     user_id: int
-    amount: int = 1
+    files: int = 1
+    bytes: int = 0
 
 
 class UpdateUserDownloadStats(BaseModel):
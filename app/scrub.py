@@ -0,0 +1,66 @@
+"""
+Blob scrubber, reads the stored blobs back at a bounded rate and checks them
+against their digest. Damaged blobs are reported and their files marked as
+failed:
+
+    python -m app.scrub                      # keep scrubbing as blobs are due
+    python -m app.scrub --once               # a single pass
+    python -m app.scrub --rate 52428800      # 50 MB/s
+"""
+import argparse
+import time
+from collections import Counter
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.services.scrub import ScrubCRUD
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="stop once no blob is due"
+    )
+    parser.add_argument(
+        "--rate",
+        type=int,
+        default=settings.SCRUB_RATE,
+        help="bytes read per second at most, 0 for no limit",
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=settings.SCRUB_INTERVAL,
+        help="seconds before a verified blob is due again",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=60,
+        help="seconds between passes when no blob is due",
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        scrubber = ScrubCRUD(db, rate=args.rate, interval=args.interval)
+        while True:
+            totals = Counter()
+            for result in scrubber.scrub():
+                if result.problem:
+                    print(f"{result.problem}\t{result.digest}\t{result.size}")
+                totals[result.problem or "ok"] += 1
+                totals["bytes"] += result.size
+            for key, count in sorted(totals.items()):
+                print(f"# {key}: {count}")
+            if args.once:
+                return
+            time.sleep(args.poll_interval)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, NamedTuple, Optional
+
+from loguru import logger
+from sqlalchemy import literal_column, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.models.blob import Blob
+from app.services.jobs import JobCRUD, job_handler
+from app.services.main import AppCRUD
+from app.storage import get_storage
+from app.utils.app_exceptions import AppException
+from app.utils.compression import ENCODINGS, compress_file, storage_key
+
+# set on the rows an upsert inserted, not on the ones it updated
+INSERTED = literal_column("xmax = 0").label("inserted")
+
+
+class StoredBlob(NamedTuple):
+    digest: str
+    size: int  # raw size
+    encoding: Optional[str]
+    stored_size: int
+    is_new: bool  # if it wasn't in the storage yet
+    md5: Optional[str] = None  # of the raw content, when the client sent one
+
+
+class BlobCRUD(AppCRUD):
+    """
+    Content-addressed storage. Every blob lives in the storage backend under
+    its sha256 digest (plus a suffix when compressed, see storage_key) and
+    keeps a reference counter with the number of files
+    pointing at it, so identical content is only stored once.
+
+    Disk and DB steps are ordered so neither points at partial state of the
+    other: uploads are staged and hashed aside, published (see publish)
+    before the row referencing them is committed, and deleted along with
+    their row while it's locked (see delete_unreferenced). Whatever a crash
+    leaves behind is an unreferenced object, found by the storage
+    reconciliation.
+    """
+
+    PATH_TO_STAGING = "uploads/tmp/"
+    RECLAIM_JOB = "reclaim_blob"
+
+    @staticmethod
+    def new_hash():
+        return hashlib.sha256()
+
+    @classmethod
+    def staging_path(cls) -> str:
+        """
+        Unique local path where an upload can be written while its digest is
+        still unknown
+        """
+        os.makedirs(cls.PATH_TO_STAGING, exist_ok=True)
+        return f"{cls.PATH_TO_STAGING}{uuid.uuid4()}"
+
+    @classmethod
+    def publish(cls, staging_path: str, digest: str, sync: bool = True) -> StoredBlob:
+        """
+        Move a staged upload to the storage under its digest, compressed if
+        STORAGE_COMPRESSION is set and the content is worth it.
+        If a blob with the same digest is already stored the staged copy is
+        discarded instead.
+        Blocking, the storage may be remote.
+        :param sync: False when the caller syncs the storage itself, once for
+        a whole batch (see StorageBackend.sync)
+        """
+        storage = get_storage()
+        size = os.path.getsize(staging_path)
+        truncated = False
+        for encoding in (None, *ENCODINGS):
+            stored = storage.stat(storage_key(digest, encoding))
+            if stored and encoding is None and stored.size != size:
+                # cut short by a crash before it reached the disk, the staged
+                # copy replaces it under the same key, rows may point at it
+                logger.warning(f"Stored blob {digest} is truncated, replacing it")
+                truncated = True
+                break
+            if stored:
+                os.unlink(staging_path)
+                return StoredBlob(digest, size, encoding, stored.size, False)
+
+        encoding = None
+        if settings.STORAGE_COMPRESSION != "none" and not truncated:
+            compressed_path = compress_file(staging_path, settings.STORAGE_COMPRESSION)
+            if compressed_path:
+                os.unlink(staging_path)
+                staging_path = compressed_path
+                encoding = settings.STORAGE_COMPRESSION
+
+        stored_size = os.path.getsize(staging_path)
+        try:
+            # same content under the same key, overwriting is harmless even if
+            # a concurrent upload stored it in the meantime
+            storage.put_file(storage_key(digest, encoding), staging_path, sync)
+        finally:
+            # the caller only cleans up the uncompressed staging file
+            if encoding and os.path.exists(staging_path):
+                os.unlink(staging_path)
+        return StoredBlob(digest, size, encoding, stored_size, True)
+
+    @classmethod
+    async def publish_async(
+        cls, staging_path: str, digest: str, sync: bool = True
+    ) -> StoredBlob:
+        """
+        publish off the event loop. With compression on it runs on a pool of
+        STORAGE_COMPRESSION_WORKERS threads, so compressing doesn't starve
+        the threadpool serving the DB calls.
+        """
+        if settings.STORAGE_COMPRESSION == "none":
+            return await run_in_threadpool(cls.publish, staging_path, digest, sync)
+        return await asyncio.get_running_loop().run_in_executor(
+            compression_executor(), cls.publish, staging_path, digest, sync
+        )
+
+    def get_blob(self, digest: str) -> Blob:
+        return self.db.query(Blob).filter(Blob.digest == digest).first()
+
+    def add_reference(self, blob: StoredBlob) -> Row:
+        """
+        Register a new file pointing at the blob, creating the row if needed.
+        Single upsert statement, no row lock is held across calls.
+        This method doesn't commit, it's part of the caller transaction.
+        :return: encoding and stored_size of the blob row
+        :raise AppException.FileUploaded: the content was deleted since it was
+        published, see check_stored
+        """
+        stmt = (
+            insert(Blob)
+            .values(**self._values(blob), ref_count=1)
+            .on_conflict_do_update(
+                index_elements=[Blob.digest],
+                set_={"ref_count": Blob.ref_count + 1},
+            )
+            .returning(Blob.encoding, Blob.stored_size, INSERTED)
+        )
+        stored = self.db.execute(stmt).first()
+        self.check_stored(blob, stored)
+        return stored
+
+    def ensure_blobs(self, blobs: Iterable[StoredBlob]) -> Dict[str, Row]:
+        """
+        Create the missing blob rows without adding references, a single
+        statement for every blob
+        :return: digest, encoding and stored_size of every blob row by digest
+        """
+        stmt = insert(Blob).values(
+            [dict(**self._values(blob), ref_count=0) for blob in blobs]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Blob.digest],
+            # no-op update so existing rows are returned too
+            set_={"ref_count": Blob.ref_count},
+        ).returning(Blob.digest, Blob.encoding, Blob.stored_size, INSERTED)
+        stored = {row.digest: row for row in self.db.execute(stmt)}
+        for blob in blobs:
+            self.check_stored(blob, stored[blob.digest])
+        return stored
+
+    @staticmethod
+    def check_stored(blob: StoredBlob, stored: Row):
+        """
+        The upsert inserted the row of content that publish found already
+        stored: the previous row was deleted in between, maybe along with the
+        content (see delete_unreferenced). The new row is locked, the storage
+        tells for sure.
+        :raise AppException.FileUploaded: the content is gone, the upload has
+        to be sent again
+        """
+        if not stored.inserted or blob.is_new:
+            return
+        if not get_storage().exists(storage_key(blob.digest, stored.encoding)):
+            raise AppException.FileUploaded(
+                "The content was deleted while uploading, upload it again"
+            )
+
+    def add_references(
+        self, references: Dict[str, int], blobs: Dict[str, StoredBlob]
+    ):
+        """
+        Bulk add_reference, a single upsert for every blob
+        :param references: new references by digest
+        :param blobs: the blobs by digest
+        """
+        stmt = insert(Blob).values(
+            [
+                dict(**self._values(blobs[digest]), ref_count=count)
+                for digest, count in references.items()
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Blob.digest],
+            set_={"ref_count": Blob.ref_count + stmt.excluded.ref_count},
+        )
+        self.db.execute(stmt)
+
+    def release_reference(self, digest: str):
+        """
+        A file stopped pointing at the blob. Once unreferenced the blob is
+        reclaimed by a job BLOB_RECLAIM_DELAY later, so the caller doesn't
+        wait for the storage and downloads in flight can finish.
+        This method doesn't commit, it's part of the caller transaction.
+        """
+        ref_count = self.db.execute(
+            update(Blob.__table__)
+            .where(Blob.digest == digest)
+            .values(ref_count=Blob.ref_count - 1)
+            .returning(Blob.ref_count)
+        ).scalar()
+        if ref_count == 0:
+            JobCRUD(self.db).enqueue(
+                self.RECLAIM_JOB, {"digest": digest}, settings.BLOB_RECLAIM_DELAY
+            )
+
+    def reclaim(self, digest: str):
+        """
+        Delete an unreferenced blob, row and stored content. A blob referenced
+        again since it was released is kept.
+        """
+        storage = get_storage()
+
+        def delete_content(_):
+            for encoding in (None, *ENCODINGS):
+                storage.delete(storage_key(digest, encoding))
+
+        self.delete_unreferenced(digest, delete_content)
+
+    def delete_unreferenced(
+        self, digest: str, delete_content: Callable[[Optional[str]], None]
+    ) -> Optional[Row]:
+        """
+        Delete the row of a blob and its stored content, unless it's
+        referenced. The content goes while the row is locked, a row missing
+        is created first just to be locked, so an add_reference running
+        meanwhile waits and then finds the row gone (see check_stored).
+        :param delete_content: deletes the stored content, gets the encoding
+        of the row
+        :return: None once deleted, encoding and ref_count of the row of a
+        referenced blob, kept
+        """
+        self.db.execute(
+            insert(Blob)
+            .values(digest=digest, size=0, ref_count=0)
+            .on_conflict_do_nothing(index_elements=[Blob.digest])
+        )
+        blob = (
+            self.db.query(Blob.encoding, Blob.ref_count)
+            .filter(Blob.digest == digest)
+            .with_for_update()
+            .first()
+        )
+        if blob and blob.ref_count > 0:
+            self.db.commit()
+            return blob
+
+        try:
+            delete_content(blob and blob.encoding)
+        except Exception:
+            self.db.rollback()
+            raise
+        self.db.query(Blob).filter(Blob.digest == digest).delete(
+            synchronize_session=False
+        )
+        self.db.commit()
+        return None
+
+    @staticmethod
+    def _values(blob: StoredBlob) -> dict:
+        return dict(
+            digest=blob.digest,
+            size=blob.size,
+            encoding=blob.encoding,
+            stored_size=blob.stored_size,
+        )
+
+
+@job_handler(BlobCRUD.RECLAIM_JOB)
+def _reclaim_blob(db: Session, payload: dict):
+    BlobCRUD(db).reclaim(payload["digest"])
+
+
+@lru_cache()
+def compression_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        settings.STORAGE_COMPRESSION_WORKERS, thread_name_prefix="compression"
+    )
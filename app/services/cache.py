@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from loguru import logger
+
+from app import schemas
+from app.core.config import settings
+
+
+class LRUCache(object):
+    """
+    In-process LRU cache whose entries expire ttl seconds after being set.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # used from the threadpool
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_on, value = entry
+            if expires_on < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache(object):
+    """
+    Cache shared by every worker, values are stored as strings.
+    """
+
+    def __init__(self, url: str, ttl: float, client=None):
+        if client is None:
+            # redis is only needed with a shared tier
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: str):
+        self.client.set(key, value, ex=int(self.ttl))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+
+class MetadataCache(object):
+    """
+    Read-through cache of file metadata looked up by uri or name.
+
+    The in-process tier is checked first, then the shared one if any.
+    Only existing files are cached. Writes invalidate both tiers of this
+    worker, other workers drop their local copy once its ttl expires, which
+    is why get_metadata_cache leaves the in-process tier out when there's a
+    shared one.
+    """
+
+    def __init__(self, local: Optional[LRUCache], shared: Optional[RedisCache] = None):
+        self.local = local
+        self.shared = shared
+        self.counters: Dict[str, int] = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+    @staticmethod
+    def uri_key(user_id: int, uri) -> str:
+        return f"file:uri:{user_id}:{uri}"
+
+    @staticmethod
+    def name_key(user_id: int, name: str) -> str:
+        return f"file:name:{user_id}:{name}"
+
+    def get(self, key: str) -> Optional[schemas.FileMetadata]:
+        file = self.local.get(key) if self.local else None
+        if file is not None:
+            self.counters["local_hits"] += 1
+            return file
+
+        if self.shared:
+            try:
+                value = self.shared.get(key)
+            except Exception as error:
+                # the DB is still there, a cache outage is not fatal
+                logger.error(f"{error}")
+                value = None
+            if value is not None:
+                self.counters["shared_hits"] += 1
+                file = schemas.FileMetadata.parse_raw(value)
+                if self.local:
+                    self.local.set(key, file)
+                return file
+
+        self.counters["misses"] += 1
+        return None
+
+    def set(self, file: schemas.FileMetadata):
+        keys = (
+            self.uri_key(file.user_id, file.uri),
+            self.name_key(file.user_id, file.name),
+        )
+        if self.local:
+            for key in keys:
+                self.local.set(key, file)
+        if self.shared:
+            value = file.json()
+            try:
+                for key in keys:
+                    self.shared.set(key, value)
+            except Exception as error:
+                logger.error(f"{error}")
+
+    def invalidate(self, user_id: int, uri=None, name: str = None):
+        keys = []
+        if uri:
+            keys.append(self.uri_key(user_id, uri))
+        if name:
+            keys.append(self.name_key(user_id, name))
+        if self.local:
+            for key in keys:
+                self.local.delete(key)
+        if self.shared:
+            try:
+                for key in keys:
+                    self.shared.delete(key)
+            except Exception as error:
+                logger.error(f"{error}")
+
+    def clear(self):
+        if self.local:
+            self.local.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters)
+
+
+@lru_cache()
+def get_metadata_cache() -> MetadataCache:
+    """
+    Metadata cache configured through Settings.METADATA_CACHE_*. With a
+    shared tier it's the only one: a delete invalidates it for every worker,
+    while an in-process copy elsewhere could be served until its ttl expires
+    (e.g. returning a just deleted file as the duplicate of a new upload).
+    """
+    if settings.METADATA_CACHE_REDIS_URL:
+        shared = RedisCache(
+            settings.METADATA_CACHE_REDIS_URL, settings.METADATA_CACHE_TTL
+        )
+        return MetadataCache(None, shared)
+    return MetadataCache(
+        LRUCache(settings.METADATA_CACHE_SIZE, settings.METADATA_CACHE_TTL)
+    )
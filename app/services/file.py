@@ -1,151 +1,1165 @@
+import asyncio
+import functools
+import os
 import uuid
-from typing import List, Tuple
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
-import aiofiles
 import sqlalchemy
 from fastapi import File, UploadFile
 from loguru import logger
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Query, Session
+from starlette.concurrency import run_in_threadpool
 
 from app import schemas
-from app.models.file import File as FileModel
-from app.schemas import UserIncreaseFileCount, User
+from app.core.config import settings
+from app.models.file import File as FileModel, FileStatus
+from app.schemas import User
 from app.schemas.user import UpdateUserDownloadStats
+from app.services.blob import BlobCRUD, StoredBlob
+from app.services.cache import get_metadata_cache
+from app.services.jobs import JobCRUD, job_handler
 from app.services.main import AppService, AppCRUD
-from app.services.user import UserService
+from app.services.user import UserCRUD, UserService
+from app.storage import get_legacy_storage, get_storage
 from app.utils.app_exceptions import AppException, AppExceptionCase
+from app.utils.archive import ArchiveEntry, iter_tar, iter_zip
+from app.utils.checksums import ContentHash, parse_checksums
+from app.utils.compression import accepts_encoding, decompress, storage_key
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.utils.ranges import etag_matches, parse_range
+from app.utils.metrics import (
+    BYTES_DOWNLOADED,
+    BYTES_UPLOADED,
+    UPLOAD_STAGE_SECONDS,
+    instrument_db,
+)
 from app.utils.service_result import ServiceResult
+from app.utils.signing import verify_signature
+from app.utils.streaming import (
+    adaptive_buffer_size,
+    copy_to_disk,
+    file_size,
+    BufferedWriter,
+)
 
 
 class FileService(AppService):
-    PATH_TO_FILES = "uploads/"
-
     def __init__(self, db: Session):
         super().__init__(db)
 
-    async def upload_file(self, file: UploadFile = File(...)) -> ServiceResult:
-        if not UserService(self.db).can_upload_files(User(id=1), lock_user=True):
-            return ServiceResult(
-                AppException.TooManyFilesPerUser(UserService.MAX_FILES_PER_USER)
+    async def upload_file(
+        self,
+        file: UploadFile = File(...),
+        overwrite: bool = False,
+        checksums: schemas.FileChecksums = None,
+    ) -> ServiceResult:
+        """
+        :param overwrite: replace the content of the file with the same name,
+        if any, instead of returning it as is
+        :param checksums: sent by the client, the upload is rejected if the
+        content doesn't match them
+        """
+        size = await run_in_threadpool(file_size, file.file)
+        if size > FileCRUD.MAX_FILE_SIZE:
+            return ServiceResult(AppException.FileTooLarge(FileCRUD.MAX_FILE_SIZE))
+        try:
+            expected = parse_checksums(**checksums.dict()) if checksums else {}
+        except AppExceptionCase as app_exception:
+            return ServiceResult(app_exception)
+
+        return await self._upload(
+            lambda: FileCRUD(self.db).store_file(file, overwrite, expected),
+            size,
+            await self._files_to_reserve(file.filename, overwrite),
+        )
+
+    async def upload_stream(
+        self,
+        name: str,
+        content: AsyncIterator[bytes],
+        content_length: Optional[int] = None,
+        overwrite: bool = False,
+        checksums: schemas.FileChecksums = None,
+    ) -> ServiceResult:
+        """
+        Upload a raw body streamed straight to disk, without the multipart
+        parser spooling it to a temporary file first.
+        :param overwrite: as in upload_file
+        :param checksums: as in upload_file
+        """
+        if content_length is not None and content_length > FileCRUD.MAX_FILE_SIZE:
+            # reject before reading a single byte of the body
+            return ServiceResult(AppException.FileTooLarge(FileCRUD.MAX_FILE_SIZE))
+        try:
+            expected = parse_checksums(**checksums.dict()) if checksums else {}
+        except AppExceptionCase as app_exception:
+            return ServiceResult(app_exception)
+
+        return await self._upload(
+            lambda: FileCRUD(self.db).store_stream(
+                name, content, content_length, overwrite, expected
+            ),
+            # unknown length, hold the worst case until the body is read
+            FileCRUD.MAX_FILE_SIZE if content_length is None else content_length,
+            await self._files_to_reserve(name, overwrite),
+        )
+
+    async def upload_staged_file(
+        self, name: str, staging_path: str, digest: str, size: int
+    ) -> ServiceResult:
+        """
+        Register a file whose content is already staged on disk and hashed,
+        e.g. coming from a resumable upload session.
+        """
+        return await self._upload(
+            lambda: FileCRUD(self.db).store_staged_file(
+                name, staging_path, digest, size
+            ),
+            size,
+        )
+
+    async def upload_files(self, files: List[UploadFile]) -> ServiceResult:
+        """
+        Batch upload: the new files are written to the storage concurrently,
+        inserted with a single statement and charged to the quota with a
+        single reservation. Names already taken are returned as is, like
+        upload_file does.
+        :return: a FileUploadOutcome per file, in the same order
+        """
+        outcomes: List[Optional[schemas.FileUploadOutcome]] = [None] * len(files)
+        crud = FileCRUD(self.db)
+        existing = await self.run_db(
+            crud.get_files_by_names, [file.filename for file in files]
+        )
+
+        pending = []
+        names = set()
+        for index, file in enumerate(files):
+            if file.filename in existing:
+                outcomes[index] = self._outcome(file.filename, existing[file.filename])
+                continue
+            if file.filename in names:
+                outcomes[index] = self._outcome(
+                    file.filename,
+                    error=AppException.FileUploaded("Name repeated in the batch"),
+                )
+                continue
+            names.add(file.filename)
+
+            size = await run_in_threadpool(file_size, file.file)
+            if size > FileCRUD.MAX_FILE_SIZE:
+                outcomes[index] = self._outcome(
+                    file.filename,
+                    error=AppException.FileTooLarge(FileCRUD.MAX_FILE_SIZE),
+                )
+                continue
+            pending.append((index, file, size))
+
+        if pending:
+            await self._upload_batch(pending, outcomes)
+        return ServiceResult(outcomes)
+
+    async def _upload_batch(
+        self,
+        pending: List[Tuple[int, UploadFile, int]],
+        outcomes: List[Optional[schemas.FileUploadOutcome]],
+    ):
+        user_service = UserService(self.db)
+        reservation = schemas.UserQuotaReservation(
+            user_id=1, files=len(pending), bytes=sum(size for _, _, size in pending)
+        )
+        with UPLOAD_STAGE_SECONDS.labels("quota").time():
+            result = await self.run_db(user_service.reserve_upload, reservation)
+        if not result.success:
+            for index, file, _ in pending:
+                outcomes[index] = self._outcome(file.filename, error=result.value)
+            return
+
+        crud = FileCRUD(self.db)
+        semaphore = asyncio.Semaphore(settings.BATCH_UPLOAD_CONCURRENCY)
+
+        async def store(file: UploadFile):
+            async with semaphore:
+                try:
+                    return await crud._store_file_on_disk(file, sync=False)
+                except AppExceptionCase as app_exception:
+                    return app_exception
+
+        try:
+            stored = await asyncio.gather(*(store(file) for _, file, _ in pending))
+            new_files = []
+            for (index, file, _), file_stored in zip(pending, stored):
+                if isinstance(file_stored, AppExceptionCase):
+                    outcomes[index] = self._outcome(file.filename, error=file_stored)
+                else:
+                    new_files.append((file.filename, file_stored))
+
+            # the whole batch is made durable at once, before any row points
+            # at it
+            with UPLOAD_STAGE_SECONDS.labels("publish").time():
+                await run_in_threadpool(
+                    get_storage().sync,
+                    [storage_key(blob.digest, blob.encoding) for _, blob in new_files],
+                )
+
+            with UPLOAD_STAGE_SECONDS.labels("db_insert").time():
+                created = await self.run_db(crud.create_files, new_files)
+        except Exception:
+            await self.run_db(user_service.release_upload, reservation)
+            raise
+
+        for index, file, _ in pending:
+            if outcomes[index]:
+                continue
+            if created is None:
+                outcomes[index] = self._outcome(
+                    file.filename, error=AppException.FileUploaded()
+                )
+            elif file.filename in created:
+                outcomes[index] = self._outcome(
+                    file.filename, created[file.filename], created=True
+                )
+            else:
+                # taken by a concurrent upload meanwhile
+                outcomes[index] = self._outcome(
+                    file.filename,
+                    error=AppException.FileUploaded("Name already taken"),
+                )
+
+        created = created or {}
+        created_bytes = sum(file.size for file in created.values())
+        with UPLOAD_STAGE_SECONDS.labels("quota").time():
+            await self.run_db(
+                user_service.commit_upload, reservation, created_bytes, len(created)
             )
+        BYTES_UPLOADED.inc(created_bytes)
+
+    @staticmethod
+    def _outcome(
+        name: str,
+        file: schemas.FileMetadata = None,
+        created: bool = False,
+        error: AppExceptionCase = None,
+    ) -> schemas.FileUploadOutcome:
+        return schemas.FileUploadOutcome(
+            name=name,
+            created=created,
+            uri=file and f"{settings.API_V1_STR}/files/{file.uri}",
+            status=file and file.status,
+            error=error and error.exception_case,
+            context=error and error.context,
+        )
+
+    async def _upload(
+        self,
+        store: Callable[[], Awaitable[Tuple[FileModel, bool]]],
+        size: int,
+        files: int = 1,
+    ) -> ServiceResult:
+        """
+        Common upload flow: reserve the user quota, store the file and then
+        confirm the reservation, or give it back if nothing new was stored.
+        No lock is held while the file is streamed.
+        :param store: FileCRUD coroutine factory storing the file
+        :param size: bytes to reserve
+        :param files: files to reserve, 0 when an existing file is replaced
+        """
+        user_service = UserService(self.db)
+        reservation = schemas.UserQuotaReservation(
+            user_id=1, files=files, bytes=size
+        )
+        with UPLOAD_STAGE_SECONDS.labels("quota").time():
+            result = await self.run_db(user_service.reserve_upload, reservation)
+        if not result.success:
+            return result
 
         try:
-            file, is_new_file = await FileCRUD(self.db).store_file(file)
+            file, is_new_file = await store()
         except AppExceptionCase as app_exception:
+            await self.run_db(user_service.release_upload, reservation)
             return ServiceResult(app_exception)
+        except Exception:
+            await self.run_db(user_service.release_upload, reservation)
+            raise
 
-        if is_new_file:
-            UserService(self.db).increase_file_count(UserIncreaseFileCount(user_id=1))
+        with UPLOAD_STAGE_SECONDS.labels("quota").time():
+            if is_new_file and file:
+                await self.run_db(user_service.commit_upload, reservation, file.size)
+                BYTES_UPLOADED.inc(file.size or 0)
+            else:
+                await self.run_db(user_service.release_upload, reservation)
 
         return ServiceResult(file)
 
-    async def get_files(self, file_query: schemas.FileQuery = None) -> ServiceResult:
-        files = FileCRUD(self.db).get_files(file_query)
-        return ServiceResult(files)
+    async def _files_to_reserve(self, name: str, overwrite: bool) -> int:
+        # replacing a file doesn't take one more, only its bytes may change
+        if overwrite and await self.run_db(FileCRUD(self.db).get_file_by_name, name):
+            return 0
+        return 1
+
+    async def delete_file(self, file_query: schemas.FileQuery) -> ServiceResult:
+        """
+        Delete a file, its quota is given back right away and its content
+        removed from the storage in the background
+        """
+        try:
+            deleted = await self.run_db(FileCRUD(self.db).delete_file, file_query.uri)
+        except AppExceptionCase as app_exception:
+            return ServiceResult(app_exception)
+        if not deleted:
+            return ServiceResult(AppException.FileNotFound())
+        return ServiceResult(deleted)
+
+    async def get_files(
+        self, list_query: schemas.FileListQuery = None
+    ) -> ServiceResult:
+        """
+        One page of the user files, oldest first
+        :return: FilePage
+        """
+        list_query = list_query or schemas.FileListQuery()
+        try:
+            after = list_query.cursor and decode_cursor(list_query.cursor)
+        except AppExceptionCase as app_exception:
+            return ServiceResult(app_exception)
 
-    async def get_file_uri(self, file_query: schemas.FileQuery = None) -> ServiceResult:
-        # this lock behaviour could be implemented through a context manager
-        # to ensure the unlocking! but for the purpose of a home test...
-        if not UserService(self.db).can_download_files(User(id=1), lock_user=True):
+        # one extra row tells if there's a next page
+        files = await self.run_db(
+            FileCRUD(self.db).list_files, list_query, after, list_query.limit + 1
+        )
+
+        next_cursor = None
+        if len(files) > list_query.limit:
+            files = files[: list_query.limit]
+            next_cursor = encode_cursor(files[-1].uploaded_on, files[-1].uri)
+        return ServiceResult(schemas.FilePage(files=files, next_cursor=next_cursor))
+
+    async def stream_files(
+        self, list_query: schemas.FileListQuery = None
+    ) -> ServiceResult:
+        """
+        Every file matching the listing filters as NDJSON, one FileCreated
+        per line, starting after the cursor if any.
+        Rows are read lazily in batches while the response is written, so
+        memory and time to first byte don't depend on the number of files.
+        :return: iterator of NDJSON chunks, meant for a StreamingResponse
+        """
+        list_query = list_query or schemas.FileListQuery()
+        try:
+            after = list_query.cursor and decode_cursor(list_query.cursor)
+        except AppExceptionCase as app_exception:
+            return ServiceResult(app_exception)
+
+        batches = FileCRUD(self.db).iter_files(list_query, after)
+        return ServiceResult(
+            "".join(
+                schemas.FileCreated.from_orm(row).json() + "\n" for row in rows
+            ).encode()
+            for rows in batches
+        )
+
+    async def get_file_uri(
+        self,
+        file_query: schemas.FileQuery = None,
+        conditions: schemas.FileDownloadConditions = None,
+    ) -> ServiceResult:
+        """
+        Authorize a download and work out what has to be served, honouring
+        Range/If-Range/If-None-Match. Only the bytes actually served are
+        charged to the download rate limit.
+        :return: FileDownload
+        """
+        if not await UserService(self.db).can_download_files(User(id=1)):
             return ServiceResult(AppException.DownloadBytesRateLimit())
 
-        files = FileCRUD(self.db).get_files(file_query)
+        files = await self.run_db(FileCRUD(self.db).get_files, file_query)
         try:
             file = files[0]
         except IndexError:
             return ServiceResult(AppException.FileNotFound())
 
-        file_uri = self.PATH_TO_FILES + str(file.uri)
+        try:
+            download = self._prepare_download(
+                file, conditions or schemas.FileDownloadConditions()
+            )
+        except AppExceptionCase as app_exception:
+            return ServiceResult(app_exception)
+
+        await UserService(self.db).update_download_stats(
+            UpdateUserDownloadStats(user_id=1, bytes=download.length)
+        )
+        BYTES_DOWNLOADED.inc(download.length)
+        await self.release_db()
+        return ServiceResult(download)
+
+    async def get_signed_download(
+        self,
+        path: str,
+        expires: int,
+        signature: str,
+        conditions: schemas.FileDownloadConditions = None,
+    ) -> ServiceResult:
+        """
+        Work out what has to be served for a signed url handed out by a
+        signed-url offloaded download. The download was authorized and
+        charged when the url was signed, the DB isn't involved.
+        :param path: blob path relative to DOWNLOAD_SIGNED_URL_BASE
+        :return: FileDownload
+        """
+        signed_path = settings.DOWNLOAD_SIGNED_URL_BASE + path
+        key = settings.DOWNLOAD_SIGNING_KEY
+        if not key or not verify_signature(signed_path, expires, signature, key):
+            return ServiceResult(AppException.InvalidSignature())
+
+        # only uncompressed blobs are offloaded, the key is the digest
+        digest = os.path.basename(path)
+        stored = await run_in_threadpool(get_storage().stat, digest)
+        if not stored:
+            return ServiceResult(AppException.FileNotFound())
+
+        blob = FileModel(blob_digest=digest, size=stored.size, stored_size=stored.size)
+        try:
+            download = self._prepare_download(
+                blob, conditions or schemas.FileDownloadConditions()
+            )
+        except AppExceptionCase as app_exception:
+            return ServiceResult(app_exception)
+        return ServiceResult(download)
+
+    async def get_archive(
+        self, archive_query: schemas.FileArchiveQuery
+    ) -> ServiceResult:
+        """
+        Authorize the download of many files as a single zip or tar archive,
+        charged to the download rate limit once for the whole content.
+        :return: iterator of archive chunks, built on the fly while the
+        response is written
+        """
+        if not await UserService(self.db).can_download_files(User(id=1)):
+            return ServiceResult(AppException.DownloadBytesRateLimit())
+
+        files = await self.run_db(
+            FileCRUD(self.db).get_archive_files,
+            archive_query,
+            FileCRUD.MAX_ARCHIVE_FILES + 1,
+        )
+        if not files:
+            return ServiceResult(AppException.FileNotFound())
+        if len(files) > FileCRUD.MAX_ARCHIVE_FILES:
+            return ServiceResult(
+                AppException.TooManyFilesInArchive(FileCRUD.MAX_ARCHIVE_FILES)
+            )
+
+        total = sum(file.size or 0 for file in files)
+        await UserService(self.db).update_download_stats(
+            UpdateUserDownloadStats(user_id=1, bytes=total)
+        )
+        BYTES_DOWNLOADED.inc(total)
+        await self.release_db()
+
+        entries = []
+        for file in files:
+            entries.append(
+                ArchiveEntry(
+                    file.name,
+                    file.size or 0,
+                    file.uploaded_on,
+                    functools.partial(self._file_content, file),
+                )
+            )
+        write_archive = iter_zip if archive_query.format == "zip" else iter_tar
+        return ServiceResult(write_archive(entries))
+
+    @staticmethod
+    def _file_content(file: FileModel) -> Iterator[bytes]:
+        # files stored before the blob store are keyed by uri
+        if not file.blob_digest:
+            return get_legacy_storage().get_stream(str(file.uri))
+        chunks = get_storage().get_stream(
+            storage_key(file.blob_digest, file.content_encoding)
+        )
+        if file.content_encoding:
+            return decompress(chunks, file.content_encoding)
+        return chunks
 
-        UserService(self.db).update_download_stats(
-            UpdateUserDownloadStats(user_id=1, bytes=file.size)
+    def _prepare_download(
+        self, file: FileModel, conditions: schemas.FileDownloadConditions
+    ) -> schemas.FileDownload:
+        encoding = file.content_encoding
+        # compressed blobs are sent as stored when the client can decode them,
+        # byte ranges are always served on the decoded content
+        passthrough = bool(
+            encoding
+            and not conditions.range
+            and accepts_encoding(conditions.accept_encoding, encoding)
         )
-        return ServiceResult(file_uri)
+        # the content hash is a strong validator, legacy files have none.
+        # Each representation has its own.
+        etag = None
+        if file.blob_digest and passthrough:
+            etag = f'"{file.blob_digest}-{encoding}"'
+        elif file.blob_digest:
+            etag = f'"{file.blob_digest}"'
+        download = schemas.FileDownload(
+            key=storage_key(str(file.blob_digest or file.uri), encoding),
+            legacy=not file.blob_digest,
+            size=file.size,
+            etag=etag,
+            encoding=encoding,
+            stored_size=file.stored_size,
+            passthrough=passthrough,
+        )
+
+        if etag_matches(conditions.if_none_match, etag):
+            download.not_modified = True
+            return download
+
+        if conditions.if_range and conditions.if_range != etag:
+            # the client copy is stale, send the whole file
+            return download
+
+        try:
+            byte_range = parse_range(conditions.range, file.size)
+        except ValueError:
+            raise AppException.RangeNotSatisfiable(file.size)
+
+        if byte_range:
+            download.start, download.end = byte_range
+            download.partial = True
+        return download
 
 
 class FileCRUD(AppCRUD):
 
     MAX_FILE_SIZE = 1024 * 1024 * 30  # 30 MB max file size
+    MAX_ARCHIVE_FILES = 10000
+    POST_UPLOAD_JOB = "post_upload"
+    RECLAIM_LEGACY_JOB = "reclaim_legacy_file"
 
-    async def store_file(self, file: UploadFile = File(...)) -> Tuple[FileModel, bool]:
+    async def store_file(
+        self,
+        file: UploadFile = File(...),
+        overwrite: bool = False,
+        checksums: Dict[str, str] = None,
+    ) -> Tuple[FileModel, bool]:
         """
-        Persist file in the DB from the given FileUploaded schema
+        Persist file in the DB from the given FileUploaded schema.
+        Content is deduplicated, identical files share the same blob on disk.
         :param file:
+        :param overwrite: replace the content of an existing file with the
+        same name, see replace_file
+        :param checksums: expected hex digest by algorithm, see ContentHash
+        :return: File object and if its created
+        """
+        file_obj = await self.run_db(self.get_file_by_name, file.filename)
+        if file_obj and not overwrite:
+            # nothing to write, the name is already taken
+            return file_obj, False
+
+        blob = await self._store_file_on_disk(file, checksums=checksums)
+        return await self._save_file(file.filename, blob, file_obj)
+
+    async def store_stream(
+        self,
+        name: str,
+        content: AsyncIterator[bytes],
+        content_length: Optional[int] = None,
+        overwrite: bool = False,
+        checksums: Dict[str, str] = None,
+    ) -> Tuple[FileModel, bool]:
+        """
+        Persist a file streamed as raw bytes
+        :param content_length: expected size if known, used to size buffers
+        :param overwrite: as in store_file
+        :param checksums: as in store_file
         :return: File object and if its created
         """
-        file_uuid, file_size = await self._store_file_on_disk(file)
-        file_obj = self.get_file_by_name(file.filename)
+        file_obj = await self.run_db(self.get_file_by_name, name)
+        if file_obj and not overwrite:
+            # the body is never read
+            return file_obj, False
+
+        blob = await self._store_stream_on_disk(content, content_length, checksums)
+        return await self._save_file(name, blob, file_obj)
+
+    async def _save_file(
+        self, name: str, blob: StoredBlob, existing: schemas.FileMetadata = None
+    ) -> Tuple[FileModel, bool]:
+        with UPLOAD_STAGE_SECONDS.labels("db_insert").time():
+            if not existing:
+                return await self.run_db(self.create_file, name, blob), True
+            file_obj = await self.run_db(self.replace_file, existing.uri, blob)
+        if not file_obj:
+            # deleted meanwhile or DB error, the stored blob is left to the
+            # storage reconciliation
+            raise AppException.FileUploaded("The file to overwrite is gone")
+        # the quota was updated along with the file
+        return file_obj, False
+
+    async def store_staged_file(
+        self, name: str, staging_path: str, digest: str, size: int
+    ) -> Tuple[FileModel, bool]:
+        """
+        Persist a file already written and hashed on a staging path
+        :return: File object and if its created
+        """
+        file_obj = await self.run_db(self.get_file_by_name, name)
         if file_obj:
+            os.unlink(staging_path)
             return file_obj, False
 
+        try:
+            with UPLOAD_STAGE_SECONDS.labels("publish").time():
+                blob = await BlobCRUD.publish_async(staging_path, digest)
+        except IOError:
+            raise AppException.FileUploaded()
+
+        with UPLOAD_STAGE_SECONDS.labels("db_insert").time():
+            file_obj = await self.run_db(self.create_file, name, blob)
+        return file_obj, True
+
+    @instrument_db
+    def create_file(self, name: str, blob: StoredBlob) -> FileModel:
+        """
+        Insert a File pointing at an already published blob
+        :return: File object or None on DB error
+        """
         file_obj = FileModel(
-            name=file.filename,
+            uri=uuid.uuid4(),
+            name=name,
             # suppose only 1 user on the system, otherwise use some auth or
             # session
             user_id=1,
-            uri=file_uuid,
-            size=file_size,
+            blob_digest=blob.digest,
+            size=blob.size,
+            content_md5=blob.md5,
+            status=self._new_file_status(),
         )
         try:
+            # the blob row may be older than what publish saw, it's the truth
+            stored = BlobCRUD(self.db).add_reference(blob)
+            file_obj.stored_size = stored.stored_size
+            file_obj.content_encoding = stored.encoding
             self.db.add(file_obj)
+            if file_obj.status == FileStatus.PROCESSING:
+                JobCRUD(self.db).enqueue(
+                    self.POST_UPLOAD_JOB, {"uri": str(file_obj.uri)}
+                )
             self.db.commit()
         except sqlalchemy.exc.DatabaseError as error:
             logger.error(f"{error}")
+            self.db.rollback()
             file_obj = None
+        except AppExceptionCase:
+            self.db.rollback()
+            raise
 
-        return file_obj, True
+        get_metadata_cache().invalidate(1, name=name)
+        return file_obj
 
-    async def _store_file_on_disk(
-        self, file: UploadFile = File(...)
-    ) -> Tuple[uuid.UUID, int]:
+    @instrument_db
+    def create_files(
+        self, files: List[Tuple[str, StoredBlob]]
+    ) -> Optional[Dict[str, schemas.FileMetadata]]:
+        """
+        Bulk insert of Files pointing at already published blobs, in a single
+        transaction of three statements whatever the number of files: blob
+        rows, files and blob references. Names taken in the meantime are
+        skipped.
+        :param files: name and blob of every file
+        :return: the inserted files by name, None on DB error
+        """
+        if not files:
+            return {}
+
+        blobs = {blob.digest: blob for _, blob in files}
+        blob_crud = BlobCRUD(self.db)
+        status = self._new_file_status()
+        try:
+            stored = blob_crud.ensure_blobs(blobs.values())
+            rows = self.db.execute(
+                insert(FileModel)
+                .values(
+                    [
+                        dict(
+                            name=name,
+                            # suppose only 1 user on the system, otherwise use
+                            # some auth or session
+                            user_id=1,
+                            blob_digest=blob.digest,
+                            size=blob.size,
+                            content_md5=blob.md5,
+                            stored_size=stored[blob.digest].stored_size,
+                            content_encoding=stored[blob.digest].encoding,
+                            status=status,
+                        )
+                        for name, blob in files
+                    ]
+                )
+                .on_conflict_do_nothing(constraint="name_user_id")
+                .returning(*FileModel.__table__.columns)
+            ).fetchall()
+            if rows:
+                blob_crud.add_references(
+                    Counter(row.blob_digest for row in rows), blobs
+                )
+            if status == FileStatus.PROCESSING:
+                JobCRUD(self.db).enqueue_many(
+                    self.POST_UPLOAD_JOB, [{"uri": str(row.uri)} for row in rows]
+                )
+            self.db.commit()
+        except (sqlalchemy.exc.DatabaseError, AppExceptionCase) as error:
+            # an AppExceptionCase if some content was deleted meanwhile
+            logger.error(f"{error}")
+            self.db.rollback()
+            return None
 
-        file_uuid = uuid.uuid4()
-        output_file = f"uploads/{file_uuid}"
-        real_file_size = 0
+        cache = get_metadata_cache()
+        for name, _ in files:
+            cache.invalidate(1, name=name)
+        return {row.name: schemas.FileMetadata.from_orm(row) for row in rows}
 
+    @instrument_db
+    def replace_file(self, uri: uuid.UUID, blob: StoredBlob) -> Optional[FileModel]:
+        """
+        Point an existing File at new content, keeping its uri. The new blob
+        reference, the release of the previous content and the quota update
+        are a single transaction.
+        :return: File object, None if there's no such file or on DB error
+        """
         try:
-            async with aiofiles.open(f"{output_file}", "wb") as out_file:
-                while content := await file.read(1024):  # async read chunk
-                    real_file_size += len(content)
-                    if real_file_size > self.MAX_FILE_SIZE:
-                        raise AppException.FileTooLarge(self.MAX_FILE_SIZE)
-                    await out_file.write(content)  # async write chunk
+            file_obj = (
+                self.db.query(FileModel)
+                .filter(
+                    # suppose only 1 user on the system, otherwise use some
+                    # auth or session
+                    FileModel.user_id == 1,
+                    FileModel.uri == uri,
+                )
+                .with_for_update()
+                .first()
+            )
+            if not file_obj:
+                self.db.rollback()
+                return None
+
+            old_size = file_obj.size or 0
+            # referenced first, same content again is never seen unreferenced
+            stored = BlobCRUD(self.db).add_reference(blob)
+            self._release_content(file_obj)
+            file_obj.blob_digest = blob.digest
+            file_obj.size = blob.size
+            file_obj.content_md5 = blob.md5
+            file_obj.stored_size = stored.stored_size
+            file_obj.content_encoding = stored.encoding
+            file_obj.status = self._new_file_status()
+            UserCRUD(self.db).charge_usage(file_obj.user_id, 0, blob.size - old_size)
+            if file_obj.status == FileStatus.PROCESSING:
+                JobCRUD(self.db).enqueue(self.POST_UPLOAD_JOB, {"uri": str(uri)})
+            self.db.commit()
+        except sqlalchemy.exc.DatabaseError as error:
+            logger.error(f"{error}")
+            self.db.rollback()
+            return None
+        except AppExceptionCase:
+            self.db.rollback()
+            raise
+
+        get_metadata_cache().invalidate(1, uri=uri, name=file_obj.name)
+        return file_obj
+
+    @instrument_db
+    def delete_file(self, uri: uuid.UUID) -> Optional[Row]:
+        """
+        Delete a File, release its content and give its quota back in a
+        single transaction. The content itself is removed by a job, see
+        BlobCRUD.release_reference.
+        :return: the deleted row, None if there's no such file
+        """
+        try:
+            deleted = self.db.execute(
+                delete(FileModel.__table__)
+                .where(
+                    # suppose only 1 user on the system, otherwise use some
+                    # auth or session
+                    FileModel.user_id == 1,
+                    FileModel.uri == uri,
+                )
+                .returning(*FileModel.__table__.columns)
+            ).first()
+            if deleted:
+                self._release_content(deleted)
+                UserCRUD(self.db).charge_usage(
+                    deleted.user_id, -1, -(deleted.size or 0)
+                )
+            self.db.commit()
+        except sqlalchemy.exc.DatabaseError as error:
+            logger.error(f"{error}")
+            self.db.rollback()
+            raise AppException.FileDeletion()
+
+        if deleted:
+            get_metadata_cache().invalidate(1, uri=uri, name=deleted.name)
+        return deleted
+
+    def _release_content(self, file: FileModel):
+        if file.blob_digest:
+            BlobCRUD(self.db).release_reference(file.blob_digest)
+        else:
+            # stored before the blob store, under its uri
+            JobCRUD(self.db).enqueue(
+                self.RECLAIM_LEGACY_JOB,
+                {"uri": str(file.uri)},
+                settings.BLOB_RECLAIM_DELAY,
+            )
+
+    @instrument_db
+    def reclaim_legacy_file(self, uri: uuid.UUID):
+        """
+        Delete the content of a legacy file once no File points at it
+        """
+        legacy = (
+            self.db.query(FileModel.uri)
+            .filter(FileModel.uri == uri, FileModel.blob_digest.is_(None))
+            .first()
+        )
+        self.db.commit()
+        if not legacy:
+            get_legacy_storage().delete(str(uri))
+
+    async def _store_file_on_disk(
+        self,
+        file: UploadFile = File(...),
+        sync: bool = True,
+        checksums: Dict[str, str] = None,
+    ) -> StoredBlob:
+        """
+        Write the upload to a staging file hashing it on the fly, then move it
+        to its content-addressed location once it matches the checksums.
+        The whole copy runs on the threadpool with large buffers, see
+        app.utils.streaming
+        :param sync: as in BlobCRUD.publish
+        :param checksums: as in store_file
+        """
+        staging_path = BlobCRUD.staging_path()
+        file_hash = ContentHash(checksums)
+
+        try:
+            with UPLOAD_STAGE_SECONDS.labels("spool").time():
+                await run_in_threadpool(
+                    copy_to_disk,
+                    file.file,
+                    staging_path,
+                    file_hash,
+                    self.MAX_FILE_SIZE,
+                )
+            hexdigests = file_hash.verify()
+            with UPLOAD_STAGE_SECONDS.labels("publish").time():
+                blob = await BlobCRUD.publish_async(
+                    staging_path, hexdigests["sha256"], sync
+                )
+            return blob._replace(md5=hexdigests.get("md5"))
         except IOError:
             raise AppException.FileUploaded()
+        finally:
+            if os.path.exists(staging_path):
+                os.unlink(staging_path)
 
-        return file_uuid, real_file_size
+    async def _store_stream_on_disk(
+        self,
+        content: AsyncIterator[bytes],
+        content_length: Optional[int] = None,
+        checksums: Dict[str, str] = None,
+    ) -> StoredBlob:
+        """
+        Write a byte stream to a staging file hashing it on the fly, then move
+        it to its content-addressed location once it matches the checksums.
+        The size limit is enforced while streaming so oversized bodies are
+        aborted early.
+        :param checksums: as in store_file
+        """
+        staging_path = BlobCRUD.staging_path()
 
+        try:
+            spool_timer = UPLOAD_STAGE_SECONDS.labels("spool").time()
+            with spool_timer, open(staging_path, "wb") as out_file:
+                writer = BufferedWriter(
+                    out_file,
+                    file_hash=ContentHash(checksums),
+                    max_size=self.MAX_FILE_SIZE,
+                    buffer_size=adaptive_buffer_size(content_length),
+                )
+                async for data in content:
+                    await writer.write(data)
+                await writer.flush()
+
+            hexdigests = writer.file_hash.verify()
+            with UPLOAD_STAGE_SECONDS.labels("publish").time():
+                blob = await BlobCRUD.publish_async(staging_path, hexdigests["sha256"])
+            return blob._replace(md5=hexdigests.get("md5"))
+        except IOError:
+            raise AppException.FileUploaded()
+        finally:
+            if os.path.exists(staging_path):
+                os.unlink(staging_path)
+
+    @instrument_db
     def get_files(self, file_query: schemas.FileQuery) -> List[FileModel]:
         """
-        Search for files filtering by a given file_query
+        Search for files filtering by a given file_query.
+        Lookups by uri go through the metadata cache and return FileMetadata
+        snapshots instead of File objects.
         :param file_query: FileQuery
         :return: List[File]
         """
         uri = file_query and file_query.uri
-        return (
+        # suppose only 1 user on the system, otherwise use some auth or session
+        user_id = 1
+        cache = get_metadata_cache()
+        if uri:
+            cached = cache.get(cache.uri_key(user_id, uri))
+            if cached:
+                return [cached]
+
+        files = (
             self.db.query(FileModel)
             .filter(
-                # suppose only 1 user on the system, otherwise use some auth or
-                # session
-                FileModel.user_id == 1,
+                FileModel.user_id == user_id,
                 not uri or FileModel.uri == uri,
             )
             .all()
         )
+        if uri:
+            files = [self._cache_file(file) for file in files]
+        return files
 
-    def get_file_by_name(self, file_name: str) -> FileModel:
+    @instrument_db
+    def list_files(
+        self,
+        list_query: schemas.FileListQuery,
+        after: Optional[Tuple[datetime, uuid.UUID]] = None,
+        limit: int = None,
+    ) -> List[Row]:
         """
-        Search for files filtering by a given file_query
-        :param file_name: FileQuery
-        :return: List[File]
+        Keyset paginated listing ordered by (uploaded_on, uri), served by the
+        ix_file_user_id_uploaded_on_uri index. Only the listed columns are
+        loaded, no File objects are built.
+        :param after: (uploaded_on, uri) of the last row of the previous page
+        :return: rows with uri, name and uploaded_on
         """
         return (
+            self._listing_query(list_query, after)
+            .limit(limit or list_query.limit)
+            .all()
+        )
+
+    def iter_files(
+        self,
+        list_query: schemas.FileListQuery,
+        after: Optional[Tuple[datetime, uuid.UUID]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[List[Row]]:
+        """
+        Every file matching the listing filters, read through a server-side
+        cursor and yielded in batches so memory doesn't grow with the number
+        of files. The limit of the query is ignored.
+        """
+        # a single iterator, iterating the Query again would run it again
+        rows = iter(self._listing_query(list_query, after).yield_per(batch_size))
+        while batch := list(islice(rows, batch_size)):
+            yield batch
+
+    @instrument_db
+    def get_archive_files(
+        self, archive_query: schemas.FileArchiveQuery, limit: int
+    ) -> List[Row]:
+        """
+        Files to put in an archive, oldest first
+        :return: rows with uri, name, size, blob_digest, content_encoding and
+        uploaded_on
+        """
+        columns = (
+            FileModel.uri,
+            FileModel.name,
+            FileModel.size,
+            FileModel.blob_digest,
+            FileModel.content_encoding,
+            FileModel.uploaded_on,
+        )
+        if archive_query.uris:
+            query = (
+                self.db.query(*columns)
+                .filter(
+                    # suppose only 1 user on the system, otherwise use some
+                    # auth or session
+                    FileModel.user_id == 1,
+                    FileModel.uri.in_(archive_query.uris),
+                )
+                .order_by(FileModel.uploaded_on, FileModel.uri)
+            )
+        else:
+            query = self._listing_query(archive_query.filters, columns=columns)
+        return query.limit(limit).all()
+
+    def _listing_query(
+        self,
+        list_query: schemas.FileListQuery,
+        after: Optional[Tuple[datetime, uuid.UUID]] = None,
+        columns: tuple = (FileModel.uri, FileModel.name, FileModel.uploaded_on),
+    ) -> Query:
+        query = self.db.query(*columns).filter(
+            # suppose only 1 user on the system, otherwise use some auth or
+            # session
+            FileModel.user_id == 1,
+        )
+
+        if after:
+            query = query.filter(
+                tuple_(FileModel.uploaded_on, FileModel.uri) > tuple_(*after)
+            )
+        if list_query.name_prefix:
+            query = query.filter(
+                FileModel.name.startswith(list_query.name_prefix, autoescape=True)
+            )
+        if list_query.min_size is not None:
+            query = query.filter(FileModel.size >= list_query.min_size)
+        if list_query.max_size is not None:
+            query = query.filter(FileModel.size <= list_query.max_size)
+        if list_query.uploaded_after:
+            query = query.filter(FileModel.uploaded_on >= list_query.uploaded_after)
+        if list_query.uploaded_before:
+            query = query.filter(FileModel.uploaded_on < list_query.uploaded_before)
+
+        return query.order_by(FileModel.uploaded_on, FileModel.uri)
+
+    @instrument_db
+    def get_file_by_name(self, file_name: str) -> Optional[schemas.FileMetadata]:
+        """
+        Search for files filtering by a given file_query, through the metadata
+        cache
+        :param file_name: FileQuery
+        :return: FileMetadata
+        """
+        # suppose only 1 user on the system, otherwise use some auth or session
+        user_id = 1
+        cache = get_metadata_cache()
+        cached = cache.get(cache.name_key(user_id, file_name))
+        if cached:
+            return cached
+
+        file = (
             self.db.query(FileModel)
             .filter(
-                # suppose only 1 user on the system, otherwise use some auth or
-                # session
-                FileModel.user_id == 1,
+                FileModel.user_id == user_id,
                 FileModel.name == file_name,
             )
             .first()
         )
+        return file and self._cache_file(file)
+
+    @instrument_db
+    def get_files_by_names(self, names: List[str]) -> Dict[str, FileModel]:
+        """
+        Files with any of the given names, in a single query
+        """
+        files = self.db.query(FileModel).filter(
+            # suppose only 1 user on the system, otherwise use some auth or
+            # session
+            FileModel.user_id == 1,
+            FileModel.name.in_(names),
+        )
+        return {file.name: file for file in files}
+
+    @staticmethod
+    def _new_file_status() -> str:
+        if settings.POST_UPLOAD_HOOKS:
+            return FileStatus.PROCESSING
+        return FileStatus.READY
+
+    @instrument_db
+    def run_post_upload_hooks(self, uri: uuid.UUID):
+        """
+        Run the POST_UPLOAD_HOOKS on a new file, in order, and mark it as
+        ready. Every hook runs again if any of them fails.
+        """
+        file = self.db.query(FileModel).filter(FileModel.uri == uri).first()
+        # deleted in the meantime, or already done by a worker given up on
+        if not file or file.status != FileStatus.PROCESSING:
+            return
+
+        for hook in settings.POST_UPLOAD_HOOKS:
+            POST_UPLOAD_HOOKS[hook](self.db, file)
+        self.set_status(file, FileStatus.READY)
+
+    @instrument_db
+    def set_status(self, file: FileModel, status: str):
+        file.status = status
+        self.db.commit()
+        get_metadata_cache().invalidate(file.user_id, uri=file.uri, name=file.name)
+
+    @staticmethod
+    def _cache_file(file: FileModel) -> schemas.FileMetadata:
+        metadata = schemas.FileMetadata.from_orm(file)
+        get_metadata_cache().set(metadata)
+        return metadata
+
+
+# post-upload hooks by name, enabled with settings.POST_UPLOAD_HOOKS. They get
+# the session of the job worker and the new File
+POST_UPLOAD_HOOKS: Dict[str, Callable[[Session, FileModel], None]] = {}
+
+
+def post_upload_hook(name: str):
+    def register(func: Callable[[Session, FileModel], None]):
+        POST_UPLOAD_HOOKS[name] = func
+        return func
+
+    return register
+
+
+@post_upload_hook("verify")
+def verify_blob(db: Session, file: FileModel):
+    """
+    Read the stored content back and check it against the blob digest,
+    catches storage corruption or truncated writes (e.g. remote storages)
+    """
+    if not file.blob_digest:
+        return
+    digest = BlobCRUD.new_hash()
+    for chunk in FileService._file_content(file):
+        digest.update(chunk)
+    if digest.hexdigest() != file.blob_digest:
+        raise IOError(
+            f"Stored content of {file.uri} doesn't match {file.blob_digest}"
+        )
+
+
+def _post_upload_failed(db: Session, payload: dict):
+    file = db.query(FileModel).filter(FileModel.uri == payload["uri"]).first()
+    if file:
+        FileCRUD(db).set_status(file, FileStatus.FAILED)
+
+
+@job_handler(FileCRUD.POST_UPLOAD_JOB, on_failure=_post_upload_failed)
+def _run_post_upload_hooks(db: Session, payload: dict):
+    FileCRUD(db).run_post_upload_hooks(uuid.UUID(payload["uri"]))
+
+
+@job_handler(FileCRUD.RECLAIM_LEGACY_JOB)
+def _reclaim_legacy_file(db: Session, payload: dict):
+    FileCRUD(db).reclaim_legacy_file(uuid.UUID(payload["uri"]))
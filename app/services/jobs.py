@@ -0,0 +1,153 @@
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from loguru import logger
+from sqlalchemy import func, insert, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.job import Job, JobStatus
+from app.services.main import AppCRUD
+from app.utils.metrics import JOB_SECONDS, instrument_db
+
+
+class JobHandler(NamedTuple):
+    run: Callable[[Session, dict], None]
+    # called once the job is out of attempts
+    on_failure: Optional[Callable[[Session, dict], None]] = None
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str, on_failure: Callable[[Session, dict], None] = None):
+    """
+    Register the function running the jobs of a kind. It gets a session of
+    its own and the job payload, raising means the job is retried later so
+    it must be safe to run more than once.
+    """
+
+    def register(func: Callable[[Session, dict], None]):
+        JOB_HANDLERS[kind] = JobHandler(func, on_failure)
+        return func
+
+    return register
+
+
+class JobCRUD(AppCRUD):
+    """
+    Job queue on a DB table. Jobs are added to the session of the caller
+    so they're committed, or not, along with the work that needs them.
+    Workers claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED so they
+    never wait for each other.
+    """
+
+    def enqueue(self, kind: str, payload: dict, delay: int = 0):
+        """
+        Add a job to the current transaction, the caller commits
+        :param delay: seconds before the job is due
+        """
+        values = dict(kind=kind, payload=payload)
+        if delay:
+            values["run_after"] = func.now() + timedelta(seconds=delay)
+        self.db.execute(insert(Job).values(**values))
+
+    def enqueue_many(self, kind: str, payloads: List[dict]):
+        if payloads:
+            self.db.execute(
+                insert(Job).values([dict(kind=kind, payload=p) for p in payloads])
+            )
+
+    @instrument_db
+    def claim(self, limit: int = 1) -> List[Row]:
+        """
+        Take due jobs: pending ones and running ones whose worker didn't
+        finish them in JOB_TIMEOUT. They stay claimed for JOB_TIMEOUT.
+        :return: claimed job rows, attempts already counted
+        """
+        due = (
+            self.db.query(Job.id)
+            .filter(
+                Job.status.in_((JobStatus.PENDING, JobStatus.RUNNING)),
+                Job.run_after <= func.now(),
+            )
+            .order_by(Job.run_after)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        jobs = self.db.execute(
+            update(Job.__table__)
+            .where(Job.id.in_(due))
+            .values(
+                status=JobStatus.RUNNING,
+                attempts=Job.attempts + 1,
+                run_after=func.now() + timedelta(seconds=settings.JOB_TIMEOUT),
+            )
+            .returning(*Job.__table__.columns)
+        ).fetchall()
+        self.db.commit()
+        return jobs
+
+    @instrument_db
+    def complete(self, job: Row):
+        self.db.query(Job).filter(Job.id == job.id).delete(
+            synchronize_session=False
+        )
+        self.db.commit()
+
+    @instrument_db
+    def retry_or_fail(self, job: Row, error: str) -> bool:
+        """
+        Schedule the job again with exponential backoff or, out of attempts,
+        mark it as failed
+        :return: if it failed for good
+        """
+        failed = job.attempts >= settings.JOB_MAX_ATTEMPTS
+        values = dict(last_error=error[:1000])
+        if failed:
+            values["status"] = JobStatus.FAILED
+        else:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            values["status"] = JobStatus.PENDING
+            values["run_after"] = func.now() + timedelta(seconds=delay)
+        self.db.query(Job).filter(Job.id == job.id).update(
+            values, synchronize_session=False
+        )
+        self.db.commit()
+        return failed
+
+    def run(self, job: Row) -> bool:
+        """
+        Run a claimed job with its handler and record the outcome
+        :return: if the job succeeded
+        """
+        start = time.perf_counter()
+        handler = JOB_HANDLERS.get(job.kind)
+        try:
+            if not handler:
+                raise LookupError(f"No handler for {job.kind} jobs")
+            if job.attempts > settings.JOB_MAX_ATTEMPTS:
+                # abandoned by dead workers over and over
+                raise TimeoutError(f"Job abandoned {job.attempts} times")
+            handler.run(self.db, job.payload)
+        except Exception as error:
+            self.db.rollback()
+            logger.exception(f"Job {job.id} ({job.kind}) failed: {error}")
+            JOB_SECONDS.labels(job.kind, "error").observe(time.perf_counter() - start)
+            try:
+                failed = self.retry_or_fail(job, repr(error))
+                if failed and handler and handler.on_failure:
+                    handler.on_failure(self.db, job.payload)
+            except Exception as failure_error:
+                # if the job wasn't updated it's claimed until JOB_TIMEOUT and
+                # will be run again
+                logger.error(f"{failure_error}")
+                self.db.rollback()
+            return False
+
+        self.complete(job)
+        JOB_SECONDS.labels(job.kind, "success").observe(time.perf_counter() - start)
+        return True
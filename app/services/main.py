@@ -1,10 +1,31 @@
+from typing import Any, Callable
+
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 
 class DBSessionContext(object):
     def __init__(self, db: Session):
         self.db = db
 
+    async def run_db(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run blocking DB work (psycopg2) on the threadpool so the event loop
+        keeps serving other requests meanwhile.
+        Calls are awaited one after the other, so the session is never used
+        by two threads at the same time.
+        """
+        return await run_in_threadpool(func, *args, **kwargs)
+
+    async def release_db(self):
+        """
+        Give the connection back to the pool ahead of a long response (e.g. a
+        download) instead of holding it until the request ends. The session
+        stays usable, the next query checks out a connection again.
+        Loaded objects are detached, only use what's already loaded.
+        """
+        await run_in_threadpool(self.db.close)
+
 
 class AppService(DBSessionContext):
     pass
@@ -0,0 +1,168 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Hashable, Tuple
+
+import sqlalchemy
+from loguru import logger
+from sqlalchemy import BigInteger, cast, func
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+from app.services.main import AppCRUD
+from app.utils.metrics import instrument_db
+
+
+class RateLimiter(ABC):
+    """
+    Limits the amount consumed per key (e.g. bytes per user) over a period.
+
+    Usage follows the download flow: `allow` is checked before serving and
+    the served amount is charged afterwards with `consume`, so the last
+    request of a period may go over the capacity.
+    """
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.period = period
+
+    @abstractmethod
+    async def allow(self, key: Hashable) -> bool:
+        pass
+
+    @abstractmethod
+    async def consume(self, key: Hashable, amount: int):
+        pass
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+    In-process token bucket refilled at capacity/period per second.
+    Consuming more than what is left puts the bucket in debt until it refills.
+    Counters are per process, use PostgresRateLimiter with several workers.
+    """
+
+    def __init__(self, capacity: int, period: float):
+        super().__init__(capacity, period)
+        self.rate = capacity / period
+        self._buckets: Dict[Hashable, Tuple[float, float]] = {}
+        # consume may run on the threadpool
+        self._lock = threading.Lock()
+
+    def _tokens(self, key: Hashable, now: float) -> float:
+        tokens, updated_on = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated_on) * self.rate)
+
+    async def allow(self, key: Hashable) -> bool:
+        return self._tokens(key, time.monotonic()) >= 0
+
+    async def consume(self, key: Hashable, amount: int):
+        with self._lock:
+            now = time.monotonic()
+            self._buckets[key] = (self._tokens(key, now) - amount, now)
+
+
+class SlidingWindowRateLimiter(RateLimiter):
+    """
+    In-process sliding window counter: usage of the current fixed window
+    plus the previous one weighted by how much of it is still in the window.
+    """
+
+    def __init__(self, capacity: int, period: float):
+        super().__init__(capacity, period)
+        self._windows: Dict[Hashable, Tuple[int, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _window(self, key: Hashable, now: float) -> Tuple[int, float, float]:
+        window = int(now // self.period)
+        index, current, previous = self._windows.get(key, (window, 0, 0))
+        if index != window:
+            previous = current if index == window - 1 else 0
+            current = 0
+        return window, current, previous
+
+    def _usage(self, key: Hashable, now: float) -> float:
+        _, current, previous = self._window(key, now)
+        elapsed = (now % self.period) / self.period
+        return current + previous * (1 - elapsed)
+
+    async def allow(self, key: Hashable) -> bool:
+        return self._usage(key, time.monotonic()) <= self.capacity
+
+    async def consume(self, key: Hashable, amount: int):
+        with self._lock:
+            window, current, previous = self._window(key, time.monotonic())
+            self._windows[key] = (window, current + amount, previous)
+
+
+class PostgresRateLimiter(RateLimiter, AppCRUD):
+    """
+    Leaky bucket stored on the user row, shared by every worker.
+    bytes_read_on_last_minute is the bucket level, drained at capacity/period
+    per second since last_download_time. Both operations are a single
+    statement, no row is locked across calls.
+    """
+
+    def __init__(self, db: Session, capacity: int, period: float):
+        RateLimiter.__init__(self, capacity, period)
+        AppCRUD.__init__(self, db)
+        self.rate = capacity / period
+
+    def _level(self):
+        elapsed = func.extract(
+            "epoch", func.localtimestamp() - User.last_download_time
+        )
+        return func.greatest(User.bytes_read_on_last_minute - elapsed * self.rate, 0)
+
+    @instrument_db
+    def _allow(self, key: int) -> bool:
+        level = self.db.query(self._level()).filter(User.id == key).scalar()
+        self.db.commit()
+        return level is not None and level <= self.capacity
+
+    @instrument_db
+    def _consume(self, key: int, amount: int):
+        try:
+            self.db.query(User).filter(User.id == key).update(
+                {
+                    User.bytes_read_on_last_minute: cast(
+                        self._level() + amount, BigInteger
+                    ),
+                    User.last_download_time: func.localtimestamp(),
+                },
+                synchronize_session=False,
+            )
+            self.db.commit()
+        except sqlalchemy.exc.DatabaseError as error:
+            logger.error(f"{error}")
+            self.db.rollback()
+
+    async def allow(self, key: int) -> bool:
+        return await self.run_db(self._allow, key)
+
+    async def consume(self, key: int, amount: int):
+        await self.run_db(self._consume, key, amount)
+
+
+RATE_LIMITERS = {
+    "token_bucket": TokenBucketRateLimiter,
+    "sliding_window": SlidingWindowRateLimiter,
+}
+# in-process limiters have to outlive requests to keep their counters
+_local_rate_limiters: Dict[Tuple[str, str, int, float], RateLimiter] = {}
+
+
+def get_rate_limiter(
+    name: str, backend: str, db: Session, capacity: int, period: float
+) -> RateLimiter:
+    """
+    Rate limiter for the given backend (see Settings.DOWNLOAD_RATE_LIMITER)
+    :param name: what is limited, in-process limiters are shared by name
+    """
+    if backend == "postgres":
+        return PostgresRateLimiter(db, capacity, period)
+
+    key = (name, backend, capacity, period)
+    if key not in _local_rate_limiters:
+        _local_rate_limiters[key] = RATE_LIMITERS[backend](capacity, period)
+    return _local_rate_limiters[key]
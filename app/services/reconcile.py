@@ -0,0 +1,182 @@
+import os
+import time
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from loguru import logger
+from sqlalchemy import cast, String
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.blob import Blob
+from app.models.file import File as FileModel
+from app.services.blob import BlobCRUD
+from app.services.main import AppCRUD
+from app.storage import (
+    LocalStorage,
+    StorageBackend,
+    StoredObject,
+    get_legacy_storage,
+    get_storage,
+)
+from app.utils.compression import storage_key
+from app.utils.merge import sorted_difference
+
+
+class Finding(NamedTuple):
+    area: str  # blobs, legacy (files before the blob store) or staging
+    problem: str  # orphan (object without a row) or missing (row without one)
+    key: str
+    size: Optional[int]
+    action: str  # delete, quarantine, keep (grace period) or none
+    done: bool  # False on dry runs and when the action was called off
+
+
+class ReconcileCRUD(AppCRUD):
+    """
+    Diffs the storages against the DB and gets rid of the orphan objects:
+    blobs without a referenced Blob row, legacy files without a File row and
+    staging files left by uploads that never finished.
+    Objects and rows are both read sorted by key and merge-joined, so memory
+    stays bounded whatever their number.
+    """
+
+    ORPHAN = "orphan"
+    MISSING = "missing"
+
+    def __init__(
+        self,
+        db: Session,
+        quarantine: bool = False,
+        dry_run: bool = True,
+        grace_period: int = None,
+        now: float = None,
+    ):
+        super().__init__(db)
+        self.quarantine = quarantine
+        self.dry_run = dry_run
+        self.grace_period = (
+            settings.RECONCILE_GRACE_PERIOD if grace_period is None else grace_period
+        )
+        self.now = now or time.time()
+
+    def reconcile(self) -> Iterator[Finding]:
+        """
+        Every orphan and missing object, acted on (unless dry_run) as they
+        are found
+        """
+        yield from self._reconcile("blobs", get_storage(), self.iter_blob_keys())
+        yield from self._reconcile(
+            "legacy", get_legacy_storage(), self.iter_legacy_keys()
+        )
+        # no row ever points at a staging file
+        staging = LocalStorage(BlobCRUD.PATH_TO_STAGING, shard_depth=0)
+        yield from self._reconcile("staging", staging, iter(()))
+
+    def iter_blob_keys(self) -> Iterator[str]:
+        """
+        Storage keys of the referenced blobs, sorted. Digests have a fixed
+        length so keys sort like digests, suffix or not.
+        """
+        after = ""
+        while True:
+            rows = (
+                self.db.query(Blob.digest, Blob.encoding)
+                .filter(Blob.ref_count > 0, Blob.digest > after)
+                .order_by(Blob.digest)
+                .limit(settings.RECONCILE_BATCH_SIZE)
+                .all()
+            )
+            # no transaction open while the batch is being diffed
+            self.db.commit()
+            yield from (storage_key(row.digest, row.encoding) for row in rows)
+            if len(rows) < settings.RECONCILE_BATCH_SIZE:
+                return
+            after = rows[-1].digest
+
+    def iter_legacy_keys(self) -> Iterator[str]:
+        """
+        Uris of the files stored before the blob store, sorted as text byte
+        by byte like the storage keys, whatever the DB collation
+        """
+        uri = cast(FileModel.uri, String).collate("C")
+        after = ""
+        while True:
+            rows = (
+                self.db.query(uri)
+                .filter(FileModel.blob_digest.is_(None), uri > after)
+                .order_by(uri)
+                .limit(settings.RECONCILE_BATCH_SIZE)
+                .all()
+            )
+            self.db.commit()
+            yield from (row[0] for row in rows)
+            if len(rows) < settings.RECONCILE_BATCH_SIZE:
+                return
+            after = rows[-1][0]
+
+    def _reconcile(
+        self, area: str, storage: StorageBackend, expected: Iterator[str]
+    ) -> Iterator[Finding]:
+        objects = storage.iter_objects()
+        for stored, key in sorted_difference(
+            objects, expected, left_key=lambda stored: stored.key
+        ):
+            if stored is None:
+                yield Finding(area, self.MISSING, key, None, "none", False)
+            else:
+                yield self._orphan(area, storage, stored)
+
+    def _orphan(
+        self, area: str, storage: StorageBackend, stored: StoredObject
+    ) -> Finding:
+        age = self.now - (stored.modified or self.now)
+        if age < self.grace_period:
+            return Finding(area, self.ORPHAN, stored.key, stored.size, "keep", False)
+
+        action = "quarantine" if self.quarantine else "delete"
+        finding = Finding(area, self.ORPHAN, stored.key, stored.size, action, False)
+        if self.dry_run:
+            return finding
+
+        def remove():
+            if self.quarantine:
+                self._quarantine(area, storage, stored.key)
+            else:
+                storage.delete(stored.key)
+
+        if area != "blobs":
+            remove()
+        elif not self._forget_blob(stored.key, remove):
+            # referenced since it was listed
+            return finding
+        logger.info(f"Reconcile: {action} orphan {area} object {stored.key}")
+        return finding._replace(done=True)
+
+    def _forget_blob(self, key: str, remove: Callable[[], None]) -> bool:
+        """
+        Remove an orphan blob object along with its unreferenced Blob row, if
+        any, the same way reclaim does (see BlobCRUD.delete_unreferenced)
+        :return: False if the blob is referenced in its stored form now
+        """
+        digest = key.split(".", 1)[0]
+        blob = BlobCRUD(self.db).delete_unreferenced(digest, lambda _: remove())
+        if blob is None:
+            return True
+        if storage_key(digest, blob.encoding) == key:
+            return False
+        # a copy in another encoding than the referenced one, nothing reads or
+        # writes it while the stored form is there
+        remove()
+        return True
+
+    @staticmethod
+    def _quarantine(area: str, storage: StorageBackend, key: str):
+        quarantine = LocalStorage(
+            os.path.join(settings.RECONCILE_QUARANTINE_ROOT, area), shard_depth=0
+        )
+        local_path = storage.local_path(key)
+        if local_path:
+            quarantine.put_file(key, local_path)
+        else:
+            quarantine.put_stream(key, storage.get_stream(key))
+            storage.delete(key)
@@ -0,0 +1,180 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from loguru import logger
+from sqlalchemy import func, or_, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.blob import Blob
+from app.models.file import File as FileModel, FileStatus
+from app.services.blob import BlobCRUD
+from app.services.cache import get_metadata_cache
+from app.services.main import AppCRUD
+from app.storage import get_storage
+from app.utils.compression import decompress, storage_key
+from app.utils.metrics import instrument_db
+
+
+class ScrubResult(NamedTuple):
+    digest: str
+    size: int  # stored bytes read
+    # None, missing (no stored object), corrupt or unreadable (storage error)
+    problem: Optional[str]
+
+
+class ScrubCRUD(AppCRUD):
+    """
+    Reads the stored blobs back and checks them against their digest, catches
+    bit rot and lost or truncated objects. Blobs are scrubbed least recently
+    verified first, each at most once every interval, reading rate bytes per
+    second at most.
+    The files of a damaged blob are marked as failed, the stored object is
+    left as it is. A blob the storage fails to read is reported and scrubbed
+    again the next interval.
+    """
+
+    MISSING = "missing"
+    CORRUPT = "corrupt"
+    UNREADABLE = "unreadable"
+    DAMAGED = (MISSING, CORRUPT)
+
+    def __init__(
+        self,
+        db: Session,
+        rate: int = None,
+        interval: int = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        super().__init__(db)
+        self.rate = settings.SCRUB_RATE if rate is None else rate
+        self.interval = settings.SCRUB_INTERVAL if interval is None else interval
+        self.sleep = sleep
+        self._read = 0
+        self._started = time.monotonic()
+
+    def scrub(self) -> Iterator[ScrubResult]:
+        """
+        Every blob due for verification, scrubbed as they are found, until
+        none is due
+        """
+        self._read, self._started = 0, time.monotonic()
+        while True:
+            blobs = self.due_blobs()
+            if not blobs:
+                return
+            for blob in blobs:
+                yield self.scrub_blob(blob.digest, blob.encoding)
+
+    @instrument_db
+    def due_blobs(self) -> List[Row]:
+        """
+        :return: digest and encoding of the next SCRUB_BATCH_SIZE blobs due
+        """
+        verified_before = datetime.now(timezone.utc) - timedelta(
+            seconds=self.interval
+        )
+        blobs = (
+            self.db.query(Blob.digest, Blob.encoding)
+            .filter(
+                Blob.ref_count > 0,
+                or_(Blob.verified_on.is_(None), Blob.verified_on < verified_before),
+            )
+            .order_by(Blob.verified_on.asc().nullsfirst())
+            .limit(settings.SCRUB_BATCH_SIZE)
+            .all()
+        )
+        # no transaction open while the blobs are read
+        self.db.commit()
+        return blobs
+
+    def scrub_blob(self, digest: str, encoding: Optional[str]) -> ScrubResult:
+        try:
+            size, problem = self._verify(digest, encoding)
+        except FileNotFoundError:
+            # deleted after the stat
+            size, problem = 0, self.MISSING
+        except IOError as error:
+            logger.error(f"Scrub: can't read blob {digest}: {error}")
+            size, problem = 0, self.UNREADABLE
+        self.record(digest, problem)
+        return ScrubResult(digest, size, problem)
+
+    def _verify(self, digest: str, encoding: Optional[str]) -> Tuple[int, str]:
+        """
+        :return: stored size and problem of the blob, if any
+        :raise IOError: the storage failed to read it
+        """
+        storage = get_storage()
+        key = storage_key(digest, encoding)
+        stored = storage.stat(key)
+        if not stored:
+            return 0, self.MISSING
+
+        chunks = self._throttle(storage.get_stream(key))
+        if encoding:
+            chunks = decompress(chunks, encoding)
+        file_hash = BlobCRUD.new_hash()
+        try:
+            for chunk in chunks:
+                file_hash.update(chunk)
+        except IOError:
+            # the storage failed, not the content
+            raise
+        except Exception as error:
+            logger.error(f"Scrub: can't decode blob {digest}: {error}")
+            return stored.size, self.CORRUPT
+        if file_hash.hexdigest() != digest:
+            return stored.size, self.CORRUPT
+        return stored.size, None
+
+    @instrument_db
+    def record(self, digest: str, problem: Optional[str]):
+        """
+        Mark the blob as verified, and its files as failed if it's damaged.
+        An unreadable blob is only due again after the interval, like the rest.
+        """
+        self.db.execute(
+            update(Blob.__table__)
+            .where(Blob.digest == digest)
+            .values(verified_on=func.now())
+        )
+        files = []
+        if problem:
+            logger.error(f"Scrub: {problem} blob {digest}")
+        if problem in self.DAMAGED:
+            files = self.db.execute(
+                update(FileModel.__table__)
+                .where(FileModel.blob_digest == digest)
+                .values(status=FileStatus.FAILED)
+                .returning(FileModel.uri, FileModel.name, FileModel.user_id)
+            ).fetchall()
+        self.db.commit()
+
+        cache = get_metadata_cache()
+        for file in files:
+            cache.invalidate(file.user_id, uri=file.uri, name=file.name)
+
+    def _throttle(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Pass the chunks through, sleeping whenever the bytes read since scrub
+        started go over rate per second
+        """
+        for chunk in chunks:
+            yield chunk
+            self._read += len(chunk)
+            if not self.rate:
+                continue
+            ahead = self._read / self.rate - (time.monotonic() - self._started)
+            if ahead > 0:
+                self.sleep(ahead)
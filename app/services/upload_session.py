@@ -0,0 +1,211 @@
+import os
+import uuid
+from typing import AsyncIterator, Optional
+
+import sqlalchemy
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+
+from app import schemas
+from app.models.upload_session import UploadSession, UploadChunk
+from app.services.blob import BlobCRUD
+from app.services.file import FileService, FileCRUD
+from app.services.main import AppService, AppCRUD
+from app.utils.app_exceptions import AppException
+from app.utils.ranges import missing_ranges
+from app.utils.service_result import ServiceResult
+from app.utils.streaming import BufferedWriter, hash_file
+
+
+class UploadSessionService(AppService):
+    """
+    Resumable uploads: create a session, PUT byte ranges in any order and
+    complete it to get a regular File.
+    """
+
+    async def create_session(
+        self, session_create: schemas.UploadSessionCreate
+    ) -> ServiceResult:
+        if session_create.size > FileCRUD.MAX_FILE_SIZE:
+            return ServiceResult(AppException.FileTooLarge(FileCRUD.MAX_FILE_SIZE))
+
+        session = await self.run_db(
+            UploadSessionCRUD(self.db).create_session, session_create
+        )
+        if not session:
+            return ServiceResult(
+                AppException.FileUploaded("Error creating upload session")
+            )
+        return ServiceResult(await self.run_db(self._session_status, session))
+
+    async def get_session(self, session_id: uuid.UUID) -> ServiceResult:
+        session = await self.run_db(UploadSessionCRUD(self.db).get_session, session_id)
+        if not session:
+            return ServiceResult(AppException.UploadSessionNotFound())
+        return ServiceResult(await self.run_db(self._session_status, session))
+
+    async def write_chunk(
+        self,
+        session_id: uuid.UUID,
+        start: int,
+        end: int,
+        total: Optional[int],
+        content: AsyncIterator[bytes],
+    ) -> ServiceResult:
+        """
+        Write the byte range [start, end] of the upload
+        """
+        crud = UploadSessionCRUD(self.db)
+        session = await self.run_db(crud.get_session, session_id)
+        if not session:
+            return ServiceResult(AppException.UploadSessionNotFound())
+
+        if end >= session.size or total not in (None, session.size):
+            return ServiceResult(
+                AppException.InvalidByteRange(f"Upload size is {session.size}")
+            )
+
+        expected_length = end - start + 1
+        try:
+            with open(crud.session_path(session_id), "r+b") as out_file:
+                out_file.seek(start)
+                writer = BufferedWriter(out_file, max_size=expected_length)
+                async for data in content:
+                    await writer.write(data)
+                await writer.flush()
+        except IOError:
+            return ServiceResult(AppException.FileUploaded())
+        except AppException.FileTooLarge:
+            return ServiceResult(
+                AppException.InvalidByteRange("Body larger than Content-Range")
+            )
+
+        written = writer.size
+        if written != expected_length:
+            return ServiceResult(
+                AppException.InvalidByteRange("Body shorter than Content-Range")
+            )
+
+        await self.run_db(crud.add_chunk, session, start, written)
+        return ServiceResult(await self.run_db(self._session_status, session))
+
+    async def complete_session(self, session_id: uuid.UUID) -> ServiceResult:
+        """
+        Validate size and checksum of the staged upload and turn it into a File
+        """
+        crud = UploadSessionCRUD(self.db)
+        session = await self.run_db(crud.get_session, session_id)
+        if not session:
+            return ServiceResult(AppException.UploadSessionNotFound())
+
+        ranges = await self.run_db(crud.get_ranges, session)
+        missing = missing_ranges(session.size, ranges)
+        if missing:
+            return ServiceResult(
+                AppException.UploadIncomplete(sum(length for _, length in missing))
+            )
+
+        staging_path = crud.session_path(session_id)
+        digest = await run_in_threadpool(
+            hash_file, staging_path, BlobCRUD.new_hash()
+        )
+        if session.checksum and session.checksum.lower() != digest:
+            return ServiceResult(
+                AppException.ChecksumMismatch(session.checksum.lower(), digest)
+            )
+
+        result = await FileService(self.db).upload_staged_file(
+            session.name, staging_path, digest, session.size
+        )
+        if result.success:
+            await self.run_db(crud.delete_session, session)
+        return result
+
+    def _session_status(self, session: UploadSession) -> schemas.UploadSession:
+        ranges = UploadSessionCRUD(self.db).get_ranges(session)
+        missing = missing_ranges(session.size, ranges)
+        return schemas.UploadSession(
+            id=session.id,
+            name=session.name,
+            size=session.size,
+            received_bytes=session.size - sum(length for _, length in missing),
+            missing=[
+                schemas.ByteRange(offset=offset, length=length)
+                for offset, length in missing
+            ],
+        )
+
+
+class UploadSessionCRUD(AppCRUD):
+    PATH_TO_SESSIONS = "uploads/sessions/"
+
+    @classmethod
+    def session_path(cls, session_id: uuid.UUID) -> str:
+        return f"{cls.PATH_TO_SESSIONS}{session_id}"
+
+    def create_session(
+        self, session_create: schemas.UploadSessionCreate
+    ) -> UploadSession:
+        session = UploadSession(
+            # suppose only 1 user on the system, otherwise use some auth or
+            # session
+            user_id=1,
+            **session_create.dict(),
+        )
+        try:
+            self.db.add(session)
+            self.db.commit()
+            self.db.refresh(session)
+        except sqlalchemy.exc.DatabaseError as error:
+            logger.error(f"{error}")
+            self.db.rollback()
+            return None
+
+        # sparse file with the final size, chunks are written in place
+        os.makedirs(self.PATH_TO_SESSIONS, exist_ok=True)
+        with open(self.session_path(session.id), "wb") as staged:
+            staged.truncate(session.size)
+
+        return session
+
+    def get_session(self, session_id: uuid.UUID) -> UploadSession:
+        return (
+            self.db.query(UploadSession)
+            .filter(
+                # suppose only 1 user on the system, otherwise use some auth or
+                # session
+                UploadSession.user_id == 1,
+                UploadSession.id == session_id,
+            )
+            .first()
+        )
+
+    def get_ranges(self, session: UploadSession):
+        return (
+            self.db.query(UploadChunk.offset, UploadChunk.length)
+            .filter(UploadChunk.session_id == session.id)
+            .all()
+        )
+
+    def add_chunk(self, session: UploadSession, offset: int, length: int):
+        self.db.add(UploadChunk(session_id=session.id, offset=offset, length=length))
+        try:
+            self.db.commit()
+        except sqlalchemy.exc.DatabaseError as error:
+            logger.error(f"{error}")
+            self.db.rollback()
+
+    def delete_session(self, session: UploadSession):
+        """
+        Remove the session and its staged bytes if they're still around
+        """
+        staging_path = self.session_path(session.id)
+        self.db.delete(session)
+        try:
+            self.db.commit()
+        except sqlalchemy.exc.DatabaseError as error:
+            logger.error(f"{error}")
+            self.db.rollback()
+
+        if os.path.exists(staging_path):
+            os.unlink(staging_path)
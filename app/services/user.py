@@ -1,21 +1,26 @@
-from datetime import datetime
+from typing import Optional, Tuple
 
 import sqlalchemy
 from loguru import logger
+from sqlalchemy import update
 
+from app.core.config import settings
 from app.models.user import User
 from app.schemas.user import (
     UserCreate,
-    UserIncreaseFileCount,
+    UserQuotaReservation,
     UpdateUserDownloadStats,
 )
 from app.services.main import AppService, AppCRUD
+from app.services.rate_limiter import RateLimiter, get_rate_limiter
 from app.utils.app_exceptions import AppException
+from app.utils.metrics import instrument_db
 from app.utils.service_result import ServiceResult
 
 
 class UserService(AppService):
     MAX_FILES_PER_USER = 2
+    MAX_BYTES_PER_USER = 1024 * 1024 * 1024  # 1 GB
     MAX_BYTES_PER_MINUTE = 1024 * 1024  # 1 MB
 
     def create_user(self, user: UserCreate) -> ServiceResult:
@@ -26,73 +31,104 @@ class UserService(AppService):
             )
         return ServiceResult(new_user)
 
-    def can_upload_files(self, user: User, lock_user=False):
+    def can_upload_files(self, user: User, size: int = 0) -> bool:
         """
-        Checks if the user is able to upload files.
+        Checks if the user has room for one more file of the given size.
 
-        Current restriction is 99 files per user
+        Current restrictions are MAX_FILES_PER_USER files and
+        MAX_BYTES_PER_USER bytes per user, uploads in progress included.
 
-        This method will lock the user on the DB. So should be followed
-        by a commit somewhere.
+        Plain read, nothing is locked nor reserved. Use reserve_upload to
+        actually hold the quota.
         """
-        files_count = UserCRUD(self.db).get_files_count_per_user(user.id)
-
-        if not lock_user:
-            self.db.commit()
+        usage = UserCRUD(self.db).get_quota_usage(user.id)
+        self.db.commit()
+        if not usage:
+            return False
 
-        return files_count < self.MAX_FILES_PER_USER
+        files, bytes_used = usage
+        return (
+            files + 1 <= self.MAX_FILES_PER_USER
+            and bytes_used + size <= self.MAX_BYTES_PER_USER
+        )
 
-    def can_download_files(self, user: User, lock_user=False):
+    def reserve_upload(self, reservation: UserQuotaReservation) -> ServiceResult:
         """
-        Checks if the user is able to upload files.
-
-        Current restrictions:
-            - 1MB per minute
-
-        This method will lock the user on the DB. So should be followed
-        by a commit somewhere.
+        Hold quota for an upload before streaming it, with a single
+        conditional UPDATE. Must be followed by commit_upload or
+        release_upload.
         """
-        user = UserCRUD(self.db).get_user(user.id)
-
-        if not lock_user:
-            self.db.commit()
+        reserved = UserCRUD(self.db).reserve_quota(
+            reservation, self.MAX_FILES_PER_USER, self.MAX_BYTES_PER_USER
+        )
+        if reserved is None:
+            return ServiceResult(AppException.FileUploaded("Error reserving quota"))
 
-        last_download_on_last_minute = (
-            datetime.now() - user.last_download_time
-        ).seconds < 60
+        if not reserved:
+            return ServiceResult(self._quota_exceeded(reservation))
 
-        if not last_download_on_last_minute:
-            UserCRUD(self.db).reset_bytes_counter(user)
-            return True
+        return ServiceResult(reservation)
 
-        return user.bytes_read_on_last_minute <= self.MAX_BYTES_PER_MINUTE
+    def _quota_exceeded(self, reservation: UserQuotaReservation):
+        """
+        Which limit a reservation that didn't fit goes over, checked against
+        the current usage
+        """
+        usage = UserCRUD(self.db).get_quota_usage(reservation.user_id)
+        self.db.commit()
+        if not usage or usage[0] + reservation.files > self.MAX_FILES_PER_USER:
+            return AppException.TooManyFilesPerUser(self.MAX_FILES_PER_USER)
+        # the bytes, or usage went down since the reservation was tried
+        return AppException.UploadBytesQuotaExceeded(self.MAX_BYTES_PER_USER)
+
+    def commit_upload(
+        self, reservation: UserQuotaReservation, size: int, files: int = None
+    ):
+        """
+        The upload was stored, turn its reservation into used quota
+        :param size: actual size of the file, may be below the reserved bytes
+        :param files: files actually stored if below the reserved ones (batch
+        uploads), whatever wasn't stored is released
+        """
+        UserCRUD(self.db).commit_quota(reservation, size or 0, files)
 
-    def increase_file_count(
-        self, increase_amount: UserIncreaseFileCount
-    ) -> ServiceResult:
+    def release_upload(self, reservation: UserQuotaReservation):
         """
-        Increase the number of files a user has
-        There's a limitation of 99 files per user, check this beforehand
-        :param increase_amount: UserIncreaseFileCount payload
+        Nothing new was stored, give the reserved quota back
         """
-        # suppose only 1 user on the system, otherwise use some auth
-        increase_amount.user_id = 1
+        UserCRUD(self.db).release_quota(reservation)
 
-        result = UserCRUD(self.db).increase_file_count(increase_amount)
+    async def can_download_files(self, user: User) -> bool:
+        """
+        Checks if the user is able to download files.
 
-        if not result:
-            return ServiceResult(
-                AppException.UserCreate(
-                    context={"error": "Error increasing file count"}
-                )
-            )
-        return ServiceResult(result)
+        Current restrictions:
+            - 1MB per minute
+
+        Backed by the configured rate limiter, no user row is locked.
+        """
+        return await self.download_rate_limiter().allow(user.id)
+
+    def download_rate_limiter(self) -> RateLimiter:
+        return get_rate_limiter(
+            "download_bytes",
+            settings.DOWNLOAD_RATE_LIMITER,
+            self.db,
+            self.MAX_BYTES_PER_MINUTE,
+            60,
+        )
 
-    def update_download_stats(self, user_payload: UpdateUserDownloadStats):
-        UserCRUD(self.db).update_last_download_stats(user_payload)
+    async def update_download_stats(self, user_payload: UpdateUserDownloadStats):
+        """
+        Charge the downloaded bytes to the user rate limit
+        """
+        await self.download_rate_limiter().consume(
+            user_payload.user_id, user_payload.bytes
+        )
 
 
 class UserCRUD(AppCRUD):
+    @instrument_db
     def create_user(self, user_create: UserCreate) -> User:
         user = User(**user_create.dict())
         self.db.add(user)
@@ -104,67 +140,99 @@ class UserCRUD(AppCRUD):
             user = None
         return user
 
+    @instrument_db
     def get_user(self, user_id: int) -> User:
-        return self.db.query(User).filter(User.id == user_id).with_for_update().first()
+        return self.db.query(User).filter(User.id == user_id).first()
 
-    def increase_file_count(self, user_payload: UserIncreaseFileCount) -> User:
-        result = (
-            self.db.query(User)
-            .filter(User.id == user_payload.user_id)
-            .update({User.files_uploaded: User.files_uploaded + 1})
+    @instrument_db
+    def get_quota_usage(self, user_id: int) -> Optional[Tuple[int, int]]:
+        """
+        Files and bytes used by the user, uploads in progress included
+        """
+        return (
+            self.db.query(
+                User.files_uploaded + User.files_reserved,
+                User.bytes_uploaded + User.bytes_reserved,
+            )
+            .filter(User.id == user_id)
+            .first()
         )
 
-        try:
-            self.db.commit()
-        except sqlalchemy.exc.DatabaseError as error:
-            logger.error(f"{error}")
-            result = None
-        self.db.commit()
-
-        return result
-
-    def get_files_count_per_user(self, user_id: int) -> int:
+    @instrument_db
+    def reserve_quota(
+        self, reservation: UserQuotaReservation, max_files: int, max_bytes: int
+    ) -> Optional[bool]:
         """
-        Obtain the files uploaded per user.
-        NOTE: keep in mind this function locks the user row in particular
-        until the transaction ends.
-
-        Without db.commit() somewhere this could lead to a permanent locked row
-        on the DB
+        Reserve files and bytes only if they fit in the limits.
+        Single UPDATE ... RETURNING committed straight away, the user row is
+        only locked for the duration of the statement.
+        :return: if the quota was reserved, None on DB error
         """
-        try:
-            return (
-                self.db.query(User.files_uploaded)
-                .filter(User.id == user_id)
-                .with_for_update()
-                .first()[0]
+        stmt = (
+            update(User)
+            .where(
+                User.id == reservation.user_id,
+                User.files_uploaded + User.files_reserved + reservation.files
+                <= max_files,
+                User.bytes_uploaded + User.bytes_reserved + reservation.bytes
+                <= max_bytes,
             )
-        except TypeError:
-            # on error unlock
-            self.db.commit()
-
-    def update_last_download_stats(self, user_payload: UpdateUserDownloadStats):
-        user = self.get_user(user_id=user_payload.user_id)
-        user.bytes_read_on_last_minute += user_payload.bytes
-        user.last_download_time = datetime.now()
-
+            .values(
+                files_reserved=User.files_reserved + reservation.files,
+                bytes_reserved=User.bytes_reserved + reservation.bytes,
+            )
+            .returning(User.id)
+        )
         try:
+            reserved = self.db.execute(stmt).first() is not None
             self.db.commit()
-            self.db.refresh(user)
         except sqlalchemy.exc.DatabaseError as error:
             logger.error(f"{error}")
+            self.db.rollback()
             return None
 
-        return user
+        return reserved
+
+    @instrument_db
+    def commit_quota(
+        self, reservation: UserQuotaReservation, size: int, files: int = None
+    ):
+        self._update_quota(
+            reservation.user_id,
+            files_reserved=User.files_reserved - reservation.files,
+            bytes_reserved=User.bytes_reserved - reservation.bytes,
+            files_uploaded=User.files_uploaded
+            + (reservation.files if files is None else files),
+            bytes_uploaded=User.bytes_uploaded + size,
+        )
 
-    def reset_bytes_counter(self, user: User):
-        user.bytes_read_on_last_minute = 0
+    @instrument_db
+    def release_quota(self, reservation: UserQuotaReservation):
+        self._update_quota(
+            reservation.user_id,
+            files_reserved=User.files_reserved - reservation.files,
+            bytes_reserved=User.bytes_reserved - reservation.bytes,
+        )
+
+    def charge_usage(self, user_id: int, files: int, size: int):
+        """
+        Add (or with negative values give back) used quota outside of a
+        reservation, e.g. deleted or overwritten files.
+        This method doesn't commit, it's part of the caller transaction.
+        """
+        self.db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(
+                files_uploaded=User.files_uploaded + files,
+                bytes_uploaded=User.bytes_uploaded + size,
+            )
+        )
 
+    def _update_quota(self, user_id: int, **values):
         try:
+            self.db.execute(update(User).where(User.id == user_id).values(**values))
             self.db.commit()
-            self.db.refresh(user)
         except sqlalchemy.exc.DatabaseError as error:
             logger.error(f"{error}")
-            return None
-
-        return user
+            self.db.rollback()
@@ -0,0 +1,39 @@
+from functools import lru_cache
+
+from app.core.config import settings
+from app.storage.base import StorageBackend, StorageError, StoredObject
+from app.storage.local import LocalStorage
+
+
+@lru_cache()
+def get_storage() -> StorageBackend:
+    """
+    Blob storage configured through Settings.STORAGE_BACKEND
+    """
+    if settings.STORAGE_BACKEND == "s3":
+        # boto3 is only needed with the s3 backend
+        from app.storage.s3 import S3Storage
+
+        return S3Storage(
+            settings.S3_BUCKET,
+            part_size=settings.S3_PART_SIZE,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            region_name=settings.S3_REGION,
+        )
+
+    return LocalStorage(
+        settings.STORAGE_LOCAL_ROOT,
+        settings.STORAGE_SHARD_DEPTH,
+        durability=settings.STORAGE_DURABILITY,
+    )
+
+
+@lru_cache()
+def get_legacy_storage() -> StorageBackend:
+    """
+    Flat uploads/ directory holding the files stored before the blob store,
+    keyed by file uri
+    """
+    return LocalStorage("uploads/", shard_depth=0)
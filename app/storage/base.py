@@ -0,0 +1,86 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+
+class StorageError(IOError):
+    """
+    Storage backend failure, an IOError so callers handle it like disk errors
+    """
+
+
+class StoredObject(NamedTuple):
+    key: str
+    size: int
+    modified: Optional[float] = None  # unix time, when listed
+
+
+class StorageBackend(ABC):
+    """
+    Where blob content lives. Keys are opaque strings, blob digests.
+
+    Methods are blocking, call them from the threadpool.
+    """
+
+    @abstractmethod
+    def put_file(self, key: str, path: str, sync: bool = True):
+        """
+        Store the local file at path under key. The local file is consumed,
+        it doesn't exist anymore once this returns.
+        :param sync: False to leave the object to a later sync call, so the
+        objects of a batch are made durable at once
+        """
+
+    @abstractmethod
+    def put_stream(self, key: str, chunks: Iterable[bytes], sync: bool = True):
+        pass
+
+    def sync(self, keys: Iterable[str]):
+        """
+        Make the objects put with sync=False durable. Nothing to do for
+        backends whose puts are durable once they return.
+        """
+
+    @abstractmethod
+    def get_stream(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """
+        Content of the object, or only its [start, end] byte range
+        (end inclusive)
+        """
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[StoredObject]:
+        """
+        :return: None if there's no object under key
+        """
+
+    @abstractmethod
+    def iter_objects(self) -> Iterator[StoredObject]:
+        """
+        Every object sorted by key, listed lazily so memory doesn't grow with
+        the number of objects
+        """
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    @abstractmethod
+    def delete(self, key: str):
+        """
+        Remove the object, missing objects are ignored
+        """
+
+    def presigned_url(self, key: str, expires_in: int) -> Optional[str]:
+        """
+        Short lived url where the object can be downloaded straight from the
+        backend, None if the backend can't serve it by itself
+        """
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """
+        Path of the object on the local filesystem if the backend has one,
+        lets downloads use FileResponse (and sendfile)
+        """
+        return None
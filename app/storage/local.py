@@ -0,0 +1,162 @@
+import errno
+import os
+import uuid
+from typing import Iterable, Iterator, List, Optional
+
+from app.storage.base import StorageBackend, StoredObject
+from app.utils.streaming import iter_file_range
+
+COPY_SIZE = 1024 * 1024  # chunks of the copies between filesystems
+
+
+class LocalStorage(StorageBackend):
+    """
+    Objects stored as files under root, sharded in nested directories by the
+    key prefix (`ab/cd/abcd...` with the default depth of 2) so no directory
+    ends up holding millions of entries.
+
+    Objects are written aside and renamed to their key, so a key never points
+    at partial content. The durability level sets what reaches the disk
+    before put_* returns, see Settings.STORAGE_DURABILITY.
+    """
+
+    DURABILITY_LEVELS = ("none", "data", "full")
+
+    def __init__(
+        self,
+        root: str,
+        shard_depth: int = 2,
+        shard_width: int = 2,
+        durability: str = "none",
+    ):
+        if durability not in self.DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability level {durability}")
+        self.root = root
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+        self.durability = durability
+
+    def path(self, key: str) -> str:
+        shards = [
+            key[level * self.shard_width : (level + 1) * self.shard_width]
+            for level in range(self.shard_depth)
+        ]
+        return os.path.join(self.root, *shards, key)
+
+    def put_file(self, key: str, path: str, sync: bool = True):
+        object_path = self.path(key)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        if self.durability != "none":
+            # the content is on disk before the rename, a crash never leaves
+            # a truncated object under its key
+            fsync_path(path)
+        try:
+            # same filesystem, the move is atomic
+            os.replace(path, object_path)
+        except OSError as error:
+            if error.errno != errno.EXDEV:
+                raise
+            with open(path, "rb") as in_file:
+                self._write(object_path, iter(lambda: in_file.read(COPY_SIZE), b""))
+            os.unlink(path)
+        if sync:
+            self.sync([key])
+
+    def put_stream(self, key: str, chunks: Iterable[bytes], sync: bool = True):
+        object_path = self.path(key)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        self._write(object_path, chunks)
+        if sync:
+            self.sync([key])
+
+    def _write(self, object_path: str, chunks: Iterable[bytes]):
+        tmp_path = f"{object_path}.{uuid.uuid4()}.tmp"
+        try:
+            with open(tmp_path, "wb") as out_file:
+                for chunk in chunks:
+                    out_file.write(chunk)
+                if self.durability != "none":
+                    out_file.flush()
+                    os.fsync(out_file.fileno())
+            os.replace(tmp_path, object_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def sync(self, keys: Iterable[str]):
+        """
+        With full durability, fsync the directories of the objects so their
+        renames survive a crash, each directory once however many keys
+        it holds
+        """
+        if self.durability != "full":
+            return
+        directories = set()
+        for key in keys:
+            directories.update(self._directories(key))
+        # deepest first, a shard shows up in its parent once it's synced
+        for directory in sorted(
+            directories, key=lambda directory: (-directory.count(os.sep), directory)
+        ):
+            fsync_path(directory)
+
+    def _directories(self, key: str) -> List[str]:
+        """
+        Directory of the object and its shard directories up to root
+        """
+        directory = os.path.dirname(self.path(key))
+        directories = [directory]
+        for _ in range(self.shard_depth):
+            directory = os.path.dirname(directory)
+            directories.append(directory)
+        return directories
+
+    def get_stream(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        object_path = self.path(key)
+        if end is None:
+            end = os.path.getsize(object_path) - 1
+        return iter_file_range(object_path, start, end)
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            return StoredObject(key=key, size=os.stat(self.path(key)).st_size)
+        except FileNotFoundError:
+            return None
+
+    def iter_objects(self) -> Iterator[StoredObject]:
+        # shards are key prefixes, walking them in order lists keys in order
+        return self._iter_directory(self.root, self.shard_depth)
+
+    def _iter_directory(self, path: str, depth: int) -> Iterator[StoredObject]:
+        try:
+            entries = sorted(os.scandir(path), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if depth and entry.is_dir(follow_symlinks=False):
+                yield from self._iter_directory(entry.path, depth - 1)
+            elif not depth and entry.is_file(follow_symlinks=False):
+                stat = entry.stat()
+                yield StoredObject(entry.name, stat.st_size, stat.st_mtime)
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.path(key)
+
+
+def fsync_path(path: str):
+    """
+    Flush a file or a directory to disk, any descriptor of it does
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
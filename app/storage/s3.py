@@ -0,0 +1,135 @@
+import os
+from typing import Iterable, Iterator, Optional
+
+import boto3
+
+from app.storage.base import StorageBackend, StorageError, StoredObject
+
+S3_MIN_PART_SIZE = 5 * 1024 * 1024  # every part but the last one
+
+
+class S3Storage(StorageBackend):
+    """
+    Objects stored in an S3 compatible bucket (AWS, MinIO...). Large objects
+    are sent with multipart uploads, part_size bytes per part.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        client=None,
+        part_size: int = 8 * 1024 * 1024,
+        read_chunk_size: int = 1024 * 1024,
+        **client_kwargs,
+    ):
+        self.bucket = bucket
+        self.client = client or boto3.client("s3", **client_kwargs)
+        self.part_size = max(part_size, S3_MIN_PART_SIZE)
+        self.read_chunk_size = read_chunk_size
+
+    def put_file(self, key: str, path: str, sync: bool = True):
+        with open(path, "rb") as in_file:
+            self.put_stream(key, iter(lambda: in_file.read(self.part_size), b""))
+        os.unlink(path)
+
+    def put_stream(self, key: str, chunks: Iterable[bytes], sync: bool = True):
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(
+                            Bucket=self.bucket, Key=key
+                        )["UploadId"]
+                    part, buffer = buffer[: self.part_size], buffer[self.part_size :]
+                    parts.append(
+                        self._upload_part(key, upload_id, len(parts) + 1, part)
+                    )
+
+            if upload_id is None:
+                # small object, a single request
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=bytes(buffer))
+                return
+
+            if buffer:
+                parts.append(self._upload_part(key, upload_id, len(parts) + 1, buffer))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except self.client.exceptions.ClientError as error:
+            if upload_id is not None:
+                self.client.abort_multipart_upload(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id
+                )
+            raise StorageError(f"{error}")
+
+    def _upload_part(self, key: str, upload_id: str, number: int, data) -> dict:
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=number,
+            Body=bytes(data),
+        )
+        return {"ETag": response["ETag"], "PartNumber": number}
+
+    def get_stream(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        kwargs = {"Bucket": self.bucket, "Key": key}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+        return self._iter_object(kwargs)
+
+    def _iter_object(self, get_object_kwargs: dict) -> Iterator[bytes]:
+        # generator, the request is only sent once iteration starts so it
+        # runs on the threadpool with the rest of the response body
+        try:
+            body = self.client.get_object(**get_object_kwargs)["Body"]
+        except self.client.exceptions.ClientError as error:
+            raise StorageError(f"{error}")
+        yield from body.iter_chunks(self.read_chunk_size)
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return None
+            raise StorageError(f"{error}")
+        return StoredObject(key=key, size=response["ContentLength"])
+
+    def iter_objects(self) -> Iterator[StoredObject]:
+        # S3 lists keys in UTF-8 binary order, a page at a time
+        kwargs = {"Bucket": self.bucket}
+        while True:
+            try:
+                page = self.client.list_objects_v2(**kwargs)
+            except self.client.exceptions.ClientError as error:
+                raise StorageError(f"{error}")
+            for item in page.get("Contents", []):
+                yield StoredObject(
+                    item["Key"], item["Size"], item["LastModified"].timestamp()
+                )
+            if not page.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+    def presigned_url(self, key: str, expires_in: int) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=expires_in,
+        )
+
+    def delete(self, key: str):
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.ClientError as error:
+            raise StorageError(f"{error}")
@@ -3,10 +3,11 @@ from starlette.responses import JSONResponse
 
 
 class AppExceptionCase(Exception):
-    def __init__(self, status_code: int, context: dict):
+    def __init__(self, status_code: int, context: dict, headers: dict = None):
         self.exception_case = self.__class__.__name__
         self.status_code = status_code
         self.context = context
+        self.headers = headers
 
     def __str__(self):
         return (
@@ -22,6 +23,7 @@ async def app_exception_handler(request: Request, exc: AppExceptionCase):
             "app_exception": exc.exception_case,
             "context": exc.context,
         },
+        headers=exc.headers,
     )
 
 
@@ -35,6 +37,15 @@ class AppException(object):
             context = {"error": f"Error uploading the file. {more_context}"}
             AppExceptionCase.__init__(self, status_code, context)
 
+    class FileDeletion(AppExceptionCase):
+        def __init__(self):
+            """
+            File deletion failed
+            """
+            status_code = 500
+            context = {"error": "Error deleting the file"}
+            AppExceptionCase.__init__(self, status_code, context)
+
     class FileTooLarge(AppExceptionCase):
         def __init__(self, max_size: int):
             """
@@ -53,6 +64,15 @@ class AppException(object):
             context = {"error": f"File rejected, too many files already ({max_files})"}
             AppExceptionCase.__init__(self, status_code, context)
 
+    class UploadBytesQuotaExceeded(AppExceptionCase):
+        def __init__(self, max_bytes: int):
+            """
+            User storage quota exceeded
+            """
+            status_code = 400
+            context = {"error": f"File rejected, storage quota of {max_bytes} bytes"}
+            AppExceptionCase.__init__(self, status_code, context)
+
     class DownloadBytesRateLimit(AppExceptionCase):
         def __init__(self):
             """
@@ -89,3 +109,90 @@ class AppException(object):
             context = {"error": f"Reached maximum files per user: {max_files}"}
             status_code = 400
             AppExceptionCase.__init__(self, status_code, context)
+
+    class UploadSessionNotFound(AppExceptionCase):
+        def __init__(self):
+            """
+            Resumable upload session not found
+            """
+            status_code = 404
+            context = {"error": "Upload session not found"}
+            AppExceptionCase.__init__(self, status_code, context)
+
+    class InvalidByteRange(AppExceptionCase):
+        def __init__(self, more_context: str = None):
+            """
+            Chunk byte range doesn't fit in the upload
+            """
+            status_code = 416
+            context = {"error": f"Invalid byte range. {more_context}"}
+            AppExceptionCase.__init__(self, status_code, context)
+
+    class UploadIncomplete(AppExceptionCase):
+        def __init__(self, missing_bytes: int):
+            """
+            Upload session completed before receiving every byte
+            """
+            status_code = 409
+            context = {"error": f"Upload incomplete, {missing_bytes} bytes missing"}
+            AppExceptionCase.__init__(self, status_code, context)
+
+    class ChecksumMismatch(AppExceptionCase):
+        def __init__(self, expected: str, received: str):
+            """
+            Uploaded content doesn't match the checksum sent by the client
+            """
+            status_code = 400
+            context = {
+                "error": "Checksum mismatch",
+                "expected": expected,
+                "received": received,
+            }
+            AppExceptionCase.__init__(self, status_code, context)
+
+    class InvalidChecksum(AppExceptionCase):
+        def __init__(self, more_context: str = None):
+            """
+            Checksum header of an upload that can't be decoded
+            """
+            status_code = 400
+            context = {"error": f"Invalid checksum. {more_context}"}
+            AppExceptionCase.__init__(self, status_code, context)
+
+    class RangeNotSatisfiable(AppExceptionCase):
+        def __init__(self, size: int):
+            """
+            Requested byte range is outside of the file
+            """
+            status_code = 416
+            context = {"error": "Range not satisfiable", "size": size}
+            # the current size, so the client can fix its range (RFC 7233)
+            headers = {"Content-Range": f"bytes */{size}"}
+            AppExceptionCase.__init__(self, status_code, context, headers)
+
+    class InvalidSignature(AppExceptionCase):
+        def __init__(self):
+            """
+            Signed download url tampered with or expired
+            """
+            status_code = 403
+            context = {"error": "Invalid or expired download url"}
+            AppExceptionCase.__init__(self, status_code, context)
+
+    class InvalidCursor(AppExceptionCase):
+        def __init__(self):
+            """
+            Pagination cursor can't be decoded
+            """
+            status_code = 400
+            context = {"error": "Invalid pagination cursor"}
+            AppExceptionCase.__init__(self, status_code, context)
+
+    class TooManyFilesInArchive(AppExceptionCase):
+        def __init__(self, max_files: int):
+            """
+            Archive download matching too many files
+            """
+            status_code = 400
+            context = {"error": f"Archives can hold up to {max_files} files"}
+            AppExceptionCase.__init__(self, status_code, context)
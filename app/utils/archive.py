@@ -0,0 +1,103 @@
+import io
+import tarfile
+import time
+import zipfile
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+
+class ArchiveEntry(NamedTuple):
+    name: str
+    size: int
+    modified: Optional[datetime]
+    chunks: Callable[[], Iterator[bytes]]  # content, read when it's archived
+
+
+class _Sink(io.RawIOBase):
+    """
+    Unseekable file object collecting what an archive writer outputs until
+    it's handed to the response
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def safe_name(name: str) -> str:
+    """
+    Archive member name that can't be extracted outside of the target
+    directory
+    """
+    name = name.replace("/", "_").replace("\\", "_")
+    return "_" + name if name in ("", ".", "..") else name
+
+
+def iter_zip(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """
+    Zip archive (stored, zip64 when needed) written on the fly, chunk by
+    chunk, whatever the number and size of the entries. Blocking generator,
+    StreamingResponse iterates it on the threadpool.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for entry in entries:
+            info = zipfile.ZipInfo(safe_name(entry.name), _zip_date_time(entry))
+            # known upfront so zip64 extra fields are only used when needed
+            info.file_size = entry.size
+            with archive.open(info, mode="w") as member:
+                for chunk in entry.chunks():
+                    member.write(chunk)
+                    yield sink.pop()
+            yield sink.pop()
+    yield sink.pop()
+
+
+def _zip_date_time(entry: ArchiveEntry) -> tuple:
+    modified = entry.modified.timetuple() if entry.modified else time.localtime()
+    # zip dates start in 1980
+    return max(tuple(modified[:6]), (1980, 1, 1, 0, 0, 0))
+
+
+def iter_tar(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """
+    POSIX (pax) tar archive written on the fly. Headers are built with
+    tarfile and the content is copied as is, tarfile.addfile would buffer
+    whole members.
+    """
+    written = 0
+    for entry in entries:
+        info = tarfile.TarInfo(safe_name(entry.name))
+        info.size = entry.size
+        info.mtime = entry.modified.timestamp() if entry.modified else time.time()
+        header = info.tobuf(tarfile.PAX_FORMAT)
+        yield header
+        written += len(header)
+
+        remaining = entry.size
+        for chunk in entry.chunks():
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+        if remaining:
+            # the content is shorter than announced, keep the archive valid
+            yield bytes(remaining)
+        padding = -entry.size % tarfile.BLOCKSIZE
+        yield bytes(padding)
+        written += entry.size + padding
+
+    # end of archive: two empty blocks, padded to a whole record
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(written + end) % tarfile.RECORDSIZE
+    yield bytes(end)
@@ -0,0 +1,96 @@
+import base64
+import binascii
+import hashlib
+import re
+from typing import Dict, Optional
+
+from app.utils.app_exceptions import AppException
+
+ALGORITHMS = {"md5": hashlib.md5, "sha256": hashlib.sha256}
+# algorithm names of the Digest header (RFC 3230), the others are ignored
+DIGEST_ALGORITHMS = {"md5": "md5", "sha-256": "sha256"}
+HEX_DIGEST = {
+    "md5": re.compile(r"^[0-9a-f]{32}$"),
+    "sha256": re.compile(r"^[0-9a-f]{64}$"),
+}
+
+
+def parse_checksums(
+    content_md5: Optional[str] = None,
+    digest: Optional[str] = None,
+    checksum_sha256: Optional[str] = None,
+) -> Dict[str, str]:
+    """
+    Checksums sent by the client along with the content: `Content-MD5`
+    (base64), `Digest` (e.g. `sha-256=<base64>, md5=<base64>`) and
+    `X-Checksum-Sha256` (hex or base64)
+    :return: expected hex digest by algorithm
+    :raise AppException.InvalidChecksum: malformed or conflicting values
+    """
+    checksums = {}
+    if content_md5:
+        _add(checksums, "md5", _decode(content_md5, "md5"))
+    for item in (digest or "").split(","):
+        name, _, value = item.strip().partition("=")
+        algorithm = DIGEST_ALGORITHMS.get(name.lower())
+        if algorithm:
+            _add(checksums, algorithm, _decode(value, algorithm))
+    if checksum_sha256:
+        value = checksum_sha256.strip().lower()
+        if not HEX_DIGEST["sha256"].match(value):
+            value = _decode(checksum_sha256, "sha256")
+        _add(checksums, "sha256", value)
+    return checksums
+
+
+def _decode(value: str, algorithm: str) -> str:
+    try:
+        hex_digest = base64.b64decode(value.strip(), validate=True).hex()
+    except (binascii.Error, ValueError):
+        hex_digest = None
+    if not hex_digest or not HEX_DIGEST[algorithm].match(hex_digest):
+        raise AppException.InvalidChecksum(f"Malformed {algorithm} checksum")
+    return hex_digest
+
+
+def _add(checksums: Dict[str, str], algorithm: str, hex_digest: str):
+    if checksums.setdefault(algorithm, hex_digest) != hex_digest:
+        raise AppException.InvalidChecksum(f"Conflicting {algorithm} checksums")
+
+
+class ContentHash(object):
+    """
+    sha256 of an upload (its blob digest) plus the algorithms the client sent
+    checksums with, all fed in the same pass that writes the content.
+    Stands in for the hashlib object of app.utils.streaming writers.
+    """
+
+    def __init__(self, expected: Dict[str, str] = None):
+        self.expected = expected or {}
+        self.hashes = {"sha256": hashlib.sha256()}
+        for algorithm in self.expected:
+            self.hashes.setdefault(algorithm, ALGORITHMS[algorithm]())
+
+    def update(self, data):
+        for file_hash in self.hashes.values():
+            file_hash.update(data)
+
+    def hexdigest(self) -> str:
+        return self.hashes["sha256"].hexdigest()
+
+    def hexdigests(self) -> Dict[str, str]:
+        return {
+            algorithm: file_hash.hexdigest()
+            for algorithm, file_hash in self.hashes.items()
+        }
+
+    def verify(self) -> Dict[str, str]:
+        """
+        :return: hex digest by algorithm
+        :raise AppException.ChecksumMismatch: content doesn't match a checksum
+        """
+        hexdigests = self.hexdigests()
+        for algorithm, expected in self.expected.items():
+            if hexdigests[algorithm] != expected:
+                raise AppException.ChecksumMismatch(expected, hexdigests[algorithm])
+        return hexdigests
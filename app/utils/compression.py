@@ -0,0 +1,130 @@
+import os
+import zlib
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional
+
+from app.core.config import settings
+
+# storage key suffix of the blobs stored with each encoding, so the encoding
+# of a stored blob can always be told from its key
+ENCODINGS = {"gzip": ".gz", "zstd": ".zst"}
+
+# magic numbers of formats that are already compressed
+COMPRESSED_SIGNATURES = (
+    b"\x1f\x8b",  # gzip
+    b"\x28\xb5\x2f\xfd",  # zstd
+    b"PK\x03\x04",  # zip, docx, jar...
+    b"BZh",  # bzip2
+    b"\xfd7zXZ\x00",  # xz
+    b"7z\xbc\xaf\x27\x1c",  # 7z
+    b"Rar!",  # rar
+    b"\x89PNG",  # png
+    b"\xff\xd8\xff",  # jpeg
+    b"GIF8",  # gif
+    b"OggS",  # ogg
+    b"ID3",  # mp3
+    b"fLaC",  # flac
+)
+SAMPLE_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def storage_key(digest: str, encoding: Optional[str] = None) -> str:
+    return digest + ENCODINGS[encoding] if encoding else digest
+
+
+def is_compressible(path: str) -> bool:
+    """
+    Cheap guess of whether a file is worth compressing: it doesn't start with
+    the signature of a compressed format and a sample of it shrinks enough
+    at the fastest zlib level
+    """
+    with open(path, "rb") as in_file:
+        sample = in_file.read(SAMPLE_SIZE)
+    if not sample or sample.startswith(COMPRESSED_SIGNATURES):
+        return False
+    # mp4, mov, webp, webm... carry their signature after a few bytes
+    if sample[4:8] == b"ftyp" or sample[8:12] in (b"WEBP", b"AVI "):
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * (
+        settings.STORAGE_COMPRESSION_MIN_RATIO
+    )
+
+
+def compress_file(path: str, encoding: str) -> Optional[str]:
+    """
+    Compress path next to it when it's worth it.
+    Blocking and CPU bound, zlib and zstd release the GIL while compressing.
+    :return: path of the compressed copy, None if the file is kept as is
+    """
+    if not is_compressible(path):
+        return None
+
+    compressed_path = path + ENCODINGS[encoding]
+    compressor = _compressor(encoding)
+    raw_size = compressed_size = 0
+    try:
+        with open(path, "rb") as in_file, open(compressed_path, "wb") as out_file:
+            while chunk := in_file.read(CHUNK_SIZE):
+                raw_size += len(chunk)
+                compressed_size += out_file.write(compressor.compress(chunk))
+            compressed_size += out_file.write(compressor.flush())
+    except IOError:
+        os.unlink(compressed_path)
+        raise
+
+    if compressed_size >= raw_size * settings.STORAGE_COMPRESSION_MIN_RATIO:
+        os.unlink(compressed_path)
+        return None
+    return compressed_path
+
+
+def decompress(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Decompress a stream of chunks on the fly
+    """
+    decompressor = _decompressor(encoding)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if encoding == "gzip":
+        data = decompressor.flush()
+        if data:
+            yield data
+
+
+def accepts_encoding(accept_encoding: Optional[str], encoding: str) -> bool:
+    """
+    Whether an `Accept-Encoding` request header accepts the encoding
+    """
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in (encoding, "*"):
+            continue
+        quality = params.strip().partition("q=")[2]
+        try:
+            return not quality or float(quality) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def _compressor(encoding: str):
+    if encoding == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    return _zstd().ZstdCompressor().compressobj()
+
+
+def _decompressor(encoding: str):
+    if encoding == "gzip":
+        return zlib.decompressobj(31)
+    return _zstd().ZstdDecompressor().decompressobj()
+
+
+@lru_cache()
+def _zstd():
+    # zstandard is only needed with STORAGE_COMPRESSION=zstd
+    import zstandard
+
+    return zstandard
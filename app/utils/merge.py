@@ -0,0 +1,33 @@
+from typing import Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+Left = TypeVar("Left")
+Right = TypeVar("Right")
+
+_END = object()
+
+
+def sorted_difference(
+    left: Iterable[Left],
+    right: Iterable[Right],
+    left_key: Callable[[Left], str] = lambda item: item,
+    right_key: Callable[[Right], str] = lambda item: item,
+) -> Iterator[Tuple[Optional[Left], Optional[Right]]]:
+    """
+    Merge-join of two sequences sorted by key, holding a single item of each
+    at a time whatever their length. Keys must be unique on each side.
+    :return: (item, None) for the items only on the left, (None, item) for
+    the ones only on the right
+    """
+    left, right = iter(left), iter(right)
+    left_item, right_item = next(left, _END), next(right, _END)
+    while left_item is not _END or right_item is not _END:
+        if right_item is _END or (
+            left_item is not _END and left_key(left_item) < right_key(right_item)
+        ):
+            yield left_item, None
+            left_item = next(left, _END)
+        elif left_item is _END or right_key(right_item) < left_key(left_item):
+            yield None, right_item
+            right_item = next(right, _END)
+        else:
+            left_item, right_item = next(left, _END), next(right, _END)
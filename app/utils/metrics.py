@@ -0,0 +1,189 @@
+import contextvars
+import functools
+import os
+import time
+from typing import Callable
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time until the last byte of the response is sent",
+    ["method", "route", "status"],
+)
+BYTES_UPLOADED = Counter("uploaded_bytes_total", "Bytes of new files stored")
+BYTES_DOWNLOADED = Counter("downloaded_bytes_total", "Bytes of files served")
+UPLOAD_STAGE_SECONDS = Histogram(
+    "upload_stage_duration_seconds",
+    "Time spent on each stage of an upload: spool (receive, hash and write "
+    "to staging), publish (move to the storage), db_insert and quota",
+    ["stage"],
+)
+JOB_SECONDS = Histogram(
+    "job_duration_seconds", "Time running background jobs", ["kind", "result"]
+)
+DB_QUERIES = Counter("db_queries_total", "Statements sent to the DB", ["call"])
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Statement execution time, row lock waits included",
+    ["call"],
+)
+DB_POOL_CHECKOUTS = Counter(
+    "db_pool_checkouts_total", "Connections checked out from the pool"
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_duration_seconds",
+    "Time to get a connection from the pool, opening a new one included",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out from the pool",
+    multiprocess_mode="livesum",
+)
+
+# CRUD method the statements run on behalf of, see instrument_db
+_db_call = contextvars.ContextVar("db_call", default="other")
+
+
+def instrument_db(func: Callable) -> Callable:
+    """
+    Label the statements run by a CRUD method with its name on the db_*
+    metrics
+    """
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _db_call.set(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _db_call.reset(token)
+
+    return wrapper
+
+
+def register_db_metrics(engine: Engine):
+    # the start time goes with the statement's execution context, nothing is
+    # left behind on the connection when the statement fails
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        context.query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - context.query_start
+        call = _db_call.get()
+        DB_QUERIES.labels(call).inc()
+        DB_QUERY_SECONDS.labels(call).observe(elapsed)
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc()
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool observing DB_POOL_WAIT_SECONDS, a growing wait means the pool
+    is too small for the load (or connections are held for too long)
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
+class MetadataCacheCollector(object):
+    """
+    Exposes the MetadataCache counters
+    """
+
+    def collect(self):
+        from app.services.cache import get_metadata_cache
+
+        counter = CounterMetricFamily(
+            "metadata_cache_lookups", "Metadata cache lookups", labels=["result"]
+        )
+        for result, value in get_metadata_cache().stats().items():
+            counter.add_metric([result], value)
+        yield counter
+
+
+REGISTRY.register(MetadataCacheCollector())
+
+
+class MetricsMiddleware(object):
+    """
+    Observes REQUEST_SECONDS per route template, until the response body is
+    completely sent so streamed downloads are fully accounted
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_SECONDS.labels(
+                scope["method"], self._route(scope), status
+            ).observe(time.perf_counter() - start)
+
+    @staticmethod
+    def _route(scope: Scope) -> str:
+        # the template, not the path, keeps the label cardinality bounded
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+
+def metrics_response() -> Response:
+    """
+    Metrics in the Prometheus text format. With several worker processes set
+    PROMETHEUS_MULTIPROC_DIR so every process is aggregated, custom
+    collectors like the metadata cache one are per process and left out.
+    """
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,23 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Tuple
+
+from app.utils.app_exceptions import AppException
+
+
+def encode_cursor(uploaded_on: datetime, uri: uuid.UUID) -> str:
+    """
+    Opaque cursor pointing right after the given (uploaded_on, uri) key
+    """
+    key = json.dumps([uploaded_on.isoformat(), str(uri)])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        uploaded_on, uri = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(uploaded_on), uuid.UUID(uri)
+    except (ValueError, TypeError):
+        raise AppException.InvalidCursor()
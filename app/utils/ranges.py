@@ -0,0 +1,85 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_content_range(header: str) -> Optional[Tuple[int, int, Optional[int]]]:
+    """
+    Parse a `Content-Range: bytes start-end/total` request header
+    :return: (start, end, total) with end inclusive, total None if unknown.
+        None if the header is malformed
+    """
+    match = CONTENT_RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    start, end, total = match.groups()
+    start, end = int(start), int(end)
+    if end < start:
+        return None
+    return start, end, None if total == "*" else int(total)
+
+
+def missing_ranges(
+    size: int, received: Iterable[Tuple[int, int]]
+) -> List[Tuple[int, int]]:
+    """
+    Gaps not covered by the received (offset, length) ranges, which may
+    overlap and come in any order
+    :return: sorted list of missing (offset, length)
+    """
+    missing = []
+    position = 0
+    for offset, length in sorted(received):
+        if offset > position:
+            missing.append((position, offset - position))
+        position = max(position, offset + length)
+
+    if position < size:
+        missing.append((position, size - position))
+    return missing
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `Range: bytes=start-end` request header, suffix ranges
+    (`bytes=-500`) and open ranges (`bytes=500-`) included.
+    Multiple ranges aren't supported and are ignored like malformed headers,
+    the whole file is served in that case (allowed by RFC 7233).
+    :return: (start, end) with end inclusive, None to serve the whole file
+    :raise ValueError: if the range can't be satisfied for the given size
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        if int(end) == 0:
+            raise ValueError(header)
+        return max(size - int(end), 0), size - 1
+
+    start = int(start)
+    if end and int(end) < start:
+        # invalid, ignored
+        return None
+    if start >= size:
+        raise ValueError(header)
+    end = int(end) if end else size - 1
+    return start, min(end, size - 1)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """
+    Whether an `If-None-Match` header matches the etag (weak comparison)
+    """
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
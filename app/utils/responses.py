@@ -0,0 +1,119 @@
+import os
+from typing import Iterator, Optional
+
+from starlette.responses import (
+    FileResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+
+from app.core.config import settings
+from app.schemas import FileDownload
+from app.storage import StorageBackend, get_legacy_storage, get_storage
+from app.utils.compression import decompress
+from app.utils.signing import sign_url
+from app.utils.streaming import slice_chunks
+
+
+def file_download_response(
+    download: FileDownload, offload: bool = True
+) -> Response:
+    """
+    Build the response for an authorized download: 304, 206 or the whole file,
+    handed to the web server or the storage when DOWNLOAD_OFFLOAD is set
+    :param offload: False to serve it from the app in any case, e.g. for the
+    signed urls the app hands out itself
+    """
+    storage = get_legacy_storage() if download.legacy else get_storage()
+    headers = {"Accept-Ranges": "bytes"}
+    if download.etag:
+        headers["ETag"] = download.etag
+
+    if download.encoding:
+        headers["Vary"] = "Accept-Encoding"
+
+    if download.not_modified:
+        return Response(status_code=304, headers=headers)
+
+    # compressed blobs are decoded by the app
+    offload = offload and not download.legacy and not download.encoding
+    if offload and settings.DOWNLOAD_OFFLOAD != "none":
+        response = offload_response(download, storage, headers)
+        if response:
+            return response
+
+    headers["Content-Length"] = str(download.length)
+    if download.passthrough:
+        headers["Content-Encoding"] = download.encoding
+
+    if download.partial:
+        headers["Content-Range"] = (
+            f"bytes {download.start}-{download.end}/{download.size}"
+        )
+        return StreamingResponse(
+            _content(storage, download, download.start, download.end),
+            status_code=206,
+            headers=headers,
+            media_type="application/octet-stream",
+        )
+
+    local_path = storage.local_path(download.key)
+    if local_path and (download.passthrough or not download.encoding):
+        return FileResponse(local_path, headers=headers)
+
+    return StreamingResponse(
+        _content(storage, download),
+        headers=headers,
+        media_type="application/octet-stream",
+    )
+
+
+def _content(
+    storage: StorageBackend, download: FileDownload, start: int = 0, end: int = None
+) -> Iterator[bytes]:
+    if not download.encoding or download.passthrough:
+        return storage.get_stream(download.key, start, end)
+    # the stored bytes don't map to the content ones, decode from the start
+    chunks = decompress(storage.get_stream(download.key), download.encoding)
+    return slice_chunks(chunks, start, end) if start or end is not None else chunks
+
+
+def offload_response(
+    download: FileDownload, storage: StorageBackend, headers: dict
+) -> Optional[Response]:
+    """
+    Response telling the web server or the client where to get the bytes, so
+    the worker doesn't stream them. The web server / storage handles Range
+    requests by itself, the client sends its Range header again.
+    :return: None if the download can't be offloaded with the current setup
+    """
+    local_path = storage.local_path(download.key)
+
+    if settings.DOWNLOAD_OFFLOAD == "signed-url":
+        url = storage.presigned_url(download.key, settings.DOWNLOAD_SIGNED_URL_TTL)
+        if not url and local_path and settings.DOWNLOAD_SIGNING_KEY:
+            url = sign_url(
+                settings.DOWNLOAD_SIGNED_URL_BASE + _relative_path(local_path),
+                settings.DOWNLOAD_SIGNING_KEY,
+                settings.DOWNLOAD_SIGNED_URL_TTL,
+            )
+        return url and RedirectResponse(url, status_code=307, headers=headers)
+
+    if not local_path:
+        return None
+
+    if settings.DOWNLOAD_OFFLOAD == "x-accel-redirect":
+        headers["X-Accel-Redirect"] = (
+            settings.DOWNLOAD_ACCEL_PREFIX + _relative_path(local_path)
+        )
+    elif settings.DOWNLOAD_OFFLOAD == "x-sendfile":
+        headers["X-Sendfile"] = os.path.abspath(local_path)
+    else:
+        return None
+
+    return Response(headers=headers, media_type="application/octet-stream")
+
+
+def _relative_path(local_path: str) -> str:
+    return os.path.relpath(local_path, settings.STORAGE_LOCAL_ROOT)
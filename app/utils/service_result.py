@@ -1,6 +1,10 @@
+import random
+import sys
+from types import FrameType
+
 from loguru import logger
-import inspect
 
+from app.core.config import settings
 from app.utils.app_exceptions import AppExceptionCase
 
 
@@ -33,15 +37,34 @@ class ServiceResult(object):
         pass
 
 
-def caller_info() -> str:
-    info = inspect.getframeinfo(inspect.stack()[2][0])
-    return f"{info.filename}:{info.function}:{info.lineno}"
+def caller_info(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_filename}:{code.co_name}:{frame.f_lineno}"
+
+
+def should_log(exception: AppExceptionCase) -> bool:
+    """
+    Server errors are always logged, client errors (rate limited, not
+    found...) only a ERROR_LOG_SAMPLE_RATE fraction of them
+    """
+    if exception.status_code >= 500 or settings.ERROR_LOG_SAMPLE_RATE >= 1:
+        return True
+    return random.random() < settings.ERROR_LOG_SAMPLE_RATE
 
 
 def handle_result(result: ServiceResult):
     if not result.success:
         with result as exception:
-            logger.error(f"{exception} | caller={caller_info()}")
+            if should_log(exception):
+                # only the frame is grabbed here, it's formatted if a sink
+                # actually writes the record
+                frame = sys._getframe(1)
+                logger.bind(
+                    exception_case=exception.exception_case,
+                    status_code=exception.status_code,
+                ).opt(lazy=True).error(
+                    "{} | caller={}", lambda: exception, lambda: caller_info(frame)
+                )
             raise exception
     with result as result:
         return result
@@ -0,0 +1,30 @@
+import hashlib
+import hmac
+import time
+from urllib.parse import urlencode
+
+
+def _signature(path: str, expires: int, key: str) -> str:
+    message = f"{path}:{expires}".encode()
+    return hmac.new(key.encode(), message, hashlib.sha256).hexdigest()
+
+
+def sign_url(path: str, key: str, expires_in: int, now: float = None) -> str:
+    """
+    Short lived url for path, signed with HMAC-SHA256 so it can be served
+    without asking the DB, see the signed blob download endpoint
+    """
+    expires = int(now or time.time()) + expires_in
+    query = urlencode({"expires": expires, "signature": _signature(path, expires, key)})
+    return f"{path}?{query}"
+
+
+def verify_signature(
+    path: str, expires: int, signature: str, key: str, now: float = None
+) -> bool:
+    """
+    Counterpart of sign_url for the endpoint serving the signed urls
+    """
+    if expires < (now or time.time()):
+        return False
+    return hmac.compare_digest(_signature(path, expires, key), signature)
@@ -0,0 +1,150 @@
+import os
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.utils.app_exceptions import AppException
+
+
+def adaptive_buffer_size(total_size: Optional[int] = None) -> int:
+    """
+    Buffer size for an upload of the given size, around 8 writes per file
+    clamped between UPLOAD_MIN_BUFFER_SIZE and UPLOAD_MAX_BUFFER_SIZE
+    """
+    if not total_size:
+        return settings.UPLOAD_MIN_BUFFER_SIZE
+    return min(
+        max(total_size // 8, settings.UPLOAD_MIN_BUFFER_SIZE),
+        settings.UPLOAD_MAX_BUFFER_SIZE,
+    )
+
+
+def file_size(source: BinaryIO) -> int:
+    """
+    Size of a seekable file object, leaving it at the start
+    """
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def copy_to_disk(source: BinaryIO, path: str, file_hash, max_size: int) -> int:
+    """
+    Copy a seekable file object (e.g. the spooled file of an UploadFile) to
+    path, hashing it on the same pass.
+    Blocking, meant to run on the threadpool as a whole so an upload costs
+    one thread round trip instead of one per chunk.
+    :return: bytes written
+    """
+    total_size = file_size(source)
+    if total_size > max_size:
+        raise AppException.FileTooLarge(max_size)
+
+    buffer = bytearray(adaptive_buffer_size(total_size))
+    view = memoryview(buffer)
+    written = 0
+    with open(path, "wb") as out_file:
+        while read := source.readinto(buffer):
+            written += read
+            if written > max_size:
+                raise AppException.FileTooLarge(max_size)
+            file_hash.update(view[:read])
+            out_file.write(view[:read])
+
+    return written
+
+
+def hash_file(path: str, file_hash, buffer_size: int = None) -> str:
+    """
+    Hash a file already on disk. Blocking, run it on the threadpool
+    :return: hex digest
+    """
+    buffer = bytearray(buffer_size or settings.UPLOAD_MAX_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb") as in_file:
+        while read := in_file.readinto(buffer):
+            file_hash.update(view[:read])
+    return file_hash.hexdigest()
+
+
+class BufferedWriter(object):
+    """
+    Async writer for streamed uploads (e.g. request bodies) whose chunks are
+    usually small. Chunks are coalesced in memory and flushed, hashed and
+    written on the threadpool once the buffer is full.
+    """
+
+    def __init__(
+        self,
+        out_file: BinaryIO,
+        file_hash=None,
+        max_size: int = None,
+        buffer_size: int = None,
+    ):
+        self.out_file = out_file
+        self.file_hash = file_hash
+        self.max_size = max_size
+        self.buffer_size = buffer_size or adaptive_buffer_size(max_size)
+        self.size = 0
+        self._buffer = bytearray()
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise AppException.FileTooLarge(self.max_size)
+
+        self._buffer += data
+        if len(self._buffer) >= self.buffer_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        data, self._buffer = self._buffer, bytearray()
+        await run_in_threadpool(self._write, data)
+
+    def _write(self, data: bytearray):
+        if self.file_hash is not None:
+            self.file_hash.update(data)
+        self.out_file.write(data)
+
+
+def iter_file_range(
+    path: str, start: int, end: int, chunk_size: int = None
+) -> Iterator[bytes]:
+    """
+    Read the [start, end] byte range of a file in chunks. Blocking generator,
+    StreamingResponse iterates it on the threadpool
+    """
+    chunk_size = chunk_size or settings.UPLOAD_MIN_BUFFER_SIZE
+    remaining = end - start + 1
+    with open(path, "rb") as in_file:
+        in_file.seek(start)
+        while remaining > 0:
+            chunk = in_file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def slice_chunks(
+    chunks: Iterable[bytes], start: int, end: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    The [start, end] byte range of a stream of chunks, end inclusive
+    """
+    position = 0
+    for chunk in chunks:
+        chunk_start, position = position, position + len(chunk)
+        if position <= start:
+            continue
+        if end is not None and chunk_start > end:
+            break
+        yield chunk[
+            max(start - chunk_start, 0) : None if end is None else end - chunk_start + 1
+        ]
+        if end is not None and position > end:
+            break
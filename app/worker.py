@@ -0,0 +1,92 @@
+"""
+Job queue workers, run next to the API:
+
+    python -m app.worker --processes 4
+
+Every process runs one job at a time, so the number of processes is the
+number of jobs running at the same time.
+"""
+import argparse
+import multiprocessing
+import signal
+import threading
+
+from loguru import logger
+
+from app.core.config import settings
+from app.db.database import SessionLocal, engine
+from app.services.jobs import JobCRUD
+
+# registers the handlers of the jobs enqueued by the services
+import app.services.file  # noqa: F401
+
+
+def work(stop: threading.Event, poll_interval: float):
+    """
+    Claim and run due jobs until stop is set, waiting poll_interval when
+    there's nothing to do
+    """
+    # connections opened by the parent can't be shared with the children
+    engine.dispose()
+    db = SessionLocal()
+    jobs = JobCRUD(db)
+    try:
+        while not stop.is_set():
+            try:
+                claimed = jobs.claim()
+            except Exception as error:
+                logger.error(f"Can't claim jobs: {error}")
+                db.rollback()
+                claimed = []
+
+            for job in claimed:
+                try:
+                    jobs.run(job)
+                except Exception as error:
+                    # the job stays claimed until JOB_TIMEOUT
+                    logger.error(f"Job {job.id} not recorded: {error}")
+                    db.rollback()
+
+            if not claimed:
+                stop.wait(poll_interval)
+    finally:
+        db.close()
+
+
+def _process(poll_interval: float):
+    stop = threading.Event()
+    # finish the running job before leaving
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    work(stop, poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--processes", type=int, default=settings.JOB_WORKER_PROCESSES
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=settings.JOB_POLL_INTERVAL
+    )
+    args = parser.parse_args()
+
+    processes = [
+        multiprocessing.Process(target=_process, args=(args.poll_interval,))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def terminate(*_):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Load benchmark of the DB access path: blocking psycopg2 calls made straight
+from the event loop (how services used to query) against the same calls
+offloaded to the threadpool with DBSessionContext.run_db.
+
+Needs the Postgres of docker-compose, run it inside the app container:
+
+    python -m benchmarks.bench_db_layer --requests 2000 --concurrency 50
+
+Every simulated request opens a session, lists the user files and closes
+the session. Reports requests per second, p50/p99 latency and the worst
+event loop stall measured by a ticker coroutine.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.db.database import SessionLocal
+from app.services.file import FileCRUD
+
+
+async def loop_lag(stop: asyncio.Event, interval: float = 0.001) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def request(offload: bool, latencies: list):
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        crud = FileCRUD(db)
+        if offload:
+            await crud.run_db(crud.get_files, None)
+        else:
+            crud.get_files(None)
+    finally:
+        db.close()
+    latencies.append(time.perf_counter() - started)
+
+
+async def bench(offload: bool, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def limited():
+        async with semaphore:
+            await request(offload, latencies)
+
+    stop = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(limited() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return requests / elapsed, quantiles[49], quantiles[98], await lag
+
+
+async def main(requests: int, concurrency: int):
+    for name, offload in (("sync", False), ("threadpool", True)):
+        rps, p50, p99, lag = await bench(offload, requests, concurrency)
+        print(
+            f"{name:>10}: {rps:8.1f} req/s  p50={p50 * 1000:7.2f}ms  "
+            f"p99={p99 * 1000:7.2f}ms  max loop stall={lag * 1000:7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
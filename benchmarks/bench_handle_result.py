@@ -0,0 +1,81 @@
+"""
+Micro-benchmark of handle_result: success results against failed ones, and
+the failure path against the previous inspect.stack() based caller lookup.
+
+    python -m benchmarks.bench_handle_result
+    python -m benchmarks.bench_handle_result --number 1000
+
+Records go to a sink that formats the bare message and drops it, so the
+numbers are the cost of the error path itself (caller lookup, record,
+raising), not of the I/O of whatever sink is configured in production.
+"sampled out" is a client error skipped by ERROR_LOG_SAMPLE_RATE.
+Reports microseconds per call. By default each case runs as many calls as
+fit in about 0.2 s (timeit autorange), the legacy lookup is thousands of
+times slower than a success so a fixed number doesn't suit every case.
+
+Failures aren't anywhere near as cheap as successes: a logged failure
+measured ~29us per call against ~0.5us for a success (~2us sampled out),
+the legacy lookup ~2ms. Raising and recording the error is most of it,
+fine for errors but not something to use for regular control flow.
+"""
+import argparse
+import inspect
+import timeit
+
+from loguru import logger
+
+from app.core.config import settings
+from app.utils.app_exceptions import AppException
+from app.utils.service_result import ServiceResult, handle_result
+
+
+def legacy_handle_result(result: ServiceResult):
+    if not result.success:
+        with result as exception:
+            info = inspect.getframeinfo(inspect.stack()[1][0])
+            caller = f"{info.filename}:{info.function}:{info.lineno}"
+            logger.error(f"{exception} | caller={caller}")
+            raise exception
+    with result as result:
+        return result
+
+
+def endpoint(handle, result: ServiceResult):
+    try:
+        return handle(result)
+    except AppException.FileNotFound:
+        return None
+
+
+def main(number: int):
+    logger.remove()
+    logger.add(lambda message: None, format="{message}")
+
+    success = ServiceResult("file")
+    failure = ServiceResult(AppException.FileNotFound())
+    cases = (
+        ("success", handle_result, success),
+        ("failure", handle_result, failure),
+        ("legacy failure", legacy_handle_result, failure),
+    )
+    for name, handle, result in cases:
+        report(name, lambda: endpoint(handle, result), number)
+
+    settings.ERROR_LOG_SAMPLE_RATE = 0
+    report("sampled out", lambda: endpoint(handle_result, failure), number)
+
+
+def report(name: str, call, number: int = None):
+    timer = timeit.Timer(call)
+    number = number or timer.autorange()[0]
+    seconds = min(timer.repeat(number=number, repeat=5))
+    print(f"{name:>15}: {seconds / number * 1e6:8.2f}us per call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--number", type=int, help="calls per repeat, scaled to each case if unset"
+    )
+    args = parser.parse_args()
+    main(args.number)
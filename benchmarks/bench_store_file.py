@@ -0,0 +1,118 @@
+"""
+Compare the legacy upload copy loop (1 KB chunks, one aiofiles write per
+chunk) with app.utils.streaming.copy_to_disk.
+
+Run it from the project root inside the app container:
+
+    python -m benchmarks.bench_store_file --size-mb 30 --rounds 5
+
+Reports MB/s and the number of read calls on the uploaded file and write
+calls on the stored one per upload, which are the read and write syscalls
+on the upload path.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+import aiofiles
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.streaming import copy_to_disk
+
+
+class CountingFile(object):
+    """
+    File object proxy counting read and write calls
+    """
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+        self.reads = 0
+        self.writes = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if name in ("read", "readinto"):
+            return self._counted(attr, "reads")
+        if name == "write":
+            return self._counted(attr, "writes")
+        return attr
+
+    def _counted(self, method, counter: str):
+        def counted(*args, **kwargs):
+            setattr(self, counter, getattr(self, counter) + 1)
+            return method(*args, **kwargs)
+
+        return counted
+
+    def __enter__(self):
+        self.wrapped.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.wrapped.__exit__(*exc_info)
+
+
+async def legacy_store(source: CountingFile, path: str) -> CountingFile:
+    # copy of the loop FileCRUD._store_file_on_disk used to run
+    async with aiofiles.open(path, "wb") as out_file:
+        destination = CountingFile(out_file)
+        while content := await run_in_threadpool(source.read, 1024):
+            await destination.write(content)
+    return destination
+
+
+async def streaming_store(source: CountingFile, path: str) -> CountingFile:
+    destinations = []
+
+    def counting_open(*args, **kwargs):
+        destinations.append(CountingFile(open(*args, **kwargs)))
+        return destinations[-1]
+
+    # copy_to_disk opens the stored file itself
+    with patch("app.utils.streaming.open", counting_open, create=True):
+        await run_in_threadpool(
+            copy_to_disk, source, path, hashlib.sha256(), 1024 ** 4
+        )
+    return destinations[0]
+
+
+async def bench(store, size: int, rounds: int, workdir: str):
+    elapsed = 0.0
+    reads = writes = 0
+    for _ in range(rounds):
+        with tempfile.TemporaryFile(dir=workdir) as spooled:
+            spooled.write(os.urandom(size))
+            spooled.seek(0)
+            source = CountingFile(spooled)
+            started = time.perf_counter()
+            destination = await store(source, os.path.join(workdir, "out"))
+            elapsed += time.perf_counter() - started
+            reads += source.reads
+            writes += destination.writes
+    return size * rounds / elapsed / 1024 ** 2, reads / rounds, writes / rounds
+
+
+async def main(size_mb: int, rounds: int):
+    size = size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, store in (("legacy", legacy_store), ("streaming", streaming_store)):
+            mb_per_second, reads, writes = await bench(
+                store, size, rounds, workdir
+            )
+            print(
+                f"{name:>10}: {mb_per_second:8.1f} MB/s "
+                f"{reads:8.0f} reads {writes:8.0f} writes per upload"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.size_mb, args.rounds))
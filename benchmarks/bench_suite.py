@@ -0,0 +1,398 @@
+"""
+Benchmark suite of the upload, listing and download paths, run against the
+real app and the Postgres of docker-compose. Run it inside the app container:
+
+    python -m benchmarks.bench_suite --output results.json
+    python -m benchmarks.bench_suite --baseline baseline.json --tolerance 0.15
+
+Without --base-url the app is served by uvicorn in a child process with the
+user quota and download rate limits lifted, so they don't cap the numbers.
+With --base-url that server is used as it is, limits included. The library
+of the listing scenario is seeded straight in the DB, the DB has to be the
+one of the server either way.
+
+Scenarios, all of them on user 1 and cleaning up after themselves:
+
+- upload: MB/s by file size (median of the rounds)
+- list: first page and whole NDJSON listing latency by library size
+- download: aggregate MB/s of concurrent clients downloading the same file
+- contention: uploads and deletes per second of N concurrent clients on the
+  same user, they all update the same quota row
+
+Results are written as JSON. With --baseline every metric is compared with
+it and the exit code is 1 if any is worse by more than --tolerance.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import aiohttp
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.file import File as FileModel
+from benchmarks import results
+from benchmarks.results import Metric
+
+PREFIX = "__bench__"
+MB = 1024 * 1024
+
+
+class Client(object):
+    """
+    The files API over HTTP
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, base_url: str):
+        self.session = session
+        self.files_url = f"{base_url}{settings.API_V1_STR}/files/"
+        self.base_url = base_url
+
+    async def upload(
+        self, name: str, content: bytes, overwrite: bool = False
+    ) -> Tuple[int, Optional[str]]:
+        """
+        :return: status code and download path of the file
+        """
+        form = aiohttp.FormData()
+        form.add_field("file", content, filename=name)
+        params = {"overwrite": "true"} if overwrite else None
+        async with self.session.post(
+            self.files_url, data=form, params=params
+        ) as response:
+            if response.status != 201:
+                return response.status, None
+            return response.status, (await response.json())["uri"]
+
+    async def download(self, path: str) -> int:
+        size = 0
+        async with self.session.get(self.base_url + path) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(MB):
+                size += len(chunk)
+        return size
+
+    async def delete(self, path: str) -> int:
+        async with self.session.delete(self.base_url + path) as response:
+            return response.status
+
+    async def list(self, params: dict, ndjson: bool = False) -> int:
+        headers = {"Accept": "application/x-ndjson"} if ndjson else None
+        async with self.session.get(
+            self.files_url, params=params, headers=headers
+        ) as response:
+            response.raise_for_status()
+            return len(await response.read())
+
+
+def _size_label(size: int) -> str:
+    return f"{size // MB}MB" if size >= MB else f"{size // 1024}KB"
+
+
+def _percentile(values: List[float], percentile: int) -> float:
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100)[percentile - 1]
+
+
+async def bench_upload(client: Client, sizes: List[int], rounds: int):
+    metrics = []
+    for size in sizes:
+        name = f"{PREFIX}upload-{size}"
+        elapsed, path = [], None
+        for _ in range(rounds):
+            # new content every round, nothing is deduplicated
+            content = os.urandom(size)
+            started = time.perf_counter()
+            status, path = await client.upload(name, content, overwrite=True)
+            elapsed.append(time.perf_counter() - started)
+            if status != 201:
+                raise RuntimeError(f"Upload failed with {status}")
+        await client.delete(path)
+        metrics.append(
+            Metric(
+                f"upload.{_size_label(size)}.mb_per_s",
+                size / statistics.median(elapsed) / MB,
+                "MB/s",
+                "higher",
+            )
+        )
+    return metrics
+
+
+def _seed_library(start: int, end: int, batch_size: int = 5000):
+    db = SessionLocal()
+    try:
+        for batch in range(start, end, batch_size):
+            db.execute(
+                insert(FileModel).values(
+                    [
+                        dict(name=f"{PREFIX}list-{i:08d}", user_id=1, size=0)
+                        for i in range(batch, min(batch + batch_size, end))
+                    ]
+                )
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _drop_library():
+    db = SessionLocal()
+    try:
+        db.query(FileModel).filter(
+            FileModel.user_id == 1, FileModel.name.startswith(f"{PREFIX}list-")
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def bench_list(client: Client, library_sizes: List[int], rounds: int):
+    metrics = []
+    params = {"name_prefix": f"{PREFIX}list-", "limit": 100}
+    seeded = 0
+    try:
+        for library_size in sorted(library_sizes):
+            _seed_library(seeded, library_size)
+            seeded = library_size
+
+            for ndjson, scenario in ((False, "first_page"), (True, "ndjson_all")):
+                elapsed = []
+                for _ in range(rounds):
+                    started = time.perf_counter()
+                    await client.list(params, ndjson)
+                    elapsed.append(time.perf_counter() - started)
+                metrics.append(
+                    Metric(
+                        f"list.{library_size}.{scenario}.p50_ms",
+                        statistics.median(elapsed) * 1000,
+                        "ms",
+                        "lower",
+                    )
+                )
+    finally:
+        _drop_library()
+    return metrics
+
+
+async def bench_download(client: Client, size: int, clients: int, rounds: int):
+    status, path = await client.upload(f"{PREFIX}download", os.urandom(size), True)
+    if status != 201:
+        raise RuntimeError(f"Upload failed with {status}")
+
+    latencies = []
+
+    async def downloader():
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await client.download(path)
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(downloader() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.delete(path)
+
+    label = f"download.{_size_label(size)}.c{clients}"
+    return [
+        Metric(
+            f"{label}.mb_per_s",
+            size * clients * rounds / elapsed / MB,
+            "MB/s",
+            "higher",
+        ),
+        Metric(
+            f"{label}.p50_ms", statistics.median(latencies) * 1000, "ms", "lower"
+        ),
+    ]
+
+
+async def bench_contention(client: Client, concurrency: int, uploads: int):
+    latencies, paths, errors = [], [], 0
+
+    async def uploader(worker: int):
+        nonlocal errors
+        for i in range(uploads):
+            started = time.perf_counter()
+            status, path = await client.upload(
+                f"{PREFIX}contention-{worker}-{i}", os.urandom(4096)
+            )
+            latencies.append(time.perf_counter() - started)
+            if path:
+                paths.append(path)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(uploader(worker) for worker in range(concurrency)))
+    upload_elapsed = time.perf_counter() - started
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete(path: str):
+        async with semaphore:
+            return await client.delete(path)
+
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(delete(path) for path in paths))
+    delete_elapsed = time.perf_counter() - started
+    errors += sum(status != 204 for status in statuses)
+
+    label = f"contention.c{concurrency}"
+    return [
+        Metric(
+            f"{label}.uploads_per_s",
+            concurrency * uploads / upload_elapsed,
+            "req/s",
+            "higher",
+        ),
+        Metric(
+            f"{label}.upload_p99_ms",
+            _percentile(latencies, 99) * 1000,
+            "ms",
+            "lower",
+        ),
+        Metric(
+            f"{label}.deletes_per_s", len(paths) / delete_elapsed, "req/s", "higher"
+        ),
+        Metric(f"{label}.errors", errors, "count", "lower"),
+    ]
+
+
+def _serve(port: int):
+    import uvicorn
+
+    from app.main import app
+    from app.services.user import UserService
+
+    # the limits would cap every scenario after a few requests
+    UserService.MAX_FILES_PER_USER = 10 ** 9
+    UserService.MAX_BYTES_PER_USER = 2 ** 62
+    UserService.MAX_BYTES_PER_MINUTE = 2 ** 62
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{base_url}/metrics"):
+                    return
+            except aiohttp.ClientConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def run(args) -> List[Metric]:
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        port = _free_port()
+        server = multiprocessing.Process(target=_serve, args=(port,), daemon=True)
+        server.start()
+        base_url = f"http://127.0.0.1:{port}"
+
+    metrics = []
+    try:
+        await _wait_for(base_url)
+        timeout = aiohttp.ClientTimeout(total=None)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(
+            timeout=timeout, connector=connector
+        ) as session:
+            client = Client(session, base_url)
+            scenarios = args.scenarios
+            if "upload" in scenarios:
+                metrics += await bench_upload(
+                    client, [kb * 1024 for kb in args.upload_kb], args.rounds
+                )
+            if "list" in scenarios:
+                metrics += await bench_list(client, args.library_sizes, args.rounds)
+            if "download" in scenarios:
+                for clients in args.concurrency:
+                    metrics += await bench_download(
+                        client, args.download_kb * 1024, clients, args.rounds
+                    )
+            if "contention" in scenarios:
+                for concurrency in args.concurrency:
+                    metrics += await bench_contention(
+                        client, concurrency, args.rounds
+                    )
+    finally:
+        if server:
+            server.terminate()
+            server.join()
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--base-url", help="server to benchmark, e.g. http://app:80")
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=["upload", "list", "download", "contention"],
+        choices=["upload", "list", "download", "contention"],
+    )
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument(
+        "--upload-kb", type=int, nargs="+", default=[64, 1024, 8 * 1024, 30 * 1024]
+    )
+    parser.add_argument(
+        "--library-sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000]
+    )
+    parser.add_argument("--download-kb", type=int, default=16 * 1024)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change allowed before a metric is a regression",
+    )
+    args = parser.parse_args()
+
+    metrics = asyncio.run(run(args))
+    baseline = results.load(args.baseline) if args.baseline else []
+    for line in results.report(metrics, baseline):
+        print(line)
+    if args.output:
+        params = {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "baseline")
+        }
+        results.save(args.output, metrics, params)
+
+    regressions = results.compare(metrics, baseline, args.tolerance)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression.metric.name}: {regression.metric.value:.2f} "
+            f"vs {regression.baseline:.2f} ({regression.change * 100:+.1f}%)"
+        )
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Machine readable benchmark results and their comparison with a baseline
+"""
+import json
+import platform
+import subprocess
+import time
+from typing import Iterable, List, NamedTuple, Optional
+
+
+class Metric(NamedTuple):
+    name: str  # dotted, e.g. upload.1MB.mb_per_s
+    value: float
+    unit: str
+    better: str  # higher or lower
+
+
+class Regression(NamedTuple):
+    metric: Metric
+    baseline: float
+    change: float  # relative, negative is worse whatever the direction
+
+
+def save(path: str, metrics: Iterable[Metric], params: dict):
+    document = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "params": params,
+        },
+        "metrics": [metric._asdict() for metric in metrics],
+    }
+    with open(path, "w") as out_file:
+        json.dump(document, out_file, indent=2)
+
+
+def load(path: str) -> List[Metric]:
+    with open(path) as in_file:
+        return [Metric(**metric) for metric in json.load(in_file)["metrics"]]
+
+
+def compare(
+    metrics: Iterable[Metric], baseline: Iterable[Metric], tolerance: float
+) -> List[Regression]:
+    """
+    Metrics worse than their baseline value by more than tolerance (a
+    fraction), metrics missing on either side are skipped
+    """
+    baseline_values = {metric.name: metric.value for metric in baseline}
+    regressions = []
+    for metric in metrics:
+        change = _change(metric, baseline_values.get(metric.name))
+        if change is not None and change < -tolerance:
+            regressions.append(
+                Regression(metric, baseline_values[metric.name], change)
+            )
+    return regressions
+
+
+def report(
+    metrics: Iterable[Metric], baseline: Iterable[Metric] = ()
+) -> Iterable[str]:
+    baseline_values = {metric.name: metric.value for metric in baseline}
+    for metric in metrics:
+        line = f"{metric.name:<40} {metric.value:12.2f} {metric.unit:<6}"
+        change = _change(metric, baseline_values.get(metric.name))
+        if change is not None:
+            # positive is better
+            line += (
+                f" baseline {baseline_values[metric.name]:12.2f}"
+                f" {change * 100:+7.1f}%"
+            )
+        yield line
+
+
+def _change(metric: Metric, baseline: Optional[float]) -> Optional[float]:
+    if baseline is None:
+        return None
+    if baseline == 0:
+        # from nothing to something, e.g. errors
+        change = float(metric.value > 0)
+    else:
+        change = (metric.value - baseline) / baseline
+    return change if metric.better == "higher" else -change
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,37 @@
+"""content addressed blobs
+
+Revision ID: 3f1c2a9b7d10
+Revises:
+Create Date: 2026-10-17 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f1c2a9b7d10"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # prestart.sh runs create_all before the migrations, new tables already
+    # exist at this point but existing tables don't get new columns
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS blob ("
+        "digest VARCHAR(64) PRIMARY KEY, "
+        "size BIGINT NOT NULL, "
+        "ref_count INTEGER NOT NULL DEFAULT 0, "
+        "created_on TIMESTAMP WITH TIME ZONE DEFAULT now())"
+    )
+    op.execute(
+        "ALTER TABLE file ADD COLUMN IF NOT EXISTS "
+        "blob_digest VARCHAR(64) REFERENCES blob (digest)"
+    )
+
+
+def downgrade():
+    op.drop_column("file", "blob_digest")
+    op.drop_table("blob")
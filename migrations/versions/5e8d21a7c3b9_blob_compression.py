@@ -0,0 +1,38 @@
+"""blob compression
+
+Revision ID: 5e8d21a7c3b9
+Revises: c47d0e5a1f28
+Create Date: 2026-10-17 20:31:12.503817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5e8d21a7c3b9"
+down_revision = "c47d0e5a1f28"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, column, column_type in (
+        ("blob", "encoding", "VARCHAR(16)"),
+        ("blob", "stored_size", "BIGINT"),
+        ("file", "stored_size", "BIGINT"),
+        ("file", "content_encoding", "VARCHAR(16)"),
+    ):
+        op.execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"
+        )
+    # everything stored so far is uncompressed
+    op.execute("UPDATE blob SET stored_size = size WHERE stored_size IS NULL")
+    op.execute("UPDATE file SET stored_size = size WHERE stored_size IS NULL")
+
+
+def downgrade():
+    op.drop_column("file", "content_encoding")
+    op.drop_column("file", "stored_size")
+    op.drop_column("blob", "stored_size")
+    op.drop_column("blob", "encoding")
@@ -0,0 +1,39 @@
+"""upload quota reservations
+
+Revision ID: 8b2e64d1c9a3
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-17 15:40:02.118345
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8b2e64d1c9a3"
+down_revision = "3f1c2a9b7d10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for column, column_type in (
+        ("bytes_uploaded", "BIGINT"),
+        ("files_reserved", "INTEGER"),
+        ("bytes_reserved", "BIGINT"),
+    ):
+        op.execute(
+            f'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS {column} '
+            f"{column_type} DEFAULT 0"
+        )
+    # bytes of the files uploaded before the quota existed
+    op.execute(
+        'UPDATE "user" SET bytes_uploaded = '
+        "(SELECT COALESCE(SUM(size), 0) FROM file WHERE file.user_id = \"user\".id)"
+    )
+
+
+def downgrade():
+    op.drop_column("user", "bytes_reserved")
+    op.drop_column("user", "files_reserved")
+    op.drop_column("user", "bytes_uploaded")
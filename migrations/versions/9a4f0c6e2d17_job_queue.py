@@ -0,0 +1,45 @@
+"""job queue
+
+Revision ID: 9a4f0c6e2d17
+Revises: 5e8d21a7c3b9
+Create Date: 2026-10-17 21:12:40.118392
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "9a4f0c6e2d17"
+down_revision = "5e8d21a7c3b9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "ALTER TABLE file ADD COLUMN IF NOT EXISTS status VARCHAR(16) "
+        "NOT NULL DEFAULT 'ready'"
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job (
+            id BIGSERIAL PRIMARY KEY,
+            kind VARCHAR(64) NOT NULL,
+            payload JSONB NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error VARCHAR,
+            run_after TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            created_on TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_job_due ON job (run_after) "
+        "WHERE status IN ('pending', 'running')"
+    )
+
+
+def downgrade():
+    op.drop_table("job")
+    op.drop_column("file", "status")
@@ -0,0 +1,27 @@
+"""file listing index
+
+Revision ID: c47d0e5a1f28
+Revises: 8b2e64d1c9a3
+Create Date: 2026-10-17 17:05:44.930611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c47d0e5a1f28"
+down_revision = "8b2e64d1c9a3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_file_user_id_uploaded_on_uri "
+        "ON file (user_id, uploaded_on, uri) INCLUDE (name, size)"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_file_user_id_uploaded_on_uri", table_name="file")
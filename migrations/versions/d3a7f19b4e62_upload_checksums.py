@@ -0,0 +1,33 @@
+"""upload checksums and blob scrubbing
+
+Revision ID: d3a7f19b4e62
+Revises: 9a4f0c6e2d17
+Create Date: 2026-10-17 23:41:05.527104
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "d3a7f19b4e62"
+down_revision = "9a4f0c6e2d17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE file ADD COLUMN IF NOT EXISTS content_md5 VARCHAR(32)")
+    op.execute(
+        "ALTER TABLE blob ADD COLUMN IF NOT EXISTS verified_on "
+        "TIMESTAMP WITH TIME ZONE"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_blob_verified_on "
+        "ON blob (verified_on NULLS FIRST)"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_blob_verified_on", table_name="blob")
+    op.drop_column("blob", "verified_on")
+    op.drop_column("file", "content_md5")
@@ -0,0 +1,27 @@
+"""keep file uploaded_on as it is on updates
+
+Revision ID: e6b94c2f0a51
+Revises: d3a7f19b4e62
+Create Date: 2026-10-17 21:05:12.318840
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "e6b94c2f0a51"
+down_revision = "d3a7f19b4e62"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "ALTER TABLE file ADD COLUMN IF NOT EXISTS updated_on "
+        "TIMESTAMP WITH TIME ZONE DEFAULT now()"
+    )
+    op.execute("UPDATE file SET updated_on = uploaded_on")
+
+
+def downgrade():
+    op.drop_column("file", "updated_on")
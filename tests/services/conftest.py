@@ -2,8 +2,10 @@ import pathlib
 import uuid
 
 import pytest
+from fastapi import UploadFile
 
 from app.schemas import FileQuery
+from app.services.cache import get_metadata_cache
 from app.services.file import FileService
 
 
@@ -14,17 +16,28 @@ def file_service(db):
 
 @pytest.fixture(scope="session")
 def file():
-    return open("tests/files_stub/test_file", "wb")
+    pathlib.Path("tests/files_stub").mkdir(exist_ok=True)
+    return UploadFile("test_file", file=open("tests/files_stub/test_file", "w+b"))
 
 
 @pytest.fixture(scope="session", autouse=True)
 def cleanup(file):
     """Cleanup a testing file once we are finished."""
-    file.close()
+    yield
+    file.file.close()
     file_to_rem = pathlib.Path("tests/files_stub/test_file")
     file_to_rem.unlink(missing_ok=True)
 
 
+@pytest.fixture(autouse=True)
+def metadata_cache():
+    """Every test starts with an empty metadata cache."""
+    cache = get_metadata_cache()
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
 @pytest.fixture(scope="session")
 def file_query():
     return FileQuery(uri=uuid.uuid4())
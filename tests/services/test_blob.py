@@ -0,0 +1,161 @@
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core.config import settings
+from app.services.blob import BlobCRUD
+from app.storage import LocalStorage
+from app.utils.app_exceptions import AppException
+
+
+@pytest.fixture()
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(BlobCRUD, "PATH_TO_STAGING", f"{tmp_path}/tmp/")
+    local_storage = LocalStorage(f"{tmp_path}/blobs/")
+    with patch("app.services.blob.get_storage", return_value=local_storage):
+        yield local_storage
+
+
+def _stage(content: bytes) -> str:
+    staging_path = BlobCRUD.staging_path()
+    with open(staging_path, "wb") as staged:
+        staged.write(content)
+    return staging_path
+
+
+def test_publish_moves_staged_file_to_its_digest(storage: LocalStorage):
+    staging_path = _stage(b"content")
+
+    assert BlobCRUD.publish(staging_path, "digest").is_new
+
+    assert b"".join(storage.get_stream("digest")) == b"content"
+
+
+def test_publish_same_digest_keeps_a_single_copy(storage: LocalStorage):
+    BlobCRUD.publish(_stage(b"content"), "digest")
+    staging_path = _stage(b"content")
+
+    assert not BlobCRUD.publish(staging_path, "digest").is_new
+
+    assert not os.path.exists(staging_path)
+
+
+def test_publish_compresses_compressible_content(storage: LocalStorage, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_COMPRESSION", "gzip")
+
+    blob = BlobCRUD.publish(_stage(b"content " * 1000), "digest")
+
+    assert blob.encoding == "gzip"
+    assert blob.stored_size < blob.size == 8000
+    assert storage.exists("digest.gz")
+
+
+def test_publish_keeps_incompressible_content_as_is(
+    storage: LocalStorage, monkeypatch
+):
+    monkeypatch.setattr(settings, "STORAGE_COMPRESSION", "gzip")
+
+    blob = BlobCRUD.publish(_stage(os.urandom(8000)), "digest")
+
+    assert blob.encoding is None
+    assert storage.exists("digest")
+
+
+def test_publish_finds_the_compressed_copy_of_a_digest(
+    storage: LocalStorage, monkeypatch
+):
+    monkeypatch.setattr(settings, "STORAGE_COMPRESSION", "gzip")
+    BlobCRUD.publish(_stage(b"content " * 1000), "digest")
+    monkeypatch.setattr(settings, "STORAGE_COMPRESSION", "none")
+
+    blob = BlobCRUD.publish(_stage(b"content " * 1000), "digest")
+
+    assert not blob.is_new
+    assert blob.encoding == "gzip"
+
+
+def test_publish_replaces_a_truncated_blob(storage: LocalStorage, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_COMPRESSION", "gzip")
+    # left by a crash before the content reached the disk
+    storage.put_stream("digest", [b"cont"])
+
+    blob = BlobCRUD.publish(_stage(b"content " * 1000), "digest")
+
+    assert blob.is_new
+    # rows may already point at the uncompressed key
+    assert blob.encoding is None
+    assert b"".join(storage.get_stream("digest")) == b"content " * 1000
+
+
+@pytest.mark.parametrize("ref_count, reclaimed", [(0, True), (1, False)])
+def test_reclaim_only_deletes_unreferenced_blobs(
+    storage: LocalStorage, ref_count: int, reclaimed: bool
+):
+    BlobCRUD.publish(_stage(b"content"), "digest")
+    db = MagicMock()
+    query = db.query.return_value.filter.return_value
+    query.with_for_update.return_value.first.return_value = SimpleNamespace(
+        encoding=None, ref_count=ref_count
+    )
+
+    BlobCRUD(db).reclaim("digest")
+
+    assert storage.exists("digest") is not reclaimed
+
+
+def test_reclaim_deletes_the_content_before_releasing_the_row_lock(
+    storage: LocalStorage,
+):
+    BlobCRUD.publish(_stage(b"content"), "digest")
+    db = MagicMock()
+    query = db.query.return_value.filter.return_value
+    query.with_for_update.return_value.first.return_value = SimpleNamespace(
+        encoding=None, ref_count=0
+    )
+    stored_on_commit = []
+    db.commit.side_effect = lambda: stored_on_commit.append(storage.exists("digest"))
+
+    BlobCRUD(db).reclaim("digest")
+
+    assert stored_on_commit == [False]
+
+
+def test_add_reference_after_a_reclaim_of_the_published_content_fails(
+    storage: LocalStorage,
+):
+    BlobCRUD.publish(_stage(b"content"), "digest")
+    # the same content again, deduplicated against the stored copy
+    blob = BlobCRUD.publish(_stage(b"content"), "digest")
+    assert not blob.is_new
+
+    # reclaimed before the reference is added
+    reclaim_db = MagicMock()
+    query = reclaim_db.query.return_value.filter.return_value
+    query.with_for_update.return_value.first.return_value = SimpleNamespace(
+        encoding=None, ref_count=0
+    )
+    BlobCRUD(reclaim_db).reclaim("digest")
+
+    # the upsert waited for the reclaim and inserted the row again
+    db = MagicMock()
+    db.execute.return_value.first.return_value = SimpleNamespace(
+        encoding=None, stored_size=7, inserted=True
+    )
+    with pytest.raises(AppException.FileUploaded):
+        BlobCRUD(db).add_reference(blob)
+
+
+def test_add_reference_inserting_the_row_of_stored_content_succeeds(
+    storage: LocalStorage,
+):
+    # stored, but its row is gone (e.g. left by a crash)
+    BlobCRUD.publish(_stage(b"content"), "digest")
+    blob = BlobCRUD.publish(_stage(b"content"), "digest")
+    db = MagicMock()
+    db.execute.return_value.first.return_value = SimpleNamespace(
+        encoding=None, stored_size=7, inserted=True
+    )
+
+    assert BlobCRUD(db).add_reference(blob).stored_size == 7
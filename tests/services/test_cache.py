@@ -0,0 +1,111 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from app.schemas import FileMetadata
+from app.services.cache import LRUCache, MetadataCache, get_metadata_cache
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+@pytest.fixture()
+def metadata() -> FileMetadata:
+    return FileMetadata(uri=uuid.uuid4(), name="name", size=10, user_id=1)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+
+@patch("app.services.cache.time.monotonic")
+def test_lru_cache_entries_expire(monotonic):
+    cache = LRUCache(max_size=2, ttl=60)
+    monotonic.return_value = 0
+    cache.set("a", 1)
+
+    monotonic.return_value = 61
+    assert cache.get("a") is None
+
+
+def test_metadata_cache_counts_hits_and_misses(metadata: FileMetadata):
+    cache = MetadataCache(LRUCache(10, 60))
+    key = cache.name_key(1, "name")
+
+    assert cache.get(key) is None
+    cache.set(metadata)
+    assert cache.get(key) == metadata
+    assert cache.get(cache.uri_key(1, metadata.uri)) == metadata
+    assert cache.stats() == {"local_hits": 2, "shared_hits": 0, "misses": 1}
+
+
+def test_metadata_cache_falls_back_to_shared_tier(metadata: FileMetadata):
+    shared = FakeRedis()
+    MetadataCache(LRUCache(10, 60), shared).set(metadata)
+
+    # another worker, its local tier is empty
+    cache = MetadataCache(LRUCache(10, 60), shared)
+    key = cache.uri_key(1, metadata.uri)
+
+    assert cache.get(key) == metadata
+    assert cache.get(key) == metadata
+    assert cache.stats()["shared_hits"] == 1
+    assert cache.stats()["local_hits"] == 1
+
+
+def test_metadata_cache_invalidate_drops_both_tiers(metadata: FileMetadata):
+    shared = FakeRedis()
+    cache = MetadataCache(LRUCache(10, 60), shared)
+    cache.set(metadata)
+
+    cache.invalidate(1, name="name")
+
+    assert cache.get(cache.name_key(1, "name")) is None
+    assert not any(key.startswith("file:name:") for key in shared.values)
+
+
+def test_shared_tier_is_the_only_one_when_configured(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.cache.settings.METADATA_CACHE_REDIS_URL", "redis://cache"
+    )
+    get_metadata_cache.cache_clear()
+    try:
+        cache = get_metadata_cache()
+    finally:
+        get_metadata_cache.cache_clear()
+
+    # a delete on another worker would leave a local copy behind
+    assert cache.local is None
+    assert cache.shared is not None
+
+
+def test_invalidation_reaches_every_worker_with_only_the_shared_tier(
+    metadata: FileMetadata,
+):
+    shared = FakeRedis()
+    cache, other_worker = MetadataCache(None, shared), MetadataCache(None, shared)
+    cache.set(metadata)
+    assert other_worker.get(other_worker.name_key(1, "name")) == metadata
+
+    cache.invalidate(1, name="name")
+
+    assert other_worker.get(other_worker.name_key(1, "name")) is None
@@ -1,12 +1,29 @@
+import hashlib
+import json
+import uuid
+from datetime import datetime
+from functools import partialmethod
+from itertools import islice
+from io import BytesIO
+from types import SimpleNamespace
 from unittest.mock import patch, AsyncMock, Mock
 
 import pytest
 from fastapi import UploadFile, Depends
+from sqlalchemy.orm import Session
 
 from app.api.deps import get_db
-from app.models import File
-from app.schemas import FileQuery
-from app.services.file import FileService
+from app.models import File, User
+from app.schemas import (
+    FileArchiveQuery,
+    FileDownloadConditions,
+    FileListQuery,
+    FileMetadata,
+    FileQuery,
+)
+from app.services.blob import BlobCRUD, StoredBlob
+from app.services.file import FileService, FileCRUD
+from app.services.user import UserService
 from app.utils.app_exceptions import AppException
 from app.utils.service_result import ServiceResult
 
@@ -20,12 +37,11 @@ async def test_upload_file_return_service_result(
 
 
 @pytest.mark.asyncio
-@patch(
-    "app.services.file.UserService.can_upload_files",
-    return_value=False,
-)
+@patch("app.services.user.UserCRUD.get_quota_usage", return_value=(2, 0))
+@patch("app.services.user.UserCRUD.reserve_quota", return_value=False)
 async def test_user_cant_upload_file_returns_proper_exception(
-    can_upload_files: AsyncMock,
+    reserve_quota: Mock,
+    get_quota_usage: Mock,
     file_service: FileService,
     file: UploadFile,
     db: get_db = Depends(),
@@ -40,7 +56,9 @@ async def test_user_cant_upload_file_returns_proper_exception(
     "app.services.file.FileCRUD.store_file",
     return_value=(File(), False),
 )
+@patch("app.services.user.UserCRUD.reserve_quota", return_value=True)
 async def test_upload_file_returns_file_model(
+    reserve_quota: Mock,
     store_file_mock: AsyncMock,
     file_service: FileService,
     file: UploadFile,
@@ -57,10 +75,12 @@ async def test_upload_file_returns_file_model(
     return_value=(File(), True),
 )
 @patch(
-    "app.services.file.UserService.increase_file_count",
+    "app.services.file.UserService.commit_upload",
 )
+@patch("app.services.user.UserCRUD.reserve_quota", return_value=True)
 async def test_if_is_new_file_user_file_counter_gets_incremented(
-    increase_file_count: Mock,
+    reserve_quota: Mock,
+    commit_upload: Mock,
     store_file: AsyncMock,
     file_service: FileService,
     file: UploadFile,
@@ -68,7 +88,7 @@ async def test_if_is_new_file_user_file_counter_gets_incremented(
 ):
     await file_service.upload_file(file)
 
-    increase_file_count.assert_called()
+    commit_upload.assert_called()
 
 
 @pytest.mark.asyncio
@@ -77,10 +97,16 @@ async def test_if_is_new_file_user_file_counter_gets_incremented(
     return_value=(File(), False),
 )
 @patch(
-    "app.services.file.UserService.increase_file_count",
+    "app.services.file.UserService.release_upload",
 )
+@patch(
+    "app.services.file.UserService.commit_upload",
+)
+@patch("app.services.user.UserCRUD.reserve_quota", return_value=True)
 async def test_if_its_not_a_new_file_user_file_counter_doesnt_get_incremented(
-    increase_file_count: Mock,
+    reserve_quota: Mock,
+    commit_upload: Mock,
+    release_upload: Mock,
     store_file: AsyncMock,
     file_service: FileService,
     file: UploadFile,
@@ -88,7 +114,8 @@ async def test_if_its_not_a_new_file_user_file_counter_doesnt_get_incremented(
 ):
     await file_service.upload_file(file)
 
-    increase_file_count.assert_not_called()
+    commit_upload.assert_not_called()
+    release_upload.assert_called()
 
 
 @pytest.mark.asyncio
@@ -126,7 +153,7 @@ async def test_get_file_uri_returns_404_when_no_files_found(
 @pytest.mark.asyncio
 @patch(
     "app.services.file.FileCRUD.get_files",
-    return_value=[Mock(uri="fakeuri", size=0)],
+    return_value=[Mock(uri="fakeuri", size=0, stored_size=0, content_encoding=None)],
 )
 @patch("app.services.file.UserService.can_download_files", return_value=True)
 @patch("app.services.file.UserService.update_download_stats", return_value=True)
@@ -141,3 +168,457 @@ async def test_get_file_uri_update_download_stats(
     await file_service.get_file_uri(file_query)
 
     update_download_stats.assert_called()
+
+
+@pytest.mark.asyncio
+@patch("app.services.user.UserCRUD.get_quota_usage", return_value=(0, 0))
+@patch("app.services.user.UserCRUD.reserve_quota", return_value=False)
+async def test_user_over_bytes_quota_returns_proper_exception(
+    reserve_quota: Mock,
+    get_quota_usage: Mock,
+    file_service: FileService,
+    file: UploadFile,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.upload_file(file)
+
+    assert isinstance(service_result.value, AppException.UploadBytesQuotaExceeded)
+
+
+@pytest.mark.asyncio
+@patch("app.services.file.UserService.release_upload")
+@patch(
+    "app.services.file.FileCRUD.store_file",
+    side_effect=AppException.FileTooLarge(1),
+)
+@patch("app.services.user.UserCRUD.reserve_quota", return_value=True)
+async def test_failed_upload_releases_its_reservation(
+    reserve_quota: Mock,
+    store_file: AsyncMock,
+    release_upload: Mock,
+    file_service: FileService,
+    file: UploadFile,
+    db: get_db = Depends(),
+):
+    await file_service.upload_file(file)
+
+    release_upload.assert_called()
+
+
+@pytest.mark.asyncio
+@patch("app.services.file.FileCRUD._store_file_on_disk")
+@patch("app.services.file.FileCRUD.get_file_by_name", return_value=File())
+async def test_store_file_with_existing_name_doesnt_write_to_disk(
+    get_file_by_name: Mock,
+    store_file_on_disk: AsyncMock,
+    file: UploadFile,
+    db: get_db = Depends(),
+):
+    file_obj, is_new_file = await FileCRUD(db).store_file(Mock(filename="name"))
+
+    store_file_on_disk.assert_not_called()
+    assert not is_new_file
+
+
+@pytest.mark.asyncio
+@patch("app.services.file.FileCRUD.store_stream")
+async def test_upload_stream_too_large_content_length_is_rejected_before_reading(
+    store_stream: AsyncMock,
+    file_service: FileService,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.upload_stream(
+        "name", Mock(), FileCRUD.MAX_FILE_SIZE + 1
+    )
+
+    assert isinstance(service_result.value, AppException.FileTooLarge)
+    store_stream.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_store_stream_on_disk_aborts_when_body_exceeds_max_size(
+    tmp_path, monkeypatch, db: get_db = Depends()
+):
+    monkeypatch.setattr(BlobCRUD, "PATH_TO_STAGING", f"{tmp_path}/tmp/")
+    monkeypatch.setattr(FileCRUD, "MAX_FILE_SIZE", 10)
+
+    async def body():
+        for _ in range(3):
+            yield b"x" * 5
+
+    with pytest.raises(AppException.FileTooLarge):
+        await FileCRUD(db)._store_stream_on_disk(body())
+
+    assert not list((tmp_path / "tmp").iterdir())
+
+
+@pytest.mark.asyncio
+@patch("app.services.file.BlobCRUD.publish_async")
+async def test_store_stream_on_disk_rejects_checksum_mismatch(
+    publish_async: AsyncMock, tmp_path, monkeypatch, db: get_db = Depends()
+):
+    monkeypatch.setattr(BlobCRUD, "PATH_TO_STAGING", f"{tmp_path}/tmp/")
+
+    async def body():
+        yield b"content"
+
+    with pytest.raises(AppException.ChecksumMismatch):
+        await FileCRUD(db)._store_stream_on_disk(
+            body(), checksums={"md5": hashlib.md5(b"other").hexdigest()}
+        )
+
+    publish_async.assert_not_called()
+    assert not list((tmp_path / "tmp").iterdir())
+
+
+@pytest.mark.asyncio
+@patch(
+    "app.services.file.BlobCRUD.publish_async",
+    return_value=StoredBlob("digest", 7, None, 7, True),
+)
+async def test_store_stream_on_disk_keeps_the_verified_md5(
+    publish_async: AsyncMock, tmp_path, monkeypatch, db: get_db = Depends()
+):
+    monkeypatch.setattr(BlobCRUD, "PATH_TO_STAGING", f"{tmp_path}/tmp/")
+    md5 = hashlib.md5(b"content").hexdigest()
+
+    async def body():
+        yield b"content"
+
+    blob = await FileCRUD(db)._store_stream_on_disk(body(), checksums={"md5": md5})
+
+    assert blob.md5 == md5
+    # hashed in the same pass, the blob digest is the sha256
+    assert publish_async.call_args[0][1] == hashlib.sha256(b"content").hexdigest()
+
+
+@pytest.mark.asyncio
+@patch(
+    "app.services.file.FileCRUD.get_files",
+    return_value=[
+        Mock(blob_digest="digest", size=100, stored_size=100, content_encoding=None)
+    ],
+)
+@patch("app.services.file.UserService.can_download_files", return_value=True)
+@patch("app.services.file.UserService.update_download_stats", return_value=True)
+async def test_get_file_uri_range_only_charges_served_bytes(
+    update_download_stats: Mock,
+    can_download_files: Mock,
+    get_files: Mock,
+    file_service: FileService,
+    file_query: FileQuery,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.get_file_uri(
+        file_query, FileDownloadConditions(range="bytes=10-19")
+    )
+
+    assert service_result.value.partial
+    assert update_download_stats.call_args[0][0].bytes == 10
+
+
+@pytest.mark.asyncio
+@patch(
+    "app.services.file.FileCRUD.get_files",
+    return_value=[
+        Mock(blob_digest="digest", size=100, stored_size=100, content_encoding=None)
+    ],
+)
+@patch("app.services.file.UserService.can_download_files", return_value=True)
+@patch("app.services.file.UserService.update_download_stats", return_value=True)
+async def test_get_file_uri_matching_etag_is_not_modified_and_free(
+    update_download_stats: Mock,
+    can_download_files: Mock,
+    get_files: Mock,
+    file_service: FileService,
+    file_query: FileQuery,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.get_file_uri(
+        file_query, FileDownloadConditions(if_none_match='"digest"')
+    )
+
+    assert service_result.value.not_modified
+    assert update_download_stats.call_args[0][0].bytes == 0
+
+
+@pytest.mark.asyncio
+@patch(
+    "app.services.file.FileCRUD.get_files",
+    return_value=[
+        Mock(blob_digest="digest", size=100, stored_size=100, content_encoding=None)
+    ],
+)
+@patch("app.services.file.UserService.can_download_files", return_value=True)
+@patch("app.services.file.UserService.update_download_stats", return_value=True)
+async def test_get_file_uri_stale_if_range_serves_whole_file(
+    update_download_stats: Mock,
+    can_download_files: Mock,
+    get_files: Mock,
+    file_service: FileService,
+    file_query: FileQuery,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.get_file_uri(
+        file_query, FileDownloadConditions(range="bytes=10-19", if_range='"old"')
+    )
+
+    assert not service_result.value.partial
+    assert update_download_stats.call_args[0][0].bytes == 100
+
+
+@pytest.mark.asyncio
+@patch(
+    "app.services.file.FileCRUD.list_files",
+    return_value=[
+        Mock(uri=uuid.uuid4(), uploaded_on=datetime(2022, 2, 22)) for _ in range(3)
+    ],
+)
+async def test_get_files_returns_next_cursor_when_there_are_more_files(
+    list_files: Mock,
+    file_service: FileService,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.get_files(FileListQuery(limit=2))
+
+    assert len(service_result.value.files) == 2
+    assert service_result.value.next_cursor
+    # one row more than the page to detect the next one
+    assert list_files.call_args[0][2] == 3
+
+
+@pytest.mark.asyncio
+@patch("app.services.file.FileCRUD.list_files", return_value=[])
+async def test_get_files_last_page_has_no_cursor(
+    list_files: Mock,
+    file_service: FileService,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.get_files(FileListQuery(limit=2))
+
+    assert service_result.value.next_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_get_files_invalid_cursor_returns_proper_exception(
+    file_service: FileService,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.get_files(FileListQuery(cursor="nope"))
+
+    assert isinstance(service_result.value, AppException.InvalidCursor)
+
+
+@pytest.mark.asyncio
+async def test_stream_files_streams_every_row_in_batches_and_ends(
+    file_service: FileService, db: Session
+):
+    if not db.get(User, 1):
+        db.add(User(id=1, email="user@example.com"))
+    db.add_all(File(name=f"stream-{i}", user_id=1, size=0) for i in range(5))
+    db.flush()
+
+    with patch.object(
+        FileCRUD, "iter_files", partialmethod(FileCRUD.iter_files, batch_size=2)
+    ):
+        service_result = await file_service.stream_files(
+            FileListQuery(name_prefix="stream-")
+        )
+        # bounded, a listing that never ends fails instead of hanging
+        chunks = list(islice(service_result.value, 10))
+
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode().splitlines()
+    assert sorted(json.loads(line)["name"] for line in lines) == [
+        f"stream-{i}" for i in range(5)
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "usage, error",
+    [
+        # 24 KB used, room for the bytes but not for two more files
+        ((1, 24 * 1024), "TooManyFilesPerUser"),
+        ((0, UserService.MAX_BYTES_PER_USER - 10), "UploadBytesQuotaExceeded"),
+    ],
+)
+@patch("app.services.user.UserCRUD.reserve_quota", return_value=False)
+@patch("app.services.file.FileCRUD.get_files_by_names", return_value={})
+async def test_upload_files_over_quota_reports_the_limit_exceeded(
+    get_files_by_names: Mock,
+    reserve_quota: Mock,
+    usage: tuple,
+    error: str,
+    file_service: FileService,
+    db: get_db = Depends(),
+):
+    files = [UploadFile(f"file{i}", file=BytesIO(b"content")) for i in range(2)]
+
+    with patch("app.services.user.UserCRUD.get_quota_usage", return_value=usage):
+        service_result = await file_service.upload_files(files)
+
+    assert [outcome.error for outcome in service_result.value] == [error, error]
+
+
+def test_get_file_by_name_cache_hit_skips_the_db(metadata_cache):
+    metadata_cache.set(FileMetadata(uri=uuid.uuid4(), name="name", user_id=1))
+    db = Mock()
+
+    file = FileCRUD(db).get_file_by_name("name")
+
+    assert file.name == "name"
+    db.query.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("app.services.file.UserService.commit_upload")
+@patch(
+    "app.services.file.UserService.reserve_upload",
+    side_effect=lambda reservation: ServiceResult(reservation),
+)
+@patch("app.services.file.FileCRUD.create_files")
+@patch(
+    "app.services.file.FileCRUD._store_file_on_disk",
+    side_effect=[StoredBlob("digest", 10, None, 10, True), AppException.FileUploaded()],
+)
+@patch("app.services.file.FileCRUD.get_files_by_names")
+async def test_upload_files_reports_each_file_and_charges_quota_once(
+    get_files_by_names: Mock,
+    store_file_on_disk: AsyncMock,
+    create_files: Mock,
+    reserve_upload: Mock,
+    commit_upload: Mock,
+    file_service: FileService,
+    db: get_db = Depends(),
+):
+    existing = FileMetadata(uri=uuid.uuid4(), name="existing", user_id=1)
+    created = FileMetadata(uri=uuid.uuid4(), name="new", size=10, user_id=1)
+    get_files_by_names.return_value = {"existing": existing}
+    create_files.return_value = {"new": created}
+    files = [
+        UploadFile(name, file=BytesIO(b"content"))
+        for name in ("existing", "new", "broken", "new")
+    ]
+
+    service_result = await file_service.upload_files(files)
+
+    outcomes = service_result.value
+    assert [outcome.created for outcome in outcomes] == [False, True, False, False]
+    assert outcomes[0].uri.endswith(str(existing.uri))
+    assert outcomes[2].error == "FileUploaded"
+    assert outcomes[3].error == "FileUploaded"
+    create_files.assert_called_once_with(
+        [("new", StoredBlob("digest", 10, None, 10, True))]
+    )
+    reservation = reserve_upload.call_args[0][0]
+    assert (reservation.files, reservation.bytes) == (2, 14)
+    commit_upload.assert_called_once_with(reservation, 10, 1)
+
+
+@pytest.mark.asyncio
+@patch(
+    "app.services.file.FileCRUD.get_archive_files",
+    return_value=[
+        SimpleNamespace(
+            uri=uuid.uuid4(),
+            name=f"file{i}",
+            size=10,
+            blob_digest="digest",
+            uploaded_on=None,
+        )
+        for i in range(3)
+    ],
+)
+@patch("app.services.file.UserService.can_download_files", return_value=True)
+@patch("app.services.file.UserService.update_download_stats")
+async def test_get_archive_charges_the_rate_limit_once(
+    update_download_stats: Mock,
+    can_download_files: Mock,
+    get_archive_files: Mock,
+    file_service: FileService,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.get_archive(FileArchiveQuery(format="tar"))
+
+    assert service_result.success
+    update_download_stats.assert_called_once()
+    assert update_download_stats.call_args[0][0].bytes == 30
+
+
+@pytest.mark.asyncio
+@patch(
+    "app.services.file.FileCRUD.get_files",
+    return_value=[
+        Mock(blob_digest="digest", size=100, stored_size=40, content_encoding="gzip")
+    ],
+)
+@patch("app.services.file.UserService.can_download_files", return_value=True)
+@patch("app.services.file.UserService.update_download_stats", return_value=True)
+async def test_get_file_uri_compressed_blob_passthrough_charges_stored_bytes(
+    update_download_stats: Mock,
+    can_download_files: Mock,
+    get_files: Mock,
+    file_service: FileService,
+    file_query: FileQuery,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.get_file_uri(
+        file_query, FileDownloadConditions(accept_encoding="gzip, br")
+    )
+
+    assert service_result.value.passthrough
+    assert service_result.value.key == "digest.gz"
+    assert update_download_stats.call_args[0][0].bytes == 40
+
+
+@pytest.mark.asyncio
+@patch("app.services.file.UserService.release_upload")
+@patch("app.services.file.UserService.commit_upload")
+@patch(
+    "app.services.file.UserService.reserve_upload",
+    side_effect=lambda reservation: ServiceResult(reservation),
+)
+@patch("app.services.file.FileCRUD.replace_file", return_value=File())
+@patch(
+    "app.services.file.FileCRUD._store_file_on_disk",
+    return_value=StoredBlob("digest", 10, None, 10, True),
+)
+@patch("app.services.file.FileCRUD.get_file_by_name")
+async def test_overwrite_replaces_the_file_without_reserving_one_more(
+    get_file_by_name: Mock,
+    store_file_on_disk: AsyncMock,
+    replace_file: Mock,
+    reserve_upload: Mock,
+    commit_upload: Mock,
+    release_upload: Mock,
+    file_service: FileService,
+    file: UploadFile,
+    db: get_db = Depends(),
+):
+    existing = FileMetadata(uri=uuid.uuid4(), name="test_file", user_id=1)
+    get_file_by_name.return_value = existing
+
+    service_result = await file_service.upload_file(file, overwrite=True)
+
+    assert service_result.success
+    replace_file.assert_called_once_with(
+        existing.uri, StoredBlob("digest", 10, None, 10, True)
+    )
+    assert reserve_upload.call_args[0][0].files == 0
+    # the quota is updated along with the file
+    commit_upload.assert_not_called()
+    release_upload.assert_called_once()
+
+
+@pytest.mark.asyncio
+@patch("app.services.file.FileCRUD.delete_file", return_value=None)
+async def test_delete_missing_file_returns_not_found(
+    delete_file: Mock,
+    file_service: FileService,
+    file_query: FileQuery,
+    db: get_db = Depends(),
+):
+    service_result = await file_service.delete_file(file_query)
+
+    assert isinstance(service_result.value, AppException.FileNotFound)
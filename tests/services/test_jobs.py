@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+
+from app.core.config import settings
+from app.models.file import FileStatus
+from app.services.file import FileCRUD, FileService, verify_blob
+from app.services.jobs import JOB_HANDLERS, JobCRUD, JobHandler
+
+
+def job(kind="test", attempts=1):
+    return SimpleNamespace(id=1, kind=kind, payload={"key": "value"}, attempts=attempts)
+
+
+@pytest.fixture()
+def handler():
+    handler = JobHandler(Mock(), Mock())
+    with patch.dict(JOB_HANDLERS, {"test": handler}):
+        yield handler
+
+
+@patch.object(JobCRUD, "complete")
+def test_run_calls_the_handler_and_completes_the_job(complete, handler):
+    db = MagicMock()
+
+    assert JobCRUD(db).run(job())
+
+    handler.run.assert_called_once_with(db, {"key": "value"})
+    complete.assert_called_once()
+
+
+@patch.object(JobCRUD, "retry_or_fail", return_value=False)
+def test_failed_job_is_retried(retry_or_fail, handler):
+    handler.run.side_effect = IOError("boom")
+
+    assert not JobCRUD(MagicMock()).run(job())
+
+    retry_or_fail.assert_called_once()
+    handler.on_failure.assert_not_called()
+
+
+@patch.object(JobCRUD, "retry_or_fail", return_value=True)
+def test_job_out_of_attempts_calls_on_failure(retry_or_fail, handler):
+    handler.run.side_effect = IOError("boom")
+
+    JobCRUD(MagicMock()).run(job(attempts=settings.JOB_MAX_ATTEMPTS))
+
+    handler.on_failure.assert_called_once()
+
+
+@patch.object(JobCRUD, "retry_or_fail", return_value=True)
+def test_job_abandoned_too_many_times_is_not_run(retry_or_fail, handler):
+    JobCRUD(MagicMock()).run(job(attempts=settings.JOB_MAX_ATTEMPTS + 1))
+
+    handler.run.assert_not_called()
+    retry_or_fail.assert_called_once()
+
+
+@patch.object(JobCRUD, "retry_or_fail", return_value=False)
+def test_job_without_handler_fails(retry_or_fail):
+    assert not JobCRUD(MagicMock()).run(job(kind="unknown"))
+
+
+@patch.object(FileCRUD, "set_status")
+def test_post_upload_hooks_run_in_order_and_mark_the_file_ready(
+    set_status, monkeypatch
+):
+    calls = []
+    hooks = {
+        "a": lambda db, file: calls.append("a"),
+        "b": lambda db, file: calls.append("b"),
+    }
+    monkeypatch.setattr(settings, "POST_UPLOAD_HOOKS", ["b", "a"])
+    monkeypatch.setattr("app.services.file.POST_UPLOAD_HOOKS", hooks)
+    db = MagicMock()
+    file = Mock(status=FileStatus.PROCESSING)
+    db.query.return_value.filter.return_value.first.return_value = file
+
+    FileCRUD(db).run_post_upload_hooks(file.uri)
+
+    assert calls == ["b", "a"]
+    set_status.assert_called_once_with(file, FileStatus.READY)
+
+
+@patch.object(FileService, "_file_content", return_value=iter([b"corrupted"]))
+def test_verify_blob_detects_stored_content_not_matching_the_digest(_):
+    with pytest.raises(IOError):
+        verify_blob(MagicMock(), Mock(blob_digest="0" * 64))
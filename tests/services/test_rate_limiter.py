@@ -0,0 +1,113 @@
+from datetime import timedelta
+from unittest.mock import patch, Mock
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import User
+from app.services.rate_limiter import (
+    SlidingWindowRateLimiter,
+    TokenBucketRateLimiter,
+    get_rate_limiter,
+    PostgresRateLimiter,
+)
+
+
+@pytest.fixture()
+def clock():
+    with patch("app.services.rate_limiter.time.monotonic", return_value=1000.0) as m:
+        yield m
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "rate_limiter_class", [TokenBucketRateLimiter, SlidingWindowRateLimiter]
+)
+async def test_rate_limiter_blocks_after_capacity_is_exceeded(
+    rate_limiter_class, clock: Mock
+):
+    rate_limiter = rate_limiter_class(capacity=100, period=60)
+
+    assert await rate_limiter.allow(1)
+    await rate_limiter.consume(1, 150)
+
+    assert not await rate_limiter.allow(1)
+    # other keys aren't affected
+    assert await rate_limiter.allow(2)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "rate_limiter_class", [TokenBucketRateLimiter, SlidingWindowRateLimiter]
+)
+async def test_rate_limiter_allows_again_after_period(rate_limiter_class, clock: Mock):
+    rate_limiter = rate_limiter_class(capacity=100, period=60)
+    await rate_limiter.consume(1, 150)
+
+    clock.return_value += 120
+
+    assert await rate_limiter.allow(1)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_refills_progressively(clock: Mock):
+    rate_limiter = TokenBucketRateLimiter(capacity=60, period=60)
+    await rate_limiter.consume(1, 90)  # 30 tokens in debt
+
+    clock.return_value += 20
+    assert not await rate_limiter.allow(1)
+
+    clock.return_value += 10
+    assert await rate_limiter.allow(1)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_doesnt_wrap_after_one_day(clock: Mock):
+    rate_limiter = TokenBucketRateLimiter(capacity=100, period=60)
+    await rate_limiter.consume(1, 150)
+
+    clock.return_value += 24 * 60 * 60 + 1
+
+    assert await rate_limiter.allow(1)
+
+
+def test_get_rate_limiter_shares_in_process_limiters():
+    rate_limiter = get_rate_limiter("test", "token_bucket", Mock(), 100, 60)
+
+    assert get_rate_limiter("test", "token_bucket", Mock(), 100, 60) is rate_limiter
+
+
+def test_get_rate_limiter_postgres_backend():
+    rate_limiter = get_rate_limiter("test", "postgres", Mock(), 100, 60)
+
+    assert isinstance(rate_limiter, PostgresRateLimiter)
+
+
+def age_last_download(db: Session, user_id: int, seconds: int):
+    # localtimestamp is frozen inside the test transaction, move the last
+    # download back instead of waiting
+    db.query(User).filter(User.id == user_id).update(
+        {User.last_download_time: func.localtimestamp() - timedelta(seconds=seconds)},
+        synchronize_session=False,
+    )
+
+
+@pytest.mark.asyncio
+async def test_postgres_rate_limiter_blocks_until_the_bucket_leaks(db: Session):
+    user = User(email="limited@example.com", bytes_read_on_last_minute=0)
+    db.add(user)
+    db.flush()
+    rate_limiter = PostgresRateLimiter(db, capacity=60, period=60)
+
+    await rate_limiter.consume(user.id, 50)
+    assert await rate_limiter.allow(user.id)
+    await rate_limiter.consume(user.id, 40)
+    assert not await rate_limiter.allow(user.id)
+
+    # leaks 1 per second, 90 - 20 is still over the capacity
+    age_last_download(db, user.id, 20)
+    assert not await rate_limiter.allow(user.id)
+
+    age_last_download(db, user.id, 40)
+    assert await rate_limiter.allow(user.id)
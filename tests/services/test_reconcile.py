@@ -0,0 +1,95 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.reconcile import ReconcileCRUD
+from app.storage import LocalStorage
+from app.utils.compression import storage_key
+
+DIGESTS = ["a" * 64, "b" * 64, "c" * 64]
+
+
+@pytest.fixture()
+def storage(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / "blobs"))
+    monkeypatch.setattr("app.services.reconcile.get_storage", lambda: storage)
+    monkeypatch.setattr(
+        "app.services.reconcile.get_legacy_storage",
+        lambda: LocalStorage(str(tmp_path / "legacy"), shard_depth=0),
+    )
+    monkeypatch.setattr(
+        "app.services.reconcile.BlobCRUD.PATH_TO_STAGING", str(tmp_path / "tmp")
+    )
+    monkeypatch.setattr(
+        "app.services.reconcile.settings.RECONCILE_QUARANTINE_ROOT",
+        str(tmp_path / "quarantine"),
+    )
+    return storage
+
+
+def reconcile(blob_row=None, **kwargs):
+    # a and gzipped c referenced, b orphan
+    with patch.object(
+        ReconcileCRUD,
+        "iter_blob_keys",
+        return_value=iter([DIGESTS[0], storage_key(DIGESTS[2], "gzip")]),
+    ), patch.object(ReconcileCRUD, "iter_legacy_keys", return_value=iter([])):
+        db = MagicMock()
+        # the Blob row of the orphans, as locked by delete_unreferenced
+        query = db.query.return_value.filter.return_value
+        query.with_for_update.return_value.first.return_value = blob_row
+        return list(ReconcileCRUD(db, **kwargs).reconcile())
+
+
+def test_dry_run_reports_orphans_and_missing_blobs(storage: LocalStorage):
+    for digest in DIGESTS[:2]:
+        storage.put_stream(digest, [b"content"])
+
+    findings = reconcile(grace_period=0, now=time.time() + 1)
+
+    assert [(f.key, f.problem, f.action, f.done) for f in findings] == [
+        (DIGESTS[1], "orphan", "delete", False),
+        (storage_key(DIGESTS[2], "gzip"), "missing", "none", False),
+    ]
+    assert storage.exists(DIGESTS[1])
+
+
+def test_orphans_within_the_grace_period_are_kept(storage: LocalStorage):
+    storage.put_stream(DIGESTS[1], [b"content"])
+
+    findings = reconcile(dry_run=False, grace_period=60)
+
+    assert [f.action for f in findings if f.problem == "orphan"] == ["keep"]
+    assert storage.exists(DIGESTS[1])
+
+
+def test_orphans_are_deleted_or_quarantined(storage: LocalStorage, tmp_path):
+    storage.put_stream(DIGESTS[1], [b"content"])
+    (tmp_path / "tmp").mkdir()
+    (tmp_path / "tmp" / "staged").write_bytes(b"partial upload")
+
+    findings = reconcile(dry_run=False, quarantine=True, now=time.time() + 1e6)
+
+    assert [(f.area, f.done) for f in findings if f.problem == "orphan"] == [
+        ("blobs", True),
+        ("staging", True),
+    ]
+    assert not storage.exists(DIGESTS[1])
+    quarantined = tmp_path / "quarantine" / "blobs" / DIGESTS[1]
+    assert quarantined.read_bytes() == b"content"
+    assert not (tmp_path / "tmp" / "staged").exists()
+
+
+@pytest.mark.parametrize("encoding, removed", [(None, False), ("gzip", True)])
+def test_orphans_referenced_meanwhile_are_kept_in_their_stored_form(
+    storage: LocalStorage, encoding: str, removed: bool
+):
+    storage.put_stream(DIGESTS[1], [b"content"])
+    blob_row = SimpleNamespace(encoding=encoding, ref_count=1)
+
+    findings = reconcile(blob_row, dry_run=False, now=time.time() + 1e6)
+
+    assert [f.done for f in findings if f.problem == "orphan"] == [removed]
+    assert storage.exists(DIGESTS[1]) is not removed
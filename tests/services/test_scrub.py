@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.scrub import ScrubCRUD
+from app.storage import LocalStorage
+
+CONTENT = b"content " * 1000
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture()
+def storage(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / "blobs"))
+    monkeypatch.setattr("app.services.scrub.get_storage", lambda: storage)
+    return storage
+
+
+@pytest.fixture()
+def record():
+    with patch.object(ScrubCRUD, "record") as record:
+        yield record
+
+
+def test_intact_blob_is_recorded_as_verified(storage: LocalStorage, record):
+    storage.put_stream(DIGEST + ".gz", [gzip.compress(CONTENT)])
+
+    result = ScrubCRUD(MagicMock(), rate=0).scrub_blob(DIGEST, "gzip")
+
+    assert result.problem is None
+    record.assert_called_once_with(DIGEST, None)
+
+
+@pytest.mark.parametrize(
+    "stored, problem",
+    [(None, "missing"), (CONTENT[:-1], "corrupt"), (b"not gzip", "corrupt")],
+)
+def test_damaged_blob_is_recorded_with_its_problem(
+    storage: LocalStorage, record, stored: bytes, problem: str
+):
+    if stored is not None:
+        storage.put_stream(DIGEST + ".gz", [stored])
+
+    result = ScrubCRUD(MagicMock(), rate=0).scrub_blob(DIGEST, "gzip")
+
+    assert result.problem == problem
+    record.assert_called_once_with(DIGEST, problem)
+
+
+def test_reads_are_throttled_to_the_rate(storage: LocalStorage, record):
+    storage.put_stream(DIGEST, [CONTENT])
+    sleep = MagicMock()
+
+    ScrubCRUD(MagicMock(), rate=100, sleep=sleep).scrub_blob(DIGEST, None)
+
+    # 8000 bytes at 100 bytes per second
+    assert sleep.call_args[0][0] == pytest.approx(80, abs=1)
+
+
+def test_unreadable_blob_is_reported_and_the_pass_goes_on(
+    storage: LocalStorage, record
+):
+    digests = [DIGEST, "b" * 64, hashlib.sha256(b"other").hexdigest()]
+    storage.put_stream(digests[0], [CONTENT])
+    storage.put_stream(digests[2], [b"other"])
+    storage.put_stream(digests[1], [b"unreadable"])
+    get_stream = storage.get_stream
+
+    def failing_get_stream(key):
+        if key == digests[1]:
+            raise IOError("storage unavailable")
+        return get_stream(key)
+
+    blobs = [MagicMock(digest=digest, encoding=None) for digest in digests]
+    scrubber = ScrubCRUD(MagicMock(), rate=0)
+    with patch.object(storage, "get_stream", failing_get_stream), patch.object(
+        ScrubCRUD, "due_blobs", side_effect=[blobs, []]
+    ):
+        results = list(scrubber.scrub())
+
+    assert [result.problem for result in results] == [None, "unreadable", None]
+    assert record.call_count == 3
@@ -0,0 +1,129 @@
+import uuid
+from unittest.mock import patch, Mock, AsyncMock
+
+import pytest
+from fastapi import Depends
+
+from app.api.deps import get_db
+from app.models import File
+from app.schemas import UploadSessionCreate
+from app.services.file import FileCRUD
+from app.services.upload_session import UploadSessionCRUD, UploadSessionService
+from app.utils.app_exceptions import AppException
+from app.utils.service_result import ServiceResult
+
+
+@pytest.fixture()
+def upload_session_service(db):
+    return UploadSessionService(db)
+
+
+@pytest.fixture()
+def session():
+    return Mock(id=uuid.uuid4(), size=100, checksum=None)
+
+
+@pytest.mark.asyncio
+async def test_create_session_too_large_returns_proper_exception(
+    upload_session_service: UploadSessionService, db: get_db = Depends()
+):
+    service_result = await upload_session_service.create_session(
+        UploadSessionCreate(name="name", size=FileCRUD.MAX_FILE_SIZE + 1)
+    )
+
+    assert isinstance(service_result.value, AppException.FileTooLarge)
+
+
+@pytest.mark.asyncio
+async def test_create_session_stages_a_sparse_file_of_the_upload_size(
+    upload_session_service: UploadSessionService,
+    tmp_path,
+    monkeypatch,
+    db: get_db = Depends(),
+):
+    monkeypatch.setattr(UploadSessionCRUD, "PATH_TO_SESSIONS", f"{tmp_path}/")
+
+    service_result = await upload_session_service.create_session(
+        UploadSessionCreate(name="name", size=100)
+    )
+
+    assert service_result.success
+    session = service_result.value
+    assert session.received_bytes == 0
+    assert (tmp_path / str(session.id)).stat().st_size == 100
+
+
+@pytest.mark.asyncio
+@patch("app.services.upload_session.UploadSessionCRUD.get_ranges")
+@patch("app.services.upload_session.UploadSessionCRUD.get_session")
+async def test_complete_session_with_missing_bytes_returns_proper_exception(
+    get_session: Mock,
+    get_ranges: Mock,
+    session: Mock,
+    upload_session_service: UploadSessionService,
+    db: get_db = Depends(),
+):
+    get_session.return_value = session
+    get_ranges.return_value = [(0, 40), (60, 40)]
+
+    service_result = await upload_session_service.complete_session(session.id)
+
+    assert isinstance(service_result.value, AppException.UploadIncomplete)
+
+
+@pytest.mark.asyncio
+@patch("app.services.upload_session.FileService.upload_staged_file")
+@patch(
+    "app.services.upload_session.hash_file",
+    return_value="a" * 64,
+)
+@patch("app.services.upload_session.UploadSessionCRUD.get_ranges")
+@patch("app.services.upload_session.UploadSessionCRUD.get_session")
+async def test_complete_session_checksum_mismatch_doesnt_create_file(
+    get_session: Mock,
+    get_ranges: Mock,
+    hash_file: Mock,
+    upload_staged_file: AsyncMock,
+    session: Mock,
+    upload_session_service: UploadSessionService,
+    db: get_db = Depends(),
+):
+    session.checksum = "b" * 64
+    get_session.return_value = session
+    get_ranges.return_value = [(0, 100)]
+
+    service_result = await upload_session_service.complete_session(session.id)
+
+    assert isinstance(service_result.value, AppException.ChecksumMismatch)
+    upload_staged_file.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("app.services.upload_session.UploadSessionCRUD.delete_session")
+@patch(
+    "app.services.upload_session.FileService.upload_staged_file",
+    return_value=ServiceResult(File()),
+)
+@patch(
+    "app.services.upload_session.hash_file",
+    return_value="a" * 64,
+)
+@patch("app.services.upload_session.UploadSessionCRUD.get_ranges")
+@patch("app.services.upload_session.UploadSessionCRUD.get_session")
+async def test_complete_session_creates_file_through_file_service(
+    get_session: Mock,
+    get_ranges: Mock,
+    hash_file: Mock,
+    upload_staged_file: AsyncMock,
+    delete_session: Mock,
+    session: Mock,
+    upload_session_service: UploadSessionService,
+    db: get_db = Depends(),
+):
+    get_session.return_value = session
+    get_ranges.return_value = [(0, 100)]
+
+    service_result = await upload_session_service.complete_session(session.id)
+
+    assert isinstance(service_result.value, File)
+    delete_session.assert_called_once_with(session)
@@ -0,0 +1,112 @@
+import errno
+import os
+
+import pytest
+
+from app.storage import LocalStorage
+
+
+@pytest.fixture()
+def storage(tmp_path):
+    return LocalStorage(str(tmp_path))
+
+
+def test_objects_are_sharded_by_key_prefix(storage: LocalStorage, tmp_path):
+    storage.put_stream("abcdef", [b"content"])
+
+    assert (tmp_path / "ab" / "cd" / "abcdef").read_bytes() == b"content"
+
+
+def test_put_file_consumes_the_local_file(storage: LocalStorage, tmp_path):
+    staged = tmp_path / "staged"
+    staged.write_bytes(b"content")
+
+    storage.put_file("abcdef", str(staged))
+
+    assert not staged.exists()
+    assert storage.stat("abcdef").size == len(b"content")
+
+
+def test_get_stream_range(storage: LocalStorage):
+    storage.put_stream("abcdef", [b"0123456789"])
+
+    assert b"".join(storage.get_stream("abcdef", 2, 5)) == b"2345"
+
+
+def test_delete_and_stat_missing_object(storage: LocalStorage):
+    storage.put_stream("abcdef", [b"content"])
+
+    storage.delete("abcdef")
+    storage.delete("abcdef")
+
+    assert storage.stat("abcdef") is None
+    assert not storage.exists("abcdef")
+
+
+def test_iter_objects_lists_keys_in_order(storage: LocalStorage):
+    for key in ("cdab", "abcd", "abce", "ab00"):
+        storage.put_stream(key, [key.encode()])
+
+    assert [stored.key for stored in storage.iter_objects()] == [
+        "ab00",
+        "abcd",
+        "abce",
+        "cdab",
+    ]
+
+
+def test_put_file_syncs_the_content_before_renaming_it(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / "blobs"), durability="data")
+    staged = tmp_path / "staged"
+    staged.write_bytes(b"content")
+    synced = []
+    # the content is flushed while it's still under its staging name
+    monkeypatch.setattr(
+        "app.storage.local.fsync_path",
+        lambda path: synced.append((path, os.path.exists(path))),
+    )
+
+    storage.put_file("abcdef", str(staged))
+
+    assert synced == [(str(staged), True)]
+    assert storage.stat("abcdef").size == len(b"content")
+
+
+def test_full_durability_syncs_each_directory_once(tmp_path, monkeypatch):
+    root = str(tmp_path / "blobs")
+    storage = LocalStorage(root, durability="full")
+    synced = []
+    monkeypatch.setattr("app.storage.local.fsync_path", synced.append)
+
+    for key in ("abcdef", "abcd00", "ab0000"):
+        storage.put_stream(key, [b"content"], sync=False)
+    assert synced == []
+
+    storage.sync(["abcdef", "abcd00", "ab0000"])
+
+    assert synced == [
+        os.path.join(root, "ab", "00"),
+        os.path.join(root, "ab", "cd"),
+        os.path.join(root, "ab"),
+        root,
+    ]
+
+
+def test_put_file_copies_across_filesystems(
+    storage: LocalStorage, tmp_path, monkeypatch
+):
+    staged = tmp_path / "staged"
+    staged.write_bytes(b"content")
+    replace = os.replace
+
+    def cross_device_replace(source, destination):
+        if source == str(staged):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        replace(source, destination)
+
+    monkeypatch.setattr("app.storage.local.os.replace", cross_device_replace)
+
+    storage.put_file("abcdef", str(staged))
+
+    assert not staged.exists()
+    assert b"".join(storage.get_stream("abcdef")) == b"content"
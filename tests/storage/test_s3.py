@@ -0,0 +1,58 @@
+import pytest
+
+from app.storage.s3 import S3Storage, S3_MIN_PART_SIZE
+
+
+@pytest.fixture()
+def storage(s3_client):
+    return S3Storage("bucket", client=s3_client, part_size=S3_MIN_PART_SIZE)
+
+
+def test_small_object_is_a_single_put(storage: S3Storage, s3_client):
+    storage.put_stream("key", [b"con", b"tent"])
+
+    assert s3_client.calls == ["put_object"]
+    assert b"".join(storage.get_stream("key")) == b"content"
+
+
+def test_large_object_uses_multipart_upload(storage: S3Storage, s3_client):
+    content = b"x" * (2 * S3_MIN_PART_SIZE + 10)
+
+    storage.put_stream("key", [content[:100], content[100:]])
+
+    assert s3_client.calls.count("upload_part") == 3
+    assert s3_client.objects["key"] == content
+
+
+def test_put_file_consumes_the_local_file(storage: S3Storage, tmp_path):
+    staged = tmp_path / "staged"
+    staged.write_bytes(b"content")
+
+    storage.put_file("key", str(staged))
+
+    assert not staged.exists()
+    assert storage.stat("key").size == len(b"content")
+
+
+def test_get_stream_range(storage: S3Storage):
+    storage.put_stream("key", [b"0123456789"])
+
+    assert b"".join(storage.get_stream("key", 2, 5)) == b"2345"
+
+
+def test_stat_and_delete(storage: S3Storage):
+    storage.put_stream("key", [b"content"])
+    storage.delete("key")
+
+    assert storage.stat("key") is None
+
+
+def test_presigned_url(storage: S3Storage):
+    assert storage.presigned_url("key", 60).endswith("/key?expires=60")
+
+
+def test_iter_objects_follows_the_pages(storage: S3Storage):
+    for key in ("c", "a", "b"):
+        storage.put_stream(key, [b"content"])
+
+    assert [stored.key for stored in storage.iter_objects()] == ["a", "b", "c"]
@@ -0,0 +1,56 @@
+import io
+import tarfile
+import zipfile
+from datetime import datetime
+
+import pytest
+
+from app.utils.archive import ArchiveEntry, iter_tar, iter_zip, safe_name
+
+
+@pytest.fixture()
+def entries():
+    return [
+        ArchiveEntry(
+            "hello.txt", 11, datetime(2022, 2, 22), lambda: iter([b"hello ", b"world"])
+        ),
+        ArchiveEntry("empty", 0, None, lambda: iter([])),
+    ]
+
+
+def test_zip_archive(entries):
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(iter_zip(entries))))
+
+    assert archive.namelist() == ["hello.txt", "empty"]
+    assert archive.read("hello.txt") == b"hello world"
+    assert archive.testzip() is None
+
+
+def test_zip_archive_reads_the_entries_while_streaming():
+    read = []
+
+    def chunks(name: str):
+        read.append(name)
+        return iter([b"content"])
+
+    entries = [
+        ArchiveEntry(name, 7, None, lambda name=name: chunks(name))
+        for name in ("first", "second")
+    ]
+    next(iter_zip(entries))
+
+    assert read == ["first"]
+
+
+def test_tar_archive(entries):
+    content = b"".join(iter_tar(entries))
+    archive = tarfile.open(fileobj=io.BytesIO(content))
+
+    assert archive.getnames() == ["hello.txt", "empty"]
+    assert archive.extractfile("hello.txt").read() == b"hello world"
+    assert len(content) % tarfile.RECORDSIZE == 0
+
+
+def test_safe_name():
+    assert safe_name("../../etc/passwd") == ".._.._etc_passwd"
+    assert safe_name("..") == "_.."
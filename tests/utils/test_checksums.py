@@ -0,0 +1,59 @@
+import base64
+import hashlib
+
+import pytest
+
+from app.utils.app_exceptions import AppException
+from app.utils.checksums import ContentHash, parse_checksums
+
+MD5 = hashlib.md5(b"content").hexdigest()
+SHA256 = hashlib.sha256(b"content").hexdigest()
+
+
+def _base64(hex_digest: str) -> str:
+    return base64.b64encode(bytes.fromhex(hex_digest)).decode()
+
+
+def test_parse_checksums_from_every_header():
+    checksums = parse_checksums(
+        content_md5=_base64(MD5),
+        digest=f"SHA-256={_base64(SHA256)}, unixsum=30637",
+        checksum_sha256=SHA256.upper(),
+    )
+
+    assert checksums == {"md5": MD5, "sha256": SHA256}
+
+
+def test_parse_checksums_base64_sha256_header():
+    assert parse_checksums(checksum_sha256=_base64(SHA256)) == {"sha256": SHA256}
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {"content_md5": "not base64!"},
+        # a sha256 sent as md5
+        {"digest": f"md5={_base64(SHA256)}"},
+        {"content_md5": _base64(MD5), "digest": f"md5={_base64(MD5[::-1])}"},
+    ],
+)
+def test_parse_checksums_rejects_malformed_or_conflicting_values(headers: dict):
+    with pytest.raises(AppException.InvalidChecksum):
+        parse_checksums(**headers)
+
+
+def test_content_hash_feeds_every_algorithm_in_one_pass():
+    content_hash = ContentHash({"md5": MD5})
+    content_hash.update(b"con")
+    content_hash.update(b"tent")
+
+    assert content_hash.hexdigest() == SHA256
+    assert content_hash.verify() == {"md5": MD5, "sha256": SHA256}
+
+
+def test_content_hash_verify_raises_on_mismatch():
+    content_hash = ContentHash({"sha256": SHA256})
+    content_hash.update(b"other content")
+
+    with pytest.raises(AppException.ChecksumMismatch):
+        content_hash.verify()
@@ -0,0 +1,42 @@
+import gzip
+import os
+
+import pytest
+
+from app.utils.compression import (
+    accepts_encoding,
+    compress_file,
+    decompress,
+    is_compressible,
+)
+
+
+@pytest.fixture()
+def text_file(tmp_path) -> str:
+    path = tmp_path / "text"
+    path.write_bytes(b"some text " * 10000)
+    return str(path)
+
+
+def test_compressed_formats_are_skipped(tmp_path):
+    path = tmp_path / "archive.gz"
+    path.write_bytes(gzip.compress(os.urandom(1000)))
+
+    assert not is_compressible(str(path))
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_compress_and_decompress_round_trip(text_file: str, encoding: str):
+    compressed_path = compress_file(text_file, encoding)
+
+    with open(compressed_path, "rb") as compressed:
+        chunks = iter(lambda: compressed.read(1000), b"")
+        content = b"".join(decompress(chunks, encoding))
+    assert content == b"some text " * 10000
+
+
+def test_accepts_encoding():
+    assert accepts_encoding("gzip, deflate, br", "gzip")
+    assert accepts_encoding("*", "zstd")
+    assert not accepts_encoding("gzip;q=0, br", "gzip")
+    assert not accepts_encoding(None, "gzip")
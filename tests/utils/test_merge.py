@@ -0,0 +1,18 @@
+from app.utils.merge import sorted_difference
+
+
+def test_sorted_difference_yields_the_items_only_on_one_side():
+    left = ["a", "b", "d", "f"]
+    right = ["b", "c", "d", "g"]
+
+    assert list(sorted_difference(left, right)) == [
+        ("a", None),
+        (None, "c"),
+        ("f", None),
+        (None, "g"),
+    ]
+
+
+def test_sorted_difference_with_an_empty_side():
+    assert list(sorted_difference([], ["a"])) == [(None, "a")]
+    assert list(sorted_difference([1], [], left_key=str)) == [(1, None)]
@@ -0,0 +1,71 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.main import app
+from app.utils.metrics import (
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_CHECKOUTS,
+    DB_POOL_WAIT_SECONDS,
+    DB_QUERIES,
+    TimedQueuePool,
+    instrument_db,
+    register_db_metrics,
+)
+
+
+@instrument_db
+def crud_call(engine):
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+def test_db_queries_are_labelled_with_the_crud_call():
+    engine = create_engine("sqlite://")
+    register_db_metrics(engine)
+    before = DB_QUERIES.labels(crud_call.__qualname__)._value.get()
+
+    crud_call(engine)
+
+    assert DB_QUERIES.labels(crud_call.__qualname__)._value.get() == before + 1
+
+
+def test_failed_statements_leave_no_start_time_behind():
+    engine = create_engine("sqlite://")
+    register_db_metrics(engine)
+    before = DB_QUERIES.labels("other")._value.get()
+
+    with engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM missing"))
+        connection.execute(text("SELECT 1"))
+
+        assert "query_start" not in connection.info
+    assert DB_QUERIES.labels("other")._value.get() == before + 1
+
+
+def test_pool_checkouts_and_wait_time_are_observed():
+    engine = create_engine("sqlite://", poolclass=TimedQueuePool)
+    register_db_metrics(engine)
+    checkouts = DB_POOL_CHECKOUTS._value.get()
+    waits = DB_POOL_WAIT_SECONDS._sum.get()
+
+    with engine.connect() as connection:
+        checked_out = DB_POOL_CHECKED_OUT._value.get()
+        connection.execute(text("SELECT 1"))
+
+    assert DB_POOL_CHECKOUTS._value.get() == checkouts + 1
+    assert DB_POOL_WAIT_SECONDS._sum.get() > waits
+    assert DB_POOL_CHECKED_OUT._value.get() == checked_out - 1
+
+
+def test_metrics_endpoint_reports_route_templates():
+    with TestClient(app) as client:
+        client.get("/metrics")
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert 'route="/metrics"' in response.text
+    assert "metadata_cache_lookups_total" in response.text
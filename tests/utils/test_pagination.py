@@ -0,0 +1,19 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app.utils.app_exceptions import AppException
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    uploaded_on = datetime(2022, 2, 22, 10, 0, tzinfo=timezone.utc)
+    uri = uuid.uuid4()
+
+    assert decode_cursor(encode_cursor(uploaded_on, uri)) == (uploaded_on, uri)
+
+
+def test_invalid_cursor():
+    with pytest.raises(AppException.InvalidCursor):
+        decode_cursor("not a cursor")
@@ -0,0 +1,61 @@
+import pytest
+
+from app.utils.ranges import (
+    etag_matches,
+    missing_ranges,
+    parse_content_range,
+    parse_range,
+)
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 0-1023/4096") == (0, 1023, 4096)
+
+
+def test_parse_content_range_unknown_total():
+    assert parse_content_range("bytes 10-19/*") == (10, 19, None)
+
+
+def test_parse_content_range_malformed_returns_none():
+    assert parse_content_range("bytes 20-10/100") is None
+    assert parse_content_range("items 0-10/100") is None
+    assert parse_content_range("") is None
+
+
+def test_missing_ranges_out_of_order_and_overlapping():
+    received = [(60, 40), (0, 20), (10, 20)]
+
+    assert missing_ranges(100, received) == [(30, 30)]
+
+
+def test_missing_ranges_nothing_received():
+    assert missing_ranges(100, []) == [(0, 100)]
+
+
+def test_missing_ranges_complete():
+    assert missing_ranges(100, [(0, 50), (50, 50)]) == []
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-5", 100) == (95, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+
+
+def test_parse_range_malformed_or_multiple_serves_whole_file():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=a-b", 100) is None
+    assert parse_range("bytes=0-1,5-6", 100) is None
+
+
+def test_parse_range_not_satisfiable():
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+
+def test_etag_matches():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches('"a"', None)
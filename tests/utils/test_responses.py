@@ -0,0 +1,116 @@
+import asyncio
+import gzip
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.schemas import FileDownload
+from app.storage import LocalStorage
+from app.utils.app_exceptions import AppException, app_exception_handler
+from app.utils.responses import file_download_response
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(settings, "STORAGE_LOCAL_ROOT", str(tmp_path))
+    monkeypatch.setattr("app.utils.responses.get_storage", lambda: storage)
+    return storage
+
+
+@pytest.fixture
+def download() -> FileDownload:
+    return FileDownload(key="abcdef", legacy=False, size=10, etag='"abcdef"')
+
+
+def test_x_accel_redirect_points_to_the_internal_location(
+    storage, download, monkeypatch
+):
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "x-accel-redirect")
+
+    response = file_download_response(download)
+
+    assert response.headers["X-Accel-Redirect"] == "/protected/ab/cd/abcdef"
+    assert response.headers["ETag"] == '"abcdef"'
+    assert not response.body
+
+
+def test_signed_url_redirects_to_the_static_server(storage, download, monkeypatch):
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "signed-url")
+    monkeypatch.setattr(settings, "DOWNLOAD_SIGNING_KEY", "key")
+
+    response = file_download_response(download)
+
+    assert response.status_code == 307
+    assert response.headers["Location"].startswith("/blobs/ab/cd/abcdef?expires=")
+
+
+def test_signed_url_is_served_once_its_signature_is_checked(
+    storage, download, monkeypatch
+):
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "signed-url")
+    monkeypatch.setattr(settings, "DOWNLOAD_SIGNING_KEY", "key")
+    monkeypatch.setattr("app.services.file.get_storage", lambda: storage)
+    storage.put_stream(download.key, iter([b"0123456789"]))
+    url = file_download_response(download).headers["Location"]
+
+    with TestClient(app) as client:
+        response = client.get(url)
+        partial = client.get(url, headers={"Range": "bytes=2-5"})
+        tampered = client.get(url.replace("expires=", "expires=1"))
+
+    assert response.status_code == 200
+    assert response.content == b"0123456789"
+    assert response.headers["ETag"] == '"abcdef"'
+    assert partial.status_code == 206
+    assert partial.content == b"2345"
+    assert tampered.status_code == 403
+
+
+def test_signed_url_without_key_is_served_by_the_app(storage, download, monkeypatch):
+    monkeypatch.setattr(settings, "DOWNLOAD_OFFLOAD", "signed-url")
+    monkeypatch.setattr(settings, "DOWNLOAD_SIGNING_KEY", None)
+    storage.put_stream(download.key, iter([b"x" * 10]))
+
+    response = file_download_response(download)
+
+    assert response.status_code == 200
+    assert "X-Accel-Redirect" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_compressed_blob_is_decoded_for_clients_without_the_encoding(storage):
+    storage.put_stream("abcdef.gz", iter([gzip.compress(b"0123456789")]))
+    download = FileDownload(
+        key="abcdef.gz", size=10, encoding="gzip", start=2, end=5, partial=True
+    )
+
+    response = file_download_response(download)
+
+    assert response.status_code == 206
+    assert b"".join([chunk async for chunk in response.body_iterator]) == b"2345"
+    assert "Content-Encoding" not in response.headers
+
+
+def test_compressed_blob_passthrough(storage):
+    storage.put_stream("abcdef.gz", iter([gzip.compress(b"0123456789")]))
+    download = FileDownload(
+        key="abcdef.gz", size=10, encoding="gzip", stored_size=30, passthrough=True
+    )
+
+    response = file_download_response(download)
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Content-Length"] == "30"
+
+
+def test_unsatisfiable_range_response_sends_the_file_size():
+    response = asyncio.run(
+        app_exception_handler(MagicMock(), AppException.RangeNotSatisfiable(10))
+    )
+
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */10"
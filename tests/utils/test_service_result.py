@@ -0,0 +1,32 @@
+import pytest
+from loguru import logger
+
+from app.core.config import settings
+from app.utils.app_exceptions import AppException
+from app.utils.service_result import ServiceResult, handle_result
+
+
+@pytest.fixture()
+def records():
+    records = []
+    handler_id = logger.add(lambda message: records.append(message.record))
+    yield records
+    logger.remove(handler_id)
+
+
+def test_handle_result_logs_the_caller(records):
+    with pytest.raises(AppException.FileNotFound):
+        handle_result(ServiceResult(AppException.FileNotFound()))
+
+    assert "test_handle_result_logs_the_caller" in records[0]["message"]
+    assert records[0]["extra"]["exception_case"] == "FileNotFound"
+    assert records[0]["extra"]["status_code"] == 404
+
+
+def test_sampled_out_client_errors_are_not_logged(records, monkeypatch):
+    monkeypatch.setattr(settings, "ERROR_LOG_SAMPLE_RATE", 0)
+
+    with pytest.raises(AppException.FileNotFound):
+        handle_result(ServiceResult(AppException.FileNotFound()))
+
+    assert not records
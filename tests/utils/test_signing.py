@@ -0,0 +1,23 @@
+from app.utils.signing import sign_url, verify_signature
+
+
+def _parse(url: str):
+    path, query = url.split("?")
+    params = dict(param.split("=") for param in query.split("&"))
+    return path, int(params["expires"]), params["signature"]
+
+
+def test_signed_url_verifies_until_it_expires():
+    path, expires, signature = _parse(sign_url("/blobs/ab/cd/abcd", "key", 60, 1000))
+
+    assert path == "/blobs/ab/cd/abcd"
+    assert verify_signature(path, expires, signature, "key", now=1059)
+    assert not verify_signature(path, expires, signature, "key", now=1061)
+
+
+def test_tampered_signed_url_is_rejected():
+    path, expires, signature = _parse(sign_url("/blobs/ab/cd/abcd", "key", 60, 1000))
+
+    assert not verify_signature("/blobs/ab/cd/other", expires, signature, "key", 1000)
+    assert not verify_signature(path, expires + 60, signature, "key", 1000)
+    assert not verify_signature(path, expires, signature, "other key", 1000)
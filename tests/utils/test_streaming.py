@@ -0,0 +1,68 @@
+import hashlib
+import io
+from unittest.mock import Mock
+
+import pytest
+
+from app.core.config import settings
+from app.utils.app_exceptions import AppException
+from app.utils.streaming import (
+    adaptive_buffer_size,
+    copy_to_disk,
+    slice_chunks,
+    BufferedWriter,
+)
+
+
+def test_adaptive_buffer_size_is_clamped():
+    assert adaptive_buffer_size(None) == settings.UPLOAD_MIN_BUFFER_SIZE
+    assert adaptive_buffer_size(1) == settings.UPLOAD_MIN_BUFFER_SIZE
+    assert adaptive_buffer_size(1024 ** 4) == settings.UPLOAD_MAX_BUFFER_SIZE
+
+
+def test_copy_to_disk_writes_and_hashes_in_one_pass(tmp_path):
+    content = b"x" * (3 * 1024 * 1024 + 7)
+    file_hash = hashlib.sha256()
+
+    written = copy_to_disk(
+        io.BytesIO(content), tmp_path / "out", file_hash, len(content)
+    )
+
+    assert written == len(content)
+    assert (tmp_path / "out").read_bytes() == content
+    assert file_hash.hexdigest() == hashlib.sha256(content).hexdigest()
+
+
+def test_copy_to_disk_too_large_file(tmp_path):
+    with pytest.raises(AppException.FileTooLarge):
+        copy_to_disk(io.BytesIO(b"x" * 11), tmp_path / "out", hashlib.sha256(), 10)
+
+
+@pytest.mark.asyncio
+async def test_buffered_writer_coalesces_small_chunks():
+    out_file = Mock()
+    writer = BufferedWriter(out_file, buffer_size=1024)
+
+    for _ in range(100):
+        await writer.write(b"x" * 100)
+    await writer.flush()
+
+    assert writer.size == 100 * 100
+    # 9 coalesced flushes plus the tail
+    assert out_file.write.call_count == 10
+
+
+@pytest.mark.asyncio
+async def test_buffered_writer_enforces_max_size():
+    writer = BufferedWriter(Mock(), max_size=10, buffer_size=1024)
+
+    with pytest.raises(AppException.FileTooLarge):
+        await writer.write(b"x" * 11)
+
+
+def test_slice_chunks():
+    chunks = [b"0123", b"4567", b"89"]
+
+    assert b"".join(slice_chunks(chunks, 3, 8)) == b"345678"
+    assert b"".join(slice_chunks(chunks, 6)) == b"6789"
+    assert b"".join(slice_chunks(chunks, 0, 0)) == b"0"